@@ -0,0 +1,191 @@
+"""Колоночный движок аналитики в памяти (опционально, NumPy).
+
+Дневные суммы мер свода (daily_ledger_rollup — тот же источник, что у SQL-пути get_finance_summary)
+хранятся массивами, отсортированными по дате, с накопленными суммами по каждой мере. Загрузка — одна
+выборка, сгруппированная по дню в SQLite (день — целым номером от 1970-01-01); массивы строятся из неё
+целиком (np.fromiter), без разбора строк в Python — стоимость зависит от числа дней, а не операций.
+Сумма за любой диапазон — два searchsorted и разность накопленных сумм; группировка по day/month/year —
+те же операции над массивом границ периодов.
+
+Включается настройкой ANALYTICS_ENGINE=true (нужен numpy). Снимок загружается при первом запросе
+и привязан к версии данных: версии кэша отчётов (result_cache, коммиты процесса и mark_finance_change)
+и PRAGMA data_version отдельного подключения к файлу БД (коммиты любых подключений и процессов —
+rebuild_aggregates.py, backfill_money_journal.py, правки в обход приложения). Версия читается до выборки:
+коммит, попавший в выборку, но завершившийся позже, сдвигает версию, и снимок перечитывается.
+Если движок выключен, numpy не установлен или заданы фильтры — get_finance_summary идёт в SQL.
+"""
+import sqlite3
+import threading
+from datetime import date
+from itertools import chain
+from typing import Literal, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import get_settings
+from backend.database import get_db_path
+from backend.ledger_rollup import MEASURES
+from backend.result_cache import finance_cache, subscribe_invalidation
+
+try:
+    import numpy as np
+except ImportError:  # движок необязателен
+    np = None
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_JULIAN = 2440587.5  # julianday('1970-01-01')
+
+# Дневные суммы мер свода: номер дня от _EPOCH и меры в порядке MEASURES, по возрастанию дня
+DAILY_SUMS_SQL = f"""
+    SELECT CAST(julianday(day) - {_EPOCH_JULIAN} AS INTEGER), {", ".join(f"TOTAL({m})" for m in MEASURES)}
+    FROM daily_ledger_rollup
+    GROUP BY day
+    ORDER BY day
+"""
+
+
+def _day_number(d: date) -> int:
+    return (d - _EPOCH).days
+
+
+class LedgerColumns:
+    """Отсортированные по дню суммы мер: days[n], values[n, len(MEASURES)], cum[n + 1, len(MEASURES)]."""
+
+    def __init__(self, days, values):
+        order = np.argsort(days, kind="stable")
+        self.days = days[order]
+        self.values = values[order]
+        self.cum = self._prefix(self.values)
+
+    @staticmethod
+    def _prefix(values):
+        cum = np.zeros((len(values) + 1, len(MEASURES)))
+        np.cumsum(values, axis=0, out=cum[1:])
+        return cum
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def range_sums(self, boundaries):
+        """Суммы мер по полуинтервалам [boundaries[i], boundaries[i + 1]) (номера дней)."""
+        idx = np.searchsorted(self.days, boundaries, side="left")
+        return np.diff(self.cum[idx], axis=0)
+
+
+def _period_boundaries(date_from: date, date_to: date, group_by: Literal["day", "month", "year"]):
+    """Ключи периодов и границы [начало_i, начало_{i+1}) в номерах дней; первая граница — date_from."""
+    unit = {"day": "D", "month": "M", "year": "Y"}[group_by]
+    starts = np.arange(
+        np.datetime64(date_from, unit),
+        np.datetime64(date_to, unit) + 1,
+    )
+    keys = np.datetime_as_string(starts, unit=unit)
+    bounds = starts.astype("datetime64[D]").astype(np.int64)
+    bounds[0] = _day_number(date_from)
+    bounds = np.append(bounds, _day_number(date_to) + 1)
+    return keys, bounds
+
+
+class AnalyticsEngine:
+    def __init__(self):
+        self.columns: Optional[LedgerColumns] = None
+        self._version: Optional[tuple] = None  # Версия данных, на которой загружен снимок
+        self._probe: Optional[sqlite3.Connection] = None  # Только для PRAGMA data_version
+        self.loads = 0  # Число загрузок снимка (для статистики и тестов)
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return np is not None and get_settings().analytics_engine
+
+    def reset(self) -> None:
+        """Сбросить снимок (и подключение проверки версии — например, после замены файла БД)."""
+        with self._lock:
+            self.columns = None
+            self._version = None
+            if self._probe is not None:
+                self._probe.close()
+                self._probe = None
+
+    def _file_data_version(self) -> Optional[int]:
+        """PRAGMA data_version: меняется после коммита любого другого подключения к файлу БД."""
+        path = get_db_path()
+        if path is None:
+            return None
+        with self._lock:
+            try:
+                if self._probe is None:
+                    self._probe = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+                return self._probe.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                return None
+
+    def data_version(self) -> tuple:
+        return finance_cache.version, self._file_data_version()
+
+    async def ensure_loaded(self, db: AsyncSession) -> LedgerColumns:
+        version = self.data_version()
+        with self._lock:
+            if self.columns is not None and self._version == version:
+                return self.columns
+            self.columns = None
+        rows = (await db.execute(text(DAILY_SUMS_SQL))).all()
+        width = len(MEASURES) + 1
+        data = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=len(rows) * width).reshape(-1, width)
+        columns = LedgerColumns(data[:, 0].astype(np.int64), data[:, 1:])
+        with self._lock:
+            self.columns, self._version = columns, version
+            self.loads += 1
+        return columns
+
+    async def summary(
+        self,
+        db: AsyncSession,
+        date_from: date,
+        date_to: date,
+        group_by: Literal["day", "month", "year"],
+        mode: Literal["accrual", "cash", "both"],
+    ) -> dict:
+        """Тот же ответ, что get_finance_summary без фильтров."""
+        columns = await self.ensure_loaded(db)
+        keys, bounds = _period_boundaries(date_from, date_to, group_by)
+        sums = columns.range_sums(bounds)
+        # Порядок столбцов — MEASURES: revenue_accrual, revenue_cash, expense_accrual, expense_cash, taxes_cash
+        if mode == "accrual":
+            sums[:, [1, 3, 4]] = 0
+        elif mode == "cash":
+            sums[:, [0, 2]] = 0
+        ra, rc, ea, ec, tc = sums.T
+        npa = ra - ea
+        npc = rc - ec
+        series = [
+            {
+                "period": str(k),
+                "revenue_accrual": float(a),
+                "revenue_cash": float(b),
+                "expense_accrual": float(c),
+                "expense_cash": float(d),
+                "taxes_cash": float(e),
+                "net_profit_accrual": float(f),
+                "net_profit_cash": float(g),
+            }
+            for k, a, b, c, d, e, f, g in zip(
+                keys, ra.tolist(), rc.tolist(), ea.tolist(), ec.tolist(), tc.tolist(), npa.tolist(), npc.tolist()
+            )
+        ]
+        totals = dict(zip(MEASURES, sums.sum(axis=0).tolist()))
+        totals["net_profit_accrual"] = totals["revenue_accrual"] - totals["expense_accrual"]
+        totals["net_profit_cash"] = totals["revenue_cash"] - totals["expense_cash"]
+        return {
+            "range": {"from": date_from.isoformat(), "to": date_to.isoformat()},
+            "group_by": group_by,
+            "mode": mode,
+            "series": series,
+            "totals": totals,
+        }
+
+
+analytics_engine = AnalyticsEngine()
+
+subscribe_invalidation(analytics_engine.reset)
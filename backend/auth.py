@@ -9,7 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from backend.config import get_settings
-from backend.database import get_db
+from backend.database import get_read_db
 from backend.models import User, UserRole
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
@@ -36,9 +36,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 async def get_current_user(
     token: Optional[str] = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> Optional[User]:
-    """Получить текущего пользователя по токену."""
+    """Получить текущего пользователя по токену (read-only сессия: объект не изменять)."""
     if not token:
         return None
     credentials_exception = HTTPException(
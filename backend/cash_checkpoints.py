@@ -0,0 +1,121 @@
+"""Месячные контрольные точки остатка денежных средств.
+
+Строка на каждый завершённый месяц: поток за месяц и накопленный поток с начала учёта
+(по журналу движения денег money_journal: поступления − выплаты). Остаток на любую дату =
+opening_cash_balance + накопленный поток последней точки до этой даты + сумма дней текущего месяца.
+
+Запись задним числом (денежная операция в месяце, по которому уже есть точка) удаляет
+точки с этого месяца; refresh_cash_checkpoints достраивает недостающие до прошлого месяца.
+Оба шага выполняются после записи строк журнала (money_journal, after_flush), в той же транзакции.
+"""
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _prev_month_start(d: date) -> date:
+    return date(d.year - 1, 12, 1) if d.month == 1 else date(d.year, d.month - 1, 1)
+
+
+def _next_month_start(d: date) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def _as_date(v) -> Optional[date]:
+    if v is None or isinstance(v, date):
+        return v
+    return date.fromisoformat(str(v)[:10])
+
+
+REFRESH_SQL = text("""
+    INSERT INTO cash_balance_checkpoints (month_start, inflow, outflow, cumulative_net)
+    WITH RECURSIVE months(m) AS (
+        SELECT :start
+        UNION ALL
+        SELECT date(m, '+1 month') FROM months WHERE m < :end
+    ),
+    flows AS (
+        SELECT entry_month AS ym,
+               SUM(CASE WHEN direction = 'in' THEN amount ELSE 0 END) AS inflow,
+               -SUM(CASE WHEN direction = 'out' THEN amount ELSE 0 END) AS outflow
+        FROM money_journal
+        WHERE entry_date >= :start AND entry_date < :until
+        GROUP BY entry_month
+    )
+    SELECT months.m, COALESCE(flows.inflow, 0), COALESCE(flows.outflow, 0),
+           :base + SUM(COALESCE(flows.inflow, 0) - COALESCE(flows.outflow, 0)) OVER (ORDER BY months.m)
+    FROM months LEFT JOIN flows ON flows.ym = CAST(strftime('%Y%m', months.m) AS INTEGER)
+""")
+
+
+def invalidate_cash_checkpoints(conn: Connection, day: date) -> None:
+    """Удалить точки, начиная с месяца day (денежная операция задним числом)."""
+    conn.execute(
+        text("DELETE FROM cash_balance_checkpoints WHERE month_start >= :m"),
+        {"m": month_start(day).isoformat()},
+    )
+
+
+def refresh_cash_checkpoints(conn: Connection, today: Optional[date] = None) -> int:
+    """Достроить точки от последней существующей до прошлого месяца включительно. Возвращает число новых."""
+    end = _prev_month_start(month_start(today or date.today()))
+    last = conn.execute(text(
+        "SELECT month_start, cumulative_net FROM cash_balance_checkpoints ORDER BY month_start DESC LIMIT 1"
+    )).first()
+    if last is not None:
+        start = _next_month_start(_as_date(last.month_start))
+        base = float(last.cumulative_net)
+    else:
+        first_day = _as_date(conn.execute(text(
+            "SELECT MIN(entry_date) FROM money_journal"
+        )).scalar())
+        if first_day is None:
+            return 0
+        start = month_start(first_day)
+        base = 0.0
+    if start > end:
+        return 0
+    r = conn.execute(REFRESH_SQL, {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "until": _next_month_start(end).isoformat(),
+        "base": base,
+    })
+    return r.rowcount
+
+
+def rebuild_cash_checkpoints_sync(conn: Connection) -> int:
+    conn.execute(text("DELETE FROM cash_balance_checkpoints"))
+    return refresh_cash_checkpoints(conn)
+
+
+async def rebuild_cash_checkpoints(db: AsyncSession) -> int:
+    """Пересчитать все точки с нуля (после сверки журнала)."""
+    return await db.run_sync(lambda session: rebuild_cash_checkpoints_sync(session.connection()))
+
+
+async def get_cumulative_cash_flow(db: AsyncSession, as_of: date) -> float:
+    """Накопленный денежный поток до начала дня as_of: одна точка + дни после неё."""
+    r = await db.execute(
+        text(
+            "SELECT month_start, cumulative_net FROM cash_balance_checkpoints "
+            "WHERE month_start < :m ORDER BY month_start DESC LIMIT 1"
+        ),
+        {"m": month_start(as_of).isoformat()},
+    )
+    cp = r.first()
+    base = float(cp.cumulative_net) if cp else 0.0
+    params = {"to": as_of.isoformat()}
+    sql = "SELECT COALESCE(SUM(amount), 0) FROM money_journal WHERE entry_date < :to"
+    if cp:
+        sql += " AND entry_date >= :from"
+        params["from"] = _next_month_start(_as_date(cp.month_start)).isoformat()
+    r = await db.execute(text(sql), params)
+    return base + float(r.scalar() or 0)
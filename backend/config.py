@@ -8,6 +8,19 @@ class Settings(BaseSettings):
     app_name: str = "ProspEl"
     debug: bool = False
     database_url: str = "sqlite+aiosqlite:///./prospel.db"
+    # Профиль БД: default | production (SQLite: WAL, пул читателей mode=ro, один писатель)
+    db_profile: str = "default"
+    db_read_pool_size: int = 5
+    db_write_queue_timeout: float = 30.0  # сек ожидания очереди к писателю
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_cache_size_kib: int = 64_000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    # Кэш финансовых отчётов (result_cache)
+    finance_cache_max_bytes: int = 32 * 1024 * 1024
+    finance_cache_max_entries: int = 2000
+    # Колоночный движок аналитики в памяти (analytics_engine, нужен numpy)
+    analytics_engine: bool = False
     secret_key: str = "change-this-in-production-use-secure-random-string"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 60 * 24  # 24 часа
@@ -16,6 +29,19 @@ class Settings(BaseSettings):
     income_limit_pausal: int = 6_000_000  # Порог выхода из паушального режима
     income_limit_vat: int = 8_000_000     # Порог регистрации НДС
     limit_warning_percent: float = 0.8     # 80% - предупреждение
+    forecast_default_days_to_pay: int = 30  # Прогноз: срок оплаты, если нет истории оплат
+    # Прогноз превышения лимитов (limit_forecast, Монте-Карло): путей по умолчанию, дней истории для бутстрапа
+    limit_forecast_paths: int = 2000
+    limit_forecast_history_days: int = 365
+    # IPS QR на сервере (ips_qr): каталог файлового кэша изображений, записей LRU в памяти; TTF-шрифт PDF (пусто — DejaVuSans)
+    ips_qr_cache_dir: str = "./ips_qr_cache"
+    ips_qr_cache_entries: int = 512
+    pdf_font_path: str = ""
+    # Фоновый планировщик (scheduler): такт, аренда блокировки экземпляра, период пересчёта агрегатов
+    scheduler_enabled: bool = True
+    scheduler_tick_seconds: int = 60
+    scheduler_lock_ttl_seconds: int = 300
+    scheduler_aggregates_minutes: int = 60
 
     class Config:
         env_file = ".env"
@@ -1,6 +1,7 @@
 """Подключение к базе данных и сессии."""
 from pathlib import Path
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
@@ -8,10 +9,74 @@ from backend.config import get_settings
 
 
 settings = get_settings()
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.debug,
-)
+
+
+def _sqlite_file_path(url: str) -> Path | None:
+    """Путь к файлу SQLite из URL (None для не-SQLite и :memory:)."""
+    if not url.startswith("sqlite"):
+        return None
+    path = url.replace("sqlite+aiosqlite:///", "").replace("sqlite:///", "")
+    if not path or path.startswith(":memory:") or path.startswith("file:"):
+        return None
+    return Path(path).resolve()
+
+
+def _read_only_url(db_path: Path) -> str:
+    """URL read-only подключения (mode=ro) к тому же файлу SQLite."""
+    return f"sqlite+aiosqlite:///file:{db_path.as_posix()}?mode=ro&uri=true"
+
+
+def _sqlite_pragmas(dbapi_connection, read_only: bool) -> None:
+    """Прагмы production-профиля, применяются при каждом новом подключении."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA cache_size = -{int(settings.sqlite_cache_size_kib)}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size)}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        else:
+            # WAL: читатели не блокируются писателем и наоборот
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute(f"PRAGMA synchronous = {settings.sqlite_synchronous}")
+    finally:
+        cursor.close()
+
+
+_db_file = _sqlite_file_path(settings.database_url)
+is_production_sqlite = settings.db_profile == "production" and _db_file is not None
+
+if is_production_sqlite:
+    # Один писатель: все мутации встают в очередь на единственное подключение
+    engine = create_async_engine(
+        settings.database_url,
+        echo=settings.debug,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.db_write_queue_timeout,
+    )
+    # Пул читателей (mode=ro) для GET-запросов
+    read_engine = create_async_engine(
+        _read_only_url(_db_file),
+        echo=settings.debug,
+        pool_size=settings.db_read_pool_size,
+        max_overflow=settings.db_read_pool_size,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_writer_connect(dbapi_connection, connection_record):
+        _sqlite_pragmas(dbapi_connection, read_only=False)
+
+    @event.listens_for(read_engine.sync_engine, "connect")
+    def _on_reader_connect(dbapi_connection, connection_record):
+        _sqlite_pragmas(dbapi_connection, read_only=True)
+else:
+    engine = create_async_engine(
+        settings.database_url,
+        echo=settings.debug,
+    )
+    read_engine = engine
 
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -21,6 +86,14 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
 
 class Base(DeclarativeBase):
     """Базовый класс для моделей."""
@@ -40,11 +113,23 @@ async def get_db():
             await session.close()
 
 
+async def get_read_db():
+    """Dependency для read-only сессии (GET-запросы). Никогда не коммитит."""
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.rollback()
+            await session.close()
+
+
 async def init_db():
     """Инициализация таблиц БД (создание по моделям)."""
     import backend.models  # noqa: F401 — регистрируем модели в Base.metadata
+    from backend.migrations import run_migrations
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
 
 
 def get_db_path() -> Path | None:
@@ -59,6 +144,9 @@ def get_db_path() -> Path | None:
 async def reset_db():
     """Удалить БД и создать пустую. Вызвать до создания сессий."""
     db_path = get_db_path()
-    if db_path and db_path.exists():
-        db_path.unlink()
+    if db_path:
+        # WAL-режим оставляет рядом файлы -wal и -shm
+        for p in (db_path, db_path.with_name(db_path.name + "-wal"), db_path.with_name(db_path.name + "-shm")):
+            if p.exists():
+                p.unlink()
     await init_db()
@@ -1,11 +1,17 @@
 """Финансовый сервис: метрики accrual vs cash."""
+import re
 from datetime import date, timedelta
 from typing import Literal, Optional, Any
-from sqlalchemy import select, func, and_
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, func, and_, or_, case, cast, literal, union_all, Integer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from backend.models import Income, Expense, Enterprise, Project, CashTransaction
+from backend.analytics_engine import analytics_engine
+from backend.cash_checkpoints import get_cumulative_cash_flow
+from backend.period_closing import ledger_source
+from backend.period_keys import period_group_key, period_key_bounds, period_label
+from backend.models import Income, Client, Enterprise, Project, DailyLedgerRollup, MoneyJournalEntry
 
 
 def _period_key(d: date, group_by: Literal["day", "month", "year"]) -> str:
@@ -42,6 +48,92 @@ def _iter_periods(
             y += 1
 
 
+def _rollup_filter_conditions(filters: dict[str, Any], R=DailyLedgerRollup):
+    """Условия для мер доходов (client/contract/project), расходов (category/is_tax_related) и налогов (category).
+    R — таблица свода или колонки подзапроса ledger_source (.c)."""
+    income_conds = []
+    if filters.get("client_id") is not None:
+        income_conds.append(R.client_id == filters["client_id"])
+    if filters.get("contract_id") is not None:
+        income_conds.append(R.contract_id == filters["contract_id"])
+    if filters.get("project_id") is not None:
+        income_conds.append(R.project_id == filters["project_id"])
+    tax_conds = []
+    if filters.get("category") is not None:
+        tax_conds.append(R.category == filters["category"])
+    expense_conds = list(tax_conds)
+    if filters.get("is_tax_related") is not None:
+        expense_conds.append(R.is_tax_related == bool(filters["is_tax_related"]))
+    return income_conds, expense_conds, tax_conds
+
+
+def _filtered_sum(column, conds: list):
+    """SUM(column) только по строкам, удовлетворяющим conds (одна выборка для всех мер)."""
+    if not conds:
+        return func.coalesce(func.sum(column), 0)
+    return func.coalesce(func.sum(case((and_(*conds), column), else_=0)), 0)
+
+
+SERIES_FIELDS = (
+    "revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash",
+    "net_profit_accrual", "net_profit_cash",
+)
+
+# Сравнение периодов: compare_to = previous_period | previous_year | смещение назад "<N>d|w|m|y"
+COMPARE_PRESETS = ("previous_period", "previous_year")
+_COMPARE_UNITS = {"d": "days", "w": "weeks", "m": "months", "y": "years"}
+
+
+def parse_compare_to(compare_to: str, date_from: date, date_to: date) -> relativedelta:
+    """
+    Смещение базового периода назад. previous_period — диапазон той же длины сразу перед текущим
+    (целые месяцы — на столько же месяцев, иначе на столько же дней). ValueError — неверное значение.
+    """
+    if compare_to == "previous_year":
+        return relativedelta(years=1)
+    if compare_to == "previous_period":
+        if date_from.day == 1 and (date_to + timedelta(days=1)).day == 1:
+            months = (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+            return relativedelta(months=months)
+        return relativedelta(days=(date_to - date_from).days + 1)
+    m = re.fullmatch(r"(\d+)([dwmy])", compare_to.strip().lower())
+    if not m or int(m.group(1)) == 0:
+        raise ValueError(compare_to)
+    return relativedelta(**{_COMPARE_UNITS[m.group(2)]: int(m.group(1))})
+
+
+def _period_start(key: str, group_by: Literal["day", "month", "year"]) -> date:
+    if group_by == "day":
+        return date.fromisoformat(key)
+    if group_by == "month":
+        return date(int(key[:4]), int(key[5:7]), 1)
+    return date(int(key), 1, 1)
+
+
+async def _comparison_source(
+    db: AsyncSession, date_from: date, date_to: date, offset: relativedelta, use_snapshots: bool = True
+):
+    """
+    Один подзапрос для текущего и базового диапазонов: колонки ledger_source + side ('current' | 'baseline').
+    Каждая строка свода читается один раз на диапазон, в который попадает.
+    """
+    current = await ledger_source(db, date_from, date_to, use_snapshots, name="ledger_current")
+    baseline = await ledger_source(db, date_from - offset, date_to - offset, use_snapshots, name="ledger_baseline")
+    return union_all(
+        select(literal("current").label("side"), *current.c),
+        select(literal("baseline").label("side"), *baseline.c),
+    ).subquery("ledger")
+
+
+def _delta(current: dict, baseline: dict) -> dict:
+    return {k: current[k] - baseline[k] for k in current}
+
+
+def _delta_percent(current: dict, baseline: dict) -> dict:
+    """Изменение в % к базе (None при нулевой базе)."""
+    return {k: round((current[k] - baseline[k]) / abs(baseline[k]) * 100, 1) if baseline[k] else None for k in current}
+
+
 async def get_finance_summary(
     db: AsyncSession,
     date_from: date,
@@ -49,269 +141,349 @@ async def get_finance_summary(
     group_by: Literal["day", "month", "year"],
     mode: Literal["accrual", "cash", "both"],
     filters: Optional[dict[str, Any]] = None,
+    compare_to: Optional[str] = None,
 ) -> dict:
     """
     Агрегатор метрик для accrual/cash.
     filters: client_id, contract_id, project_id (income), category, is_tax_related (expenses)
+    Читает предагрегированный daily_ledger_rollup: стоимость зависит от числа дней/периодов, а не операций.
+    Без фильтров и при включённом колоночном движке (ANALYTICS_ENGINE) ответ строится в памяти.
+    compare_to (см. parse_compare_to) — тем же запросом читается базовый диапазон; в строках ряда
+    baseline_period, baseline и delta, в ответе comparison (диапазон, итоги базы, delta, delta_percent).
     """
     filters = filters or {}
-    client_id = filters.get("client_id")
-    contract_id = filters.get("contract_id")
-    project_id = filters.get("project_id")
-    category = filters.get("category")
-    is_tax_related = filters.get("is_tax_related")
-
-    # SQLite: date column в income называется "date" (issued_date в модели)
-    income_date_col = Income.issued_date
-    income_paid_col = Income.paid_date
-    income_amount = Income.amount_rsd
-    income_status = Income.status
-
-    expense_date_col = Expense.date
-    expense_paid_col = Expense.paid_date
-    expense_amount = Expense.amount
-    expense_status = Expense.status
-    expense_is_tax = Expense.is_tax_related
-
-    # Базовые условия для income
-    income_base = and_(
-        income_status != "cancelled",
-        income_date_col >= date_from,
-        income_date_col <= date_to,
-    )
-    if client_id is not None:
-        income_base = and_(income_base, Income.client_id == client_id)
-    if contract_id is not None:
-        income_base = and_(income_base, Income.contract_id == contract_id)
-    if project_id is not None:
-        income_base = and_(income_base, Income.project_id == project_id)
-
-    # Базовые условия для expenses (accrual: date in period, status != reversed)
-    expense_accrual_base = and_(
-        expense_status != "reversed",
-        expense_date_col >= date_from,
-        expense_date_col <= date_to,
-    )
-    if category is not None:
-        expense_accrual_base = and_(expense_accrual_base, Expense.category == category)
-    if is_tax_related is not None:
-        expense_accrual_base = and_(
-            expense_accrual_base,
-            expense_is_tax == (1 if is_tax_related else 0),
-        )
-
-    # Cash: paid_date in period, status == paid (и не reversed — paid уже подразумевает не reversed)
-    income_cash_base = and_(
-        income_status == "paid",
-        income_paid_col.isnot(None),
-        income_paid_col >= date_from,
-        income_paid_col <= date_to,
-    )
-    if client_id is not None:
-        income_cash_base = and_(income_cash_base, Income.client_id == client_id)
-    if contract_id is not None:
-        income_cash_base = and_(income_cash_base, Income.contract_id == contract_id)
-    if project_id is not None:
-        income_cash_base = and_(income_cash_base, Income.project_id == project_id)
-
-    expense_cash_base = and_(
-        expense_status == "paid",
-        expense_paid_col.isnot(None),
-        expense_paid_col >= date_from,
-        expense_paid_col <= date_to,
-    )
-    if category is not None:
-        expense_cash_base = and_(expense_cash_base, Expense.category == category)
-    if is_tax_related is not None:
-        expense_cash_base = and_(
-            expense_cash_base,
-            expense_is_tax == (1 if is_tax_related else 0),
-        )
-
-    expense_tax_base = and_(
-        expense_status == "paid",
-        expense_is_tax == True,
-        expense_paid_col.isnot(None),
-        expense_paid_col >= date_from,
-        expense_paid_col <= date_to,
-    )
-    if category is not None:
-        expense_tax_base = and_(expense_tax_base, Expense.category == category)
-
-    # Формат для GROUP BY в SQLite
-    if group_by == "day":
-        fmt = "%Y-%m-%d"
-    elif group_by == "month":
-        fmt = "%Y-%m"
+    if not filters and not compare_to and analytics_engine.available:
+        return await analytics_engine.summary(db, date_from, date_to, group_by, mode)
+    # Закрытые месяцы — из снапшотов (для group_by=day снапшот месяца не годится)
+    use_snapshots = group_by != "day"
+    offset = parse_compare_to(compare_to, date_from, date_to) if compare_to else None
+    if offset is None:
+        R = (await ledger_source(db, date_from, date_to, use_snapshots)).c
     else:
-        fmt = "%Y"
-
-    periods_data: dict[str, dict[str, float]] = {}
-    for pk in _iter_periods(date_from, date_to, group_by):
-        periods_data[pk] = {
-            "revenue_accrual": 0.0,
-            "revenue_cash": 0.0,
-            "expense_accrual": 0.0,
-            "expense_cash": 0.0,
-            "taxes_cash": 0.0,
-            "net_profit_accrual": 0.0,
-            "net_profit_cash": 0.0,
-        }
+        R = (await _comparison_source(db, date_from, date_to, offset, use_snapshots)).c
+    income_conds, expense_conds, tax_conds = _rollup_filter_conditions(filters, R)
 
-    # Для группировки нужны подзапросы по каждому периоду или использование strftime
-    # SQLite: strftime('%Y-%m', date) для группировки по месяцу
-    if group_by == "day":
-        grp = func.strftime("%Y-%m-%d", income_date_col)
-        grp_paid_i = func.strftime("%Y-%m-%d", income_paid_col)
-        grp_exp = func.strftime("%Y-%m-%d", expense_date_col)
-        grp_paid_e = func.strftime("%Y-%m-%d", expense_paid_col)
-    elif group_by == "month":
-        grp = func.strftime("%Y-%m", income_date_col)
-        grp_paid_i = func.strftime("%Y-%m", income_paid_col)
-        grp_exp = func.strftime("%Y-%m", expense_date_col)
-        grp_paid_e = func.strftime("%Y-%m", expense_paid_col)
-    else:
-        grp = func.strftime("%Y", income_date_col)
-        grp_paid_i = func.strftime("%Y", income_paid_col)
-        grp_exp = func.strftime("%Y", expense_date_col)
-        grp_paid_e = func.strftime("%Y", expense_paid_col)
+    def empty() -> dict[str, float]:
+        return {f: 0.0 for f in SERIES_FIELDS}
+
+    periods_data: dict[str, dict[str, float]] = {pk: empty() for pk in _iter_periods(date_from, date_to, group_by)}
+    baseline_data: dict[str, dict[str, float]] = {}
+    if offset is not None:
+        baseline_data = {pk: empty() for pk in _iter_periods(date_from - offset, date_to - offset, group_by)}
 
     need_accrual = mode in ("accrual", "both")
     need_cash = mode in ("cash", "both")
 
-    if need_accrual:
-        # revenue_accrual по issued_date
-        q_ra = (
-            select(grp.label("period"), func.coalesce(func.sum(income_amount), 0).label("s"))
-            .where(income_base)
-            .group_by(grp)
-        )
-        r = await db.execute(q_ra)
-        for row in r.fetchall():
-            p = str(row.period)
-            if p in periods_data:
-                periods_data[p]["revenue_accrual"] = float(row.s)
-
-        # expense_accrual по date
-        q_ea = (
-            select(grp_exp.label("period"), func.coalesce(func.sum(expense_amount), 0).label("s"))
-            .where(expense_accrual_base)
-            .group_by(grp_exp)
-        )
-        r = await db.execute(q_ea)
-        for row in r.fetchall():
-            p = str(row.period)
-            if p in periods_data:
-                periods_data[p]["expense_accrual"] = float(row.s)
-
-    if need_cash:
-        # revenue_cash из cash_transactions (создаётся при mark-paid invoice)
-        ct_date = CashTransaction.date
-        ct_amount = CashTransaction.amount
-        if group_by == "day":
-            grp_ct = func.strftime("%Y-%m-%d", ct_date)
-        elif group_by == "month":
-            grp_ct = func.strftime("%Y-%m", ct_date)
-        else:
-            grp_ct = func.strftime("%Y", ct_date)
-        q_rc = (
-            select(grp_ct.label("period"), func.coalesce(func.sum(ct_amount), 0).label("s"))
-            .where(
-                and_(
-                    CashTransaction.type == "income",
-                    ct_date >= date_from,
-                    ct_date <= date_to,
-                )
-            )
-            .group_by(grp_ct)
-        )
-        r = await db.execute(q_rc)
-        for row in r.fetchall():
-            p = str(row.period)
-            if p in periods_data:
-                periods_data[p]["revenue_cash"] = float(row.s)
-
-        # expense_cash по paid_date
-        q_ec = (
-            select(grp_paid_e.label("period"), func.coalesce(func.sum(expense_amount), 0).label("s"))
-            .where(expense_cash_base)
-            .group_by(grp_paid_e)
+    # Группировка по целочисленным ключам периодов свода (day_month, day_year), а не strftime(day)
+    grp = period_group_key(R, "day", "day", group_by)
+    side = R.side if offset is not None else literal("current")
+    q = (
+        select(
+            side.label("side"),
+            grp.label("period"),
+            _filtered_sum(R.revenue_accrual, income_conds).label("revenue_accrual"),
+            _filtered_sum(R.revenue_cash, income_conds).label("revenue_cash"),
+            _filtered_sum(R.expense_accrual, expense_conds).label("expense_accrual"),
+            _filtered_sum(R.expense_cash, expense_conds).label("expense_cash"),
+            _filtered_sum(R.taxes_cash, tax_conds).label("taxes_cash"),
         )
-        r = await db.execute(q_ec)
-        for row in r.fetchall():
-            p = str(row.period)
-            if p in periods_data:
-                periods_data[p]["expense_cash"] = float(row.s)
-
-        # taxes_cash
-        q_tc = (
-            select(grp_paid_e.label("period"), func.coalesce(func.sum(expense_amount), 0).label("s"))
-            .where(expense_tax_base)
-            .group_by(grp_paid_e)
-        )
-        r = await db.execute(q_tc)
-        for row in r.fetchall():
-            p = str(row.period)
-            if p in periods_data:
-                periods_data[p]["taxes_cash"] = float(row.s)
-
-    # net profit
-    for p, data in periods_data.items():
-        data["net_profit_accrual"] = data["revenue_accrual"] - data["expense_accrual"]
-        data["net_profit_cash"] = data["revenue_cash"] - data["expense_cash"]
-
-    # Итоги за весь период
-    totals = {
-        "revenue_accrual": sum(d["revenue_accrual"] for d in periods_data.values()),
-        "revenue_cash": sum(d["revenue_cash"] for d in periods_data.values()),
-        "expense_accrual": sum(d["expense_accrual"] for d in periods_data.values()),
-        "expense_cash": sum(d["expense_cash"] for d in periods_data.values()),
-        "taxes_cash": sum(d["taxes_cash"] for d in periods_data.values()),
-    }
-    totals["net_profit_accrual"] = totals["revenue_accrual"] - totals["expense_accrual"]
-    totals["net_profit_cash"] = totals["revenue_cash"] - totals["expense_cash"]
+        .where(*period_key_bounds(R, "day", group_by, date_from - offset if offset else date_from, date_to))
+        .group_by(side, grp)
+    )
+    r = await db.execute(q)
+    for row in r.fetchall():
+        target = periods_data if row.side == "current" else baseline_data
+        p = period_label(row.period, group_by)
+        if p not in target:
+            continue
+        data = target[p]
+        if need_accrual:
+            data["revenue_accrual"] = float(row.revenue_accrual)
+            data["expense_accrual"] = float(row.expense_accrual)
+        if need_cash:
+            data["revenue_cash"] = float(row.revenue_cash)
+            data["expense_cash"] = float(row.expense_cash)
+            data["taxes_cash"] = float(row.taxes_cash)
+
+    def finish(data_by_period: dict[str, dict[str, float]]) -> dict[str, float]:
+        """net profit по периодам и итоги за весь диапазон."""
+        for data in data_by_period.values():
+            data["net_profit_accrual"] = data["revenue_accrual"] - data["expense_accrual"]
+            data["net_profit_cash"] = data["revenue_cash"] - data["expense_cash"]
+        totals = {
+            f: sum(d[f] for d in data_by_period.values())
+            for f in ("revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash")
+        }
+        totals["net_profit_accrual"] = totals["revenue_accrual"] - totals["expense_accrual"]
+        totals["net_profit_cash"] = totals["revenue_cash"] - totals["expense_cash"]
+        return totals
 
-    return {
+    totals = finish(periods_data)
+    result = {
         "range": {"from": date_from.isoformat(), "to": date_to.isoformat()},
         "group_by": group_by,
         "mode": mode,
         "series": [{"period": k, **v} for k, v in sorted(periods_data.items())],
         "totals": totals,
     }
+    if offset is None:
+        return result
+
+    baseline_totals = finish(baseline_data)
+    for row in result["series"]:
+        # Период базы — тот, в который попадает начало текущего периода, сдвинутое назад
+        bk = _period_key(max(_period_start(row["period"], group_by), date_from) - offset, group_by)
+        base = baseline_data.get(bk) or empty()
+        current = {f: row[f] for f in SERIES_FIELDS}
+        row["baseline_period"] = bk
+        row["baseline"] = base
+        row["delta"] = _delta(current, base)
+    result["comparison"] = {
+        "compare_to": compare_to,
+        "range": {"from": (date_from - offset).isoformat(), "to": (date_to - offset).isoformat()},
+        "totals": baseline_totals,
+        "delta": _delta(totals, baseline_totals),
+        "delta_percent": _delta_percent(totals, baseline_totals),
+    }
+    return result
+
+
+# Меры, форму которых сохраняет прореживание (net — производные)
+_LTTB_FIELDS = {
+    "accrual": ("revenue_accrual", "expense_accrual"),
+    "cash": ("revenue_cash", "expense_cash", "taxes_cash"),
+    "both": ("revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash"),
+}
+
+
+def _lttb_indices(xs: list[float], ys: list[tuple[float, ...]], threshold: int) -> list[int]:
+    """
+    Largest-Triangle-Three-Buckets: индексы threshold точек, сохраняющих форму ряда.
+    Первая и последняя точки остаются; из каждой корзины берётся точка с наибольшей площадью
+    треугольника (предыдущая выбранная, кандидат, среднее следующей корзины), площади мер суммируются.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    out = [0]
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        width = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / width
+        avg_y = [sum(col) / width for col in zip(*ys[next_start:next_end])]
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = sum(
+                abs((ax - avg_x) * (ys[j][k] - ay[k]) - (ax - xs[j]) * (avg_y[k] - ay[k]))
+                for k in range(len(ay))
+            )
+            if area > best_area:
+                best, best_area = j, area
+        out.append(best)
+        a = best
+    out.append(n - 1)
+    return out
+
+
+def shape_series(
+    result: dict,
+    sparse: bool = False,
+    max_points: Optional[int] = None,
+    columnar: bool = False,
+) -> dict:
+    """
+    Ответ get_finance_summary для длинных рядов (обычно group_by=day):
+    sparse — без периодов, где все меры нулевые; max_points — прореживание LTTB
+    (x — позиция периода в полном календаре, поэтому пропуски sparse учитываются);
+    columnar — series как параллельные массивы {"period": [...], мера: [...]} вместо списка объектов
+    (при compare_to ещё baseline_period, baseline_<мера>, delta_<мера>).
+    totals всегда по полному ряду.
+    """
+    series = result["series"]
+    total_points = len(series)
+    xs = list(range(total_points))
+    if sparse:
+        keep = [
+            i for i, row in enumerate(series)
+            if any(row[f] for f in SERIES_FIELDS) or any(row.get("baseline", {}).values())
+        ]
+        xs = keep
+        series = [series[i] for i in keep]
+    if max_points is not None and len(series) > max_points:
+        fields = _LTTB_FIELDS[result["mode"]]
+        idx = _lttb_indices(xs, [tuple(row[f] for f in fields) for row in series], max_points)
+        series = [series[i] for i in idx]
+    out = {**result, "points": {"total": total_points, "returned": len(series)}}
+    if columnar:
+        out["format"] = "columns"
+        out["series"] = {
+            "period": [row["period"] for row in series],
+            **{f: [row[f] for row in series] for f in SERIES_FIELDS},
+        }
+        if "comparison" in result:
+            out["series"]["baseline_period"] = [row["baseline_period"] for row in series]
+            for part in ("baseline", "delta"):
+                out["series"].update({f"{part}_{f}": [row[part][f] for row in series] for f in SERIES_FIELDS})
+    else:
+        out["series"] = series
+    return out
+
+
+# Корзины старения дебиторки: (ключ, от, до) по days_outstanding, до=None — без верхней границы
+AR_BUCKETS = (("0_30", None, 30), ("31_60", 31, 60), ("61_90", 61, 90), ("90_plus", 91, None))
+
+
+def _ar_bucket_expr(days):
+    return case(
+        (days <= 30, "0_30"),
+        (days <= 60, "31_60"),
+        (days <= 90, "61_90"),
+        else_="90_plus",
+    )
+
 
+def encode_ar_cursor(issued_date: date, income_id: int) -> str:
+    return f"{issued_date.isoformat()}_{income_id}"
 
-async def get_accounts_receivable(db: AsyncSession) -> dict:
+
+def decode_ar_cursor(cursor: str) -> tuple[date, int]:
+    """Курсор страницы AR: 'YYYY-MM-DD_id' последней выданной строки. ValueError при неверном формате."""
+    d, _, i = cursor.partition("_")
+    return date.fromisoformat(d), int(i)
+
+
+async def get_accounts_receivable(
+    db: AsyncSession,
+    today: Optional[date] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    bucket: Optional[str] = None,
+    totals_only: bool = False,
+) -> dict:
     """
     Дебиторская задолженность: unpaid incomes (status != 'cancelled' and paid_date is null).
+    Старение (0–30, 31–60, 61–90, 90+ дней) и подытоги по клиентам считаются в SQL.
+    items — страница по (issued_date, id) с keyset-курсором next_cursor (limit=None — все);
+    totals_only — только итоги и подытоги (для панели), без items.
     """
-    today = date.today()
-    q = select(Income).options(selectinload(Income.client)).where(
-        Income.status != "cancelled",
-        Income.paid_date.is_(None),
-    ).order_by(Income.issued_date.asc())
+    today = today or date.today()
+    days = cast(func.julianday(today.isoformat()) - func.julianday(Income.issued_date), Integer)
+    bucket_expr = _ar_bucket_expr(days)
+    client_name = func.coalesce(Income.client_name, Client.name)
+    open_conds = [Income.status != "cancelled", Income.paid_date.is_(None)]
+
+    # Подытоги по клиентам: одна сгруппированная выборка
+    bucket_sums = [
+        func.coalesce(func.sum(case((bucket_expr == key, Income.amount_rsd), else_=0)), 0).label(f"b_{key}")
+        for key, _, _ in AR_BUCKETS
+    ]
+    q = (
+        select(
+            Income.client_id,
+            func.max(client_name).label("client_name"),
+            func.count().label("count"),
+            func.coalesce(func.sum(Income.amount_rsd), 0).label("total"),
+            func.coalesce(func.sum(case((days > 30, Income.amount_rsd), else_=0)), 0).label("overdue"),
+            *bucket_sums,
+        )
+        .outerjoin(Client, Client.id == Income.client_id)
+        .where(*open_conds)
+        .group_by(Income.client_id, case((Income.client_id.is_(None), Income.client_name), else_=None))
+        .order_by(func.sum(Income.amount_rsd).desc())
+    )
     r = await db.execute(q)
-    incomes = r.scalars().all()
-    items = []
-    ar_total = 0.0
-    ar_overdue = 0.0
-    for i in incomes:
-        amt = float(i.amount_rsd)
-        days_out = (today - i.issued_date).days
-        items.append({
-            "income_id": i.id,
-            "invoice_number": i.invoice_number,
-            "client_name": i.client_name or (i.client.name if i.client else None),
-            "issued_date": i.issued_date.isoformat(),
-            "amount": amt,
-            "days_outstanding": days_out,
+    by_client = []
+    totals = {"ar_total": 0.0, "ar_overdue": 0.0, "count": 0, "buckets": {key: 0.0 for key, _, _ in AR_BUCKETS}}
+    for row in r.fetchall():
+        buckets = {key: float(getattr(row, f"b_{key}")) for key, _, _ in AR_BUCKETS}
+        by_client.append({
+            "client_id": row.client_id,
+            "client_name": row.client_name,
+            "count": int(row.count),
+            "total": float(row.total),
+            "overdue": float(row.overdue),
+            "buckets": buckets,
         })
-        ar_total += amt
-        if days_out > 30:
-            ar_overdue += amt
-    return {
-        "items": items,
-        "totals": {"ar_total": ar_total, "ar_overdue": ar_overdue},
+        totals["ar_total"] += float(row.total)
+        totals["ar_overdue"] += float(row.overdue)
+        totals["count"] += int(row.count)
+        for key, v in buckets.items():
+            totals["buckets"][key] += v
+
+    result = {
+        "as_of": today.isoformat(),
+        "totals": totals,
+        "by_client": by_client,
     }
+    if totals_only:
+        return result
+
+    q = (
+        select(
+            Income.id,
+            Income.invoice_number,
+            client_name.label("client_name"),
+            Income.client_id,
+            Income.issued_date,
+            Income.amount_rsd,
+            days.label("days_outstanding"),
+            bucket_expr.label("bucket"),
+        )
+        .outerjoin(Client, Client.id == Income.client_id)
+        .where(*open_conds)
+        .order_by(Income.issued_date.asc(), Income.id.asc())
+    )
+    if bucket is not None:
+        q = q.where(bucket_expr == bucket)
+    if cursor:
+        after_date, after_id = decode_ar_cursor(cursor)
+        q = q.where(or_(
+            Income.issued_date > after_date,
+            and_(Income.issued_date == after_date, Income.id > after_id),
+        ))
+    if limit is not None:
+        q = q.limit(limit + 1)
+    r = await db.execute(q)
+    rows = r.fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_ar_cursor(rows[-1].issued_date, rows[-1].id)
+    result["items"] = [
+        {
+            "income_id": row.id,
+            "invoice_number": row.invoice_number,
+            "client_id": row.client_id,
+            "client_name": row.client_name,
+            "issued_date": row.issued_date.isoformat(),
+            "amount": float(row.amount_rsd),
+            "days_outstanding": int(row.days_outstanding),
+            "bucket": row.bucket,
+        }
+        for row in rows
+    ]
+    result["next_cursor"] = next_cursor
+    return result
+
+
+async def _opening_cash_balance(db: AsyncSession) -> float:
+    r = await db.execute(select(Enterprise.opening_cash_balance).limit(1))
+    value = r.scalar_one_or_none()
+    return float(value) if value is not None else 0.0
+
+
+async def get_cash_balance(db: AsyncSession, as_of: date) -> dict:
+    """Остаток денежных средств на начало дня as_of: opening_cash_balance + накопленный поток (по точкам)."""
+    opening_cash_balance = await _opening_cash_balance(db)
+    balance = opening_cash_balance + await get_cumulative_cash_flow(db, as_of)
+    return {"as_of": as_of.isoformat(), "opening_cash_balance": opening_cash_balance, "balance": balance}
 
 
 async def get_cashflow(
@@ -322,28 +494,41 @@ async def get_cashflow(
 ) -> dict:
     """
     Cash flow: opening + inflow - outflow = closing (cumulative).
-    inflow = revenue_cash, outflow = expense_cash.
-    opening для первой точки = opening_cash_balance.
+    inflow / outflow — поступления и выплаты журнала движения денег (money_journal), одна выборка
+    по индексу entry_date. opening для первой точки = остаток на начало date_from
+    (opening_cash_balance + поток до date_from).
     """
-    # Получаем opening_cash_balance из enterprise
-    r = await db.execute(select(Enterprise).limit(1))
-    ent = r.scalar_one_or_none()
-    opening_cash_balance = float(ent.opening_cash_balance) if ent and ent.opening_cash_balance is not None else 0.0
-
-    # Финансовый агрегат по cash
-    summary = await get_finance_summary(db, date_from, date_to, group_by, "cash", None)
-    series = summary.get("series", [])
+    opening_cash_balance = await _opening_cash_balance(db)
+    opening_balance = opening_cash_balance + await get_cumulative_cash_flow(db, date_from)
+
+    J = MoneyJournalEntry
+    flows = {pk: [0.0, 0.0] for pk in _iter_periods(date_from, date_to, group_by)}
+    grp = period_group_key(J, "entry_date", "entry", group_by)
+    r = await db.execute(
+        select(
+            grp.label("period"),
+            func.coalesce(func.sum(case((J.direction == "in", J.amount), else_=0)), 0).label("inflow"),
+            func.coalesce(-func.sum(case((J.direction == "out", J.amount), else_=0)), 0).label("outflow"),
+        )
+        .where(
+            J.entry_date >= date_from, J.entry_date <= date_to,
+            *period_key_bounds(J, "entry", group_by, date_from, date_to),
+        )
+        .group_by(grp)
+    )
+    for row in r.fetchall():
+        p = period_label(row.period, group_by)
+        if p in flows:
+            flows[p] = [float(row.inflow), float(row.outflow)]
 
     result_series = []
-    prev_closing = opening_cash_balance
-    for i, s in enumerate(series):
-        inflow = float(s.get("revenue_cash", 0) or 0)
-        outflow = float(s.get("expense_cash", 0) or 0)
+    prev_closing = opening_balance
+    for period, (inflow, outflow) in sorted(flows.items()):
         opening = prev_closing
         closing = opening + inflow - outflow
         prev_closing = closing
         result_series.append({
-            "period": s["period"],
+            "period": period,
             "opening": opening,
             "inflow": inflow,
             "outflow": outflow,
@@ -354,6 +539,7 @@ async def get_cashflow(
         "range": {"from": date_from.isoformat(), "to": date_to.isoformat()},
         "group_by": group_by,
         "opening_cash_balance": opening_cash_balance,
+        "opening_balance": opening_balance,
         "series": result_series,
     }
 
@@ -363,113 +549,221 @@ async def get_finance_by_project(
     date_from: date,
     date_to: date,
     mode: Literal["accrual", "cash"] = "accrual",
+    status: Optional[str] = None,
+    client_id: Optional[int] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
+    compare_to: Optional[str] = None,
 ) -> dict:
     """
     Аналитика по проектам: revenue, expenses, profit, margin_percent.
-    Формат: by_project[], unassigned.
+    Формат: by_project[], unassigned, total.
 
     mode=accrual: доходы по Income.issued_date, расходы по Expense.date.
-    mode=cash: доходы по Income.paid_date (только paid), расходы по Expense.paid_date (только paid).
+    mode=cash: доходы по поступлениям (cash_transactions), расходы по Expense.paid_date (только paid).
+    Суммы — один GROUP BY по daily_ledger_rollup, проекты присоединяются LEFT JOIN'ом
+    (проекты без операций получают нули). status/client_id фильтруют проекты,
+    skip/limit — страница (limit=None — все проекты). Строка «Без проекта» — на последней странице.
+    compare_to — база из того же GROUP BY (условные суммы по side); в строках baseline и delta.
     """
-    income_date_col = Income.issued_date
-    income_paid_col = Income.paid_date
-    income_amount = Income.amount_rsd
-    income_status = Income.status
-
-    expense_date_col = Expense.date
-    expense_paid_col = Expense.paid_date
-    expense_amount = Expense.amount
-    expense_status = Expense.status
-
-    if mode == "accrual":
-        # Доходы: issued_date в периоде, status != cancelled
-        income_base = and_(
-            income_status != "cancelled",
-            income_date_col >= date_from,
-            income_date_col <= date_to,
-        )
-        # Расходы: date в периоде, status != reversed
-        expense_base = and_(
-            expense_status != "reversed",
-            expense_date_col >= date_from,
-            expense_date_col <= date_to,
-        )
+    offset = parse_compare_to(compare_to, date_from, date_to) if compare_to else None
+    if offset is None:
+        R = (await ledger_source(db, date_from, date_to)).c
     else:
-        # cash: доходы — только paid, по paid_date
-        income_base = and_(
-            income_status == "paid",
-            income_paid_col.isnot(None),
-            income_paid_col >= date_from,
-            income_paid_col <= date_to,
-        )
-        # cash: расходы — только paid, по paid_date (если нет paid_date — не считаем)
-        expense_base = and_(
-            expense_status == "paid",
-            expense_paid_col.isnot(None),
-            expense_paid_col >= date_from,
-            expense_paid_col <= date_to,
+        R = (await _comparison_source(db, date_from, date_to, offset)).c
+    rev_col = R.revenue_accrual if mode == "accrual" else R.revenue_cash
+    exp_col = R.expense_accrual if mode == "accrual" else R.expense_cash
+
+    def side_sum(col, side: str):
+        return func.sum(col) if offset is None else func.sum(case((R.side == side, col), else_=0))
+
+    sums = (
+        select(
+            R.project_id.label("project_id"),
+            side_sum(rev_col, "current").label("revenue"),
+            side_sum(exp_col, "current").label("expenses"),
+            side_sum(rev_col, "baseline").label("baseline_revenue"),
+            side_sum(exp_col, "baseline").label("baseline_expenses"),
         )
+        .group_by(R.project_id)
+        .subquery()
+    )
 
-    # Все проекты (для соответствия списку на фронте при show_archived)
-    r = await db.execute(select(Project).order_by(Project.name))
-    projects = list(r.scalars().all())
-    project_ids = [p.id for p in projects]
-    all_ids = project_ids + [None]  # None = без проекта
-
-    by_project = []
-    unassigned = {"revenue": 0.0, "expenses": 0.0, "profit": 0.0}
-
-    for pid in all_ids:
-        name = "— Без проекта —" if pid is None else next((p.name for p in projects if p.id == pid), f"Project {pid}")
-
-        # Revenue по проекту
-        if mode == "accrual":
-            inc_cond = and_(income_base, Income.project_id == pid)
-            q_rev = select(func.coalesce(func.sum(income_amount), 0)).where(inc_cond)
-        else:
-            # cash: из cash_transactions (создаётся при mark-paid)
-            q_rev = (
-                select(func.coalesce(func.sum(CashTransaction.amount), 0))
-                .select_from(CashTransaction)
-                .join(Income, CashTransaction.reference_id == Income.id)
-                .where(
-                    and_(
-                        CashTransaction.type == "income",
-                        CashTransaction.source == "invoice",
-                        CashTransaction.date >= date_from,
-                        CashTransaction.date <= date_to,
-                        Income.project_id == pid,
-                    )
-                )
-            )
-        r = await db.execute(q_rev)
-        revenue = float(r.scalar() or 0)
+    q = (
+        select(
+            Project.id,
+            Project.name,
+            func.coalesce(sums.c.revenue, 0).label("revenue"),
+            func.coalesce(sums.c.expenses, 0).label("expenses"),
+            func.coalesce(sums.c.baseline_revenue, 0).label("baseline_revenue"),
+            func.coalesce(sums.c.baseline_expenses, 0).label("baseline_expenses"),
+            func.count().over().label("total"),
+        )
+        .outerjoin(sums, sums.c.project_id == Project.id)
+        .order_by(Project.name, Project.id)
+    )
+    if status is not None:
+        q = q.where(Project.status == status)
+    if client_id is not None:
+        q = q.where(Project.client_id == client_id)
+    if skip:
+        q = q.offset(skip)
+    if limit is not None:
+        q = q.limit(limit)
+    r = await db.execute(q)
+    rows = r.fetchall()
+    total = int(rows[0].total) if rows else 0
 
-        # Expenses по проекту (ключ expenses, не expense/cost)
-        exp_cond = and_(expense_base, Expense.project_id == pid)
-        q_exp = select(func.coalesce(func.sum(expense_amount), 0)).where(exp_cond)
-        r = await db.execute(q_exp)
-        expenses = float(r.scalar() or 0)
+    r = await db.execute(
+        select(sums.c.revenue, sums.c.expenses, sums.c.baseline_revenue, sums.c.baseline_expenses)
+        .where(sums.c.project_id == 0)
+    )
+    unassigned_sums = r.first()
 
+    def metrics(revenue: float, expenses: float) -> dict:
         profit = revenue - expenses
         margin_percent = round((profit / revenue * 100), 1) if revenue and revenue > 0 else 0.0
-
-        row = {
-            "project_id": pid,
-            "project_name": name,
-            "revenue": revenue,
-            "expenses": expenses,
-            "profit": profit,
-            "margin_percent": margin_percent,
+        return {"revenue": revenue, "expenses": expenses, "profit": profit, "margin_percent": margin_percent}
+
+    def make_row(pid: Optional[int], name: str, sums_row) -> dict:
+        def value(attr: str) -> float:
+            return float(getattr(sums_row, attr) or 0) if sums_row else 0.0
+
+        current = metrics(value("revenue"), value("expenses"))
+        row = {"project_id": pid, "project_name": name, **current}
+        if offset is not None:
+            base = metrics(value("baseline_revenue"), value("baseline_expenses"))
+            row["baseline"] = base
+            row["delta"] = _delta(current, base)
+            row["delta"]["margin_percent"] = round(row["delta"]["margin_percent"], 1)
+        return row
+
+    by_project = [make_row(row.id, row.name, row) for row in rows]
+    unassigned_row = make_row(None, "— Без проекта —", unassigned_sums)
+    if limit is None or skip + len(rows) >= total:
+        by_project.append(unassigned_row)
+    unassigned = {k: unassigned_row[k] for k in ("revenue", "expenses", "profit")}
+
+    result = {
+        "range": {"from": date_from.isoformat(), "to": date_to.isoformat()},
+        "mode": mode,
+        "by_project": by_project,
+        "unassigned": unassigned,
+        "total": total,
+        "skip": skip,
+        "limit": limit,
+    }
+    if offset is not None:
+        result["comparison"] = {
+            "compare_to": compare_to,
+            "range": {"from": (date_from - offset).isoformat(), "to": (date_to - offset).isoformat()},
         }
-        by_project.append(row)
+    return result
+
+
+# --- Куб: произвольные измерения × меры за один проход по своду ---
+
+CUBE_DIMENSIONS = ("period", "client_id", "project_id", "contract_id", "category", "is_tax_related")
+CUBE_MEASURES = (
+    "revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash",
+    "net_accrual", "net_cash",
+)
+# Производные меры: (уменьшаемое, вычитаемое)
+_DERIVED_MEASURES = {
+    "net_accrual": ("revenue_accrual", "expense_accrual"),
+    "net_cash": ("revenue_cash", "expense_cash"),
+}
 
-        if pid is None:
-            unassigned = {"revenue": revenue, "expenses": expenses, "profit": profit}
+
+def _cube_dim_value(dim: str, value):
+    """Пустые значения измерений свода (0 / '') → None."""
+    if dim == "is_tax_related":
+        return bool(value)
+    if dim in ("client_id", "project_id", "contract_id"):
+        return value or None
+    if dim == "category":
+        return value or None
+    return value
+
+
+async def get_finance_cube(
+    db: AsyncSession,
+    date_from: date,
+    date_to: date,
+    dims: list[str],
+    measures: list[str],
+    period: Literal["day", "week", "month", "quarter", "year"] = "month",
+    subtotals: bool = False,
+) -> dict:
+    """
+    Куб для сводной таблицы: одна GROUP BY-выборка из daily_ledger_rollup по запрошенным измерениям.
+    subtotals=True: добавляются все grouping sets (подытоги по каждому подмножеству измерений и
+    общий итог) — считаются за один проход по строкам выборки. В строке подытога свёрнутые
+    измерения = None, а grouping перечисляет измерения, которые в строке заданы.
+    """
+    # Снапшот закрытого месяца годится, если период не дробит месяц (day/week)
+    use_snapshots = "period" not in dims or period in ("month", "quarter", "year")
+    R = (await ledger_source(db, date_from, date_to, use_snapshots=use_snapshots)).c
+    base_measures = sorted({
+        part
+        for m in measures
+        for part in _DERIVED_MEASURES.get(m, (m,))
+    }, key=CUBE_MEASURES.index)
+
+    dim_cols = []
+    for d in dims:
+        col = period_group_key(R, "day", "day", period) if d == "period" else getattr(R, d)
+        dim_cols.append(col.label(d))
+    q = select(*dim_cols, *[func.coalesce(func.sum(getattr(R, m)), 0).label(m) for m in base_measures])
+    if "period" in dims:
+        q = q.where(*period_key_bounds(R, "day", period, date_from, date_to))
+    if dim_cols:
+        q = q.group_by(*[c.element for c in dim_cols]).order_by(*[c.element for c in dim_cols])
+    r = await db.execute(q)
+
+    def measure_values(sums: dict[str, float]) -> dict[str, float]:
+        out = {}
+        for m in measures:
+            if m in _DERIVED_MEASURES:
+                plus, minus = _DERIVED_MEASURES[m]
+                out[m] = sums[plus] - sums[minus]
+            else:
+                out[m] = sums[m]
+        return out
+
+    n = len(dims)
+    # Маски grouping sets: бит i = измерение i задано
+    masks = [(1 << n) - 1]
+    if subtotals:
+        masks = sorted(range(1 << n), key=lambda mask: (-bin(mask).count("1"), -mask))
+    groups: dict[int, dict[tuple, dict[str, float]]] = {mask: {} for mask in masks}
+
+    for row in r.fetchall():
+        key = tuple(
+            period_label(getattr(row, d), period) if d == "period" else _cube_dim_value(d, getattr(row, d))
+            for d in dims
+        )
+        values = {m: float(getattr(row, m)) for m in base_measures}
+        for mask in masks:
+            gkey = tuple(v if mask & (1 << i) else None for i, v in enumerate(key))
+            acc = groups[mask].setdefault(gkey, dict.fromkeys(base_measures, 0.0))
+            for m, v in values.items():
+                acc[m] += v
+
+    rows = []
+    for mask in masks:
+        grouping = [d for i, d in enumerate(dims) if mask & (1 << i)]
+        for gkey, sums in groups[mask].items():
+            rows.append({
+                **dict(zip(dims, gkey)),
+                **measure_values(sums),
+                "grouping": grouping,
+            })
 
     return {
         "range": {"from": date_from.isoformat(), "to": date_to.isoformat()},
-        "mode": mode,
-        "by_project": by_project,
-        "unassigned": unassigned,
+        "dims": dims,
+        "measures": measures,
+        "period": period,
+        "rows": rows,
     }
@@ -0,0 +1,336 @@
+"""Прогноз денежного потока: остаток на каждый день/месяц вперёд (до 24 месяцев).
+
+Поступления — открытая дебиторка, ожидаемая дата оплаты = дата счёта + среднее число дней
+до оплаты у клиента (по истории; нет истории — среднее по всем, затем forecast_default_days_to_pay).
+Выплаты — экземпляры планируемых расходов (без оплаченных) и неоплаченные обязательства;
+месяцы без сетки обязательств досчитываются по последнему решению (YearDecision) каждого типа.
+Просроченное (ожидаемая дата раньше завтрашнего дня) ставится на первый день прогноза.
+
+Все события раскладываются в дневные массивы одним np.bincount, остаток — накопленная сумма.
+Требует numpy (forecast_available).
+"""
+from datetime import date, timedelta
+from typing import Literal, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.cash_checkpoints import get_cumulative_cash_flow
+from backend.config import get_settings
+from backend.models import (
+    Income, Enterprise, DailyLedgerRollup, PlannedExpense, PlannedExpensePayment,
+    MonthlyObligation, YearDecision,
+)
+from backend.payments_service import deadline_for_month
+from backend.period_keys import period_key_bounds, period_label
+
+try:
+    import numpy as np
+except ImportError:  # прогноз необязателен
+    np = None
+
+settings = get_settings()
+
+MAX_HORIZON_MONTHS = 24
+
+
+def forecast_available() -> bool:
+    return np is not None
+
+
+def _d64(d: date):
+    return np.datetime64(d, "D")
+
+
+def _empty_days():
+    return np.array([], dtype="datetime64[D]")
+
+
+def planned_occurrences(pe: PlannedExpense, range_start: date, range_end: date):
+    """Даты экземпляров планируемого расхода в [range_start, range_end] (правила payment_dates_in_range), массивом."""
+    if not pe.is_active or pe.start_date > range_end:
+        return _empty_days()
+    end = min(range_end, pe.end_date) if pe.end_date else range_end
+    lo = max(range_start, pe.start_date)
+    if end < lo:
+        return _empty_days()
+
+    if pe.period == "weekly":
+        first = (lo - pe.start_date).days
+        offsets = np.arange(-(-first // 7), (end - pe.start_date).days // 7 + 1)
+        days = _d64(pe.start_date) + 7 * offsets
+    elif pe.period in ("monthly", "quarterly"):
+        day = max(1, min(pe.payment_day if pe.payment_day is not None else 1, 28))
+        m0 = np.datetime64(range_start, "M")
+        step = 1
+        if pe.period == "quarterly":
+            step = 3
+            m0 = m0 - (range_start.month - 1) % 3
+        months = np.arange(m0, np.datetime64(end, "M") + 1, step)
+        days = months.astype("datetime64[D]") + (day - 1)
+    elif pe.period == "yearly":
+        day = max(1, pe.payment_day if pe.payment_day is not None else pe.start_date.day)
+        years = np.arange(range_start.year, end.year + 1)
+        months = ((years - 1970) * 12 + (pe.start_date.month - 1)).astype("datetime64[M]")
+        month_len = ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+        days = months.astype("datetime64[D]") + (np.minimum(day, month_len) - 1)
+    else:
+        return _empty_days()
+    return days[(days >= _d64(lo)) & (days <= _d64(end))]
+
+
+async def _days_to_pay(db: AsyncSession) -> tuple[dict[Optional[int], float], float]:
+    """Среднее число дней от счёта до оплаты: по клиентам и общее."""
+    days = func.julianday(Income.paid_date) - func.julianday(Income.issued_date)
+    paid = [Income.paid_date.is_not(None), Income.status != "cancelled"]
+    r = await db.execute(select(Income.client_id, func.avg(days)).where(*paid).group_by(Income.client_id))
+    by_client = {row[0]: max(0.0, float(row[1])) for row in r.fetchall() if row[1] is not None}
+    r = await db.execute(select(func.avg(days)).where(*paid))
+    overall = r.scalar()
+    return by_client, max(0.0, float(overall)) if overall is not None else float(settings.forecast_default_days_to_pay)
+
+
+async def _expected_collections(db: AsyncSession, first_day: date):
+    """Открытые счета → (ожидаемые даты, суммы); клиенты без истории берут общее среднее."""
+    by_client, overall = await _days_to_pay(db)
+    r = await db.execute(
+        select(Income.client_id, Income.issued_date, Income.amount_rsd).where(
+            Income.status != "cancelled", Income.paid_date.is_(None)
+        )
+    )
+    rows = r.fetchall()
+    if not rows:
+        return _empty_days(), np.array([]), 0
+    client_ids = np.array([row[0] if row[0] is not None else -1 for row in rows], dtype=np.int64)
+    issued = np.array([row[1] for row in rows], dtype="datetime64[D]")
+    amounts = np.array([float(row[2] or 0) for row in rows])
+
+    lag = np.full(len(rows), overall)
+    has_history = np.zeros(len(rows), dtype=bool)
+    known = np.array(sorted(k for k in by_client if k is not None), dtype=np.int64)
+    if len(known):
+        pos = np.minimum(np.searchsorted(known, client_ids), len(known) - 1)
+        has_history = known[pos] == client_ids
+        known_days = np.array([by_client[k] for k in known])
+        lag = np.where(has_history, known_days[pos], overall)
+    expected = issued + np.rint(lag).astype(np.int64)
+    expected = np.maximum(expected, _d64(first_day))
+    return expected, amounts, int((~has_history).sum())
+
+
+async def _planned_outflows(db: AsyncSession, first_day: date, last_day: date):
+    """Неоплаченные экземпляры планируемых расходов с начала года (просроченные) до конца горизонта."""
+    r = await db.execute(select(PlannedExpense).where(PlannedExpense.is_active == True))
+    items = r.scalars().all()
+    if not items:
+        return _empty_days(), np.array([])
+    r = await db.execute(
+        select(PlannedExpensePayment.planned_expense_id, PlannedExpensePayment.due_date).where(
+            PlannedExpensePayment.planned_expense_id.in_([pe.id for pe in items])
+        )
+    )
+    paid = r.fetchall()
+    paid_keys = np.array(
+        [pid * 1_000_000 + (d - date(1970, 1, 1)).days for pid, d in paid], dtype=np.int64
+    )
+    range_start = date(first_day.year, 1, 1)  # как на панели: просроченные с начала года
+    all_days, all_amounts = [], []
+    for pe in items:
+        days = planned_occurrences(pe, range_start, last_day)
+        if len(days) == 0:
+            continue
+        keys = pe.id * 1_000_000 + days.astype(np.int64)
+        days = days[~np.isin(keys, paid_keys)]
+        all_days.append(days)
+        all_amounts.append(np.full(len(days), float(pe.amount or 0)))
+    if not all_days:
+        return _empty_days(), np.array([])
+    return np.maximum(np.concatenate(all_days), _d64(first_day)), np.concatenate(all_amounts)
+
+
+async def _obligation_outflows(db: AsyncSession, first_day: date, last_day: date):
+    """Неоплаченные обязательства + месяцы без сетки по последнему решению каждого типа."""
+    r = await db.execute(
+        select(
+            MonthlyObligation.year, MonthlyObligation.month, MonthlyObligation.payment_type_id,
+            MonthlyObligation.amount, MonthlyObligation.deadline, MonthlyObligation.status,
+        ).where(
+            MonthlyObligation.deadline <= last_day,
+            or_(MonthlyObligation.status != "paid", MonthlyObligation.deadline >= first_day),
+        )
+    )
+    rows = r.fetchall()
+    existing = {(row.year, row.month, row.payment_type_id) for row in rows}
+    days = [row.deadline for row in rows if row.status != "paid"]
+    amounts = [float(row.amount or 0) for row in rows if row.status != "paid"]
+
+    # Последнее активное решение по типу (окончательное предпочтительнее привременого)
+    r = await db.execute(
+        select(YearDecision)
+        .where(YearDecision.is_active == True)
+        .order_by(YearDecision.year.desc(), YearDecision.is_provisional.asc())
+    )
+    latest: dict[int, YearDecision] = {}
+    for dec in r.scalars().all():
+        latest.setdefault(dec.payment_type_id, dec)
+    projected = 0
+    y, m = first_day.year, first_day.month
+    cursor = date(y, m, 1) - relativedelta(months=1)
+    while True:
+        dl = deadline_for_month(cursor.year, cursor.month)
+        if dl > last_day:
+            break
+        if dl >= first_day:
+            for pt_id, dec in latest.items():
+                if (cursor.year, cursor.month, pt_id) not in existing and cursor.year >= dec.year:
+                    days.append(dl)
+                    amounts.append(float(dec.monthly_amount or 0))
+                    projected += 1
+        cursor += relativedelta(months=1)
+    if not days:
+        return _empty_days(), np.array([]), projected
+    return np.maximum(np.array(days, dtype="datetime64[D]"), _d64(first_day)), np.array(amounts), projected
+
+
+async def _income_limit_projection(db: AsyncSession, today: date, last_day: date) -> dict:
+    """Лимиты паушала: факт по месяцам + среднемесячный доход за 12 полных месяцев на будущее."""
+    cur_month = date(today.year, today.month, 1)
+    hist_start = cur_month - relativedelta(months=12)
+    R = DailyLedgerRollup
+    r = await db.execute(
+        select(R.day_month, func.sum(R.revenue_accrual))
+        .where(
+            R.day >= date(hist_start.year, 1, 1), R.day <= today,
+            *period_key_bounds(R, "day", "month", date(hist_start.year, 1, 1), today),
+        )
+        .group_by(R.day_month)
+    )
+    actual = {period_label(row[0], "month"): float(row[1] or 0) for row in r.fetchall()}
+
+    months = np.arange(np.datetime64(date(hist_start.year, 1, 1), "M"), np.datetime64(last_day, "M") + 1)
+    keys = np.datetime_as_string(months, unit="M")
+    values = np.array([actual.get(k, 0.0) for k in keys])
+    cur_idx = int(np.searchsorted(months, np.datetime64(cur_month, "M")))
+    history = values[cur_idx - 12:cur_idx]
+    run_rate = float(history.mean()) if len(history) else 0.0
+
+    days_in_month = ((np.datetime64(cur_month, "M") + 1).astype("datetime64[D]") - _d64(cur_month)).astype(int)
+    remaining = (days_in_month - today.day) / days_in_month
+    values[cur_idx] += run_rate * remaining
+    values[cur_idx + 1:] = run_rate
+
+    cum = np.concatenate([[0.0], np.cumsum(values)])
+    idx = np.arange(len(values))
+    rolling_12m = cum[idx + 1] - cum[np.maximum(idx + 1 - 12, 0)]
+    years = months.astype("datetime64[Y]").astype(int) + 1970
+    year_first = np.searchsorted(years, years, side="left")
+    year_to_date = cum[idx + 1] - cum[year_first]
+
+    limit_6m = settings.income_limit_pausal
+    limit_8m = settings.income_limit_vat
+
+    def first_exceeding(series, limit) -> Optional[str]:
+        over = np.nonzero(series[cur_idx:] > limit)[0]
+        return str(keys[cur_idx + over[0]]) if len(over) else None
+
+    return {
+        "run_rate_monthly": run_rate,
+        "limit_6m": limit_6m,
+        "limit_8m": limit_8m,
+        "exceed_6m_period": first_exceeding(year_to_date, limit_6m),
+        "exceed_8m_period": first_exceeding(rolling_12m, limit_8m),
+        "series": [
+            {
+                "period": str(k),
+                "income": float(v),
+                "year_to_date": float(ytd),
+                "rolling_12m": float(r12),
+                "percent_6m": round(ytd / limit_6m * 100, 2) if limit_6m else 0,
+                "percent_8m": round(r12 / limit_8m * 100, 2) if limit_8m else 0,
+            }
+            for k, v, ytd, r12 in zip(
+                keys[cur_idx:], values[cur_idx:].tolist(), year_to_date[cur_idx:].tolist(), rolling_12m[cur_idx:].tolist()
+            )
+        ],
+    }
+
+
+async def get_cash_forecast(
+    db: AsyncSession,
+    months: int = 12,
+    granularity: Literal["day", "month"] = "month",
+    today: Optional[date] = None,
+) -> dict:
+    """Прогноз остатка денег с завтрашнего дня на months месяцев (до конца последнего месяца)."""
+    today = today or date.today()
+    months = max(1, min(months, MAX_HORIZON_MONTHS))
+    first_day = today + timedelta(days=1)
+    last_day = date(today.year, today.month, 1) + relativedelta(months=months + 1) - timedelta(days=1)
+    n_days = (last_day - first_day).days + 1
+
+    r = await db.execute(select(Enterprise.opening_cash_balance).limit(1))
+    opening_cash_balance = float(r.scalar_one_or_none() or 0)
+    opening_balance = opening_cash_balance + await get_cumulative_cash_flow(db, first_day)
+
+    ar_days, ar_amounts, invoices_without_history = await _expected_collections(db, first_day)
+    pe_days, pe_amounts = await _planned_outflows(db, first_day, last_day)
+    ob_days, ob_amounts, projected_obligations = await _obligation_outflows(db, first_day, last_day)
+
+    base = _d64(first_day)
+
+    def daily(days, amounts):
+        idx = (days - base).astype(np.int64)
+        inside = idx < n_days
+        return np.bincount(idx[inside], weights=amounts[inside], minlength=n_days), float(amounts[~inside].sum())
+
+    inflow_ar, ar_beyond = daily(ar_days, ar_amounts)
+    outflow_planned, _ = daily(pe_days, pe_amounts)
+    outflow_obligations, _ = daily(ob_days, ob_amounts)
+    net = inflow_ar - outflow_planned - outflow_obligations
+    closing = opening_balance + np.cumsum(net)
+
+    days = base + np.arange(n_days)
+    if granularity == "day":
+        keys = np.datetime_as_string(days, unit="D")
+        starts = np.arange(n_days)
+    else:
+        month_of_day = days.astype("datetime64[M]")
+        starts = np.nonzero(np.concatenate([[True], month_of_day[1:] != month_of_day[:-1]]))[0]
+        keys = np.datetime_as_string(month_of_day[starts], unit="M")
+    ends = np.append(starts[1:], n_days) - 1
+    columns = {
+        "inflow_ar": np.add.reduceat(inflow_ar, starts),
+        "outflow_planned": np.add.reduceat(outflow_planned, starts),
+        "outflow_obligations": np.add.reduceat(outflow_obligations, starts),
+        "net": np.add.reduceat(net, starts),
+        "closing": closing[ends],
+    }
+    series = [
+        {"period": str(k), **{name: float(col[i]) for name, col in columns.items()}}
+        for i, k in enumerate(keys)
+    ]
+    low = int(np.argmin(closing))
+
+    return {
+        "as_of": today.isoformat(),
+        "range": {"from": first_day.isoformat(), "to": last_day.isoformat()},
+        "months": months,
+        "granularity": granularity,
+        "opening_balance": opening_balance,
+        "series": series,
+        "totals": {
+            "inflow_ar": float(inflow_ar.sum()),
+            "outflow_planned": float(outflow_planned.sum()),
+            "outflow_obligations": float(outflow_obligations.sum()),
+            "closing": float(closing[-1]),
+        },
+        "min_closing": {"date": str(days[low]), "closing": float(closing[low])},
+        "ar": {
+            "expected_in_horizon": float(inflow_ar.sum()),
+            "beyond_horizon": ar_beyond,
+            "invoices_without_client_history": invoices_without_history,
+        },
+        "projected_obligations": projected_obligations,
+        "income_limits": await _income_limit_projection(db, today, last_day),
+    }
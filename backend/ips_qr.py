@@ -0,0 +1,231 @@
+"""IPS QR (NBS): строка платёжного поручения и изображения QR на сервере.
+
+Строка — по стандарту NBS IPS: K:PR|V:01|C:1|R:<18 цифр счёта>|N:<получатель>|I:RSD<сумма>|
+P:<плательщик>|SF:<шифра>|S:<сврха>|RO:<модель+позив>. Изображение (PNG или SVG) адресуется
+sha256 от строки и формата: LRU в памяти процесса (IPS_QR_CACHE_ENTRIES) и файлы <хеш>.<формат>
+в IPS_QR_CACHE_DIR — одно и то же поручение рендерится один раз, после перезапуска читается с диска.
+Рендер, чтение/запись файлов и сборка PDF — в рабочих потоках (asyncio.to_thread).
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+from typing import Literal, Optional
+
+import qrcode
+import qrcode.image.svg
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from backend.config import get_settings
+
+settings = get_settings()
+
+QRFormat = Literal["png", "svg"]
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Шрифт PDF с кириллицей и латиницей с диакритикой; без него — Helvetica
+FONT_CANDIDATES = ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/TTF/DejaVuSans.ttf")
+
+
+def account_digits(account: str) -> str:
+    """Счёт NNN-NNNNNNNNNNNNN-NN в 18 цифр (середина дополняется нулями до 13)."""
+    parts = account.replace(" ", "").split("-")
+    if len(parts) == 3 and all(p.isdigit() for p in parts):
+        return parts[0] + parts[1].zfill(13) + parts[2]
+    return "".join(ch for ch in account if ch.isdigit())
+
+
+def _text(value: Optional[str], limit: int) -> str:
+    """Значение поля: без разделителя | и переводов строк, не длиннее limit."""
+    return " ".join((value or "").replace("|", " ").split())[:limit]
+
+
+def ips_payload(
+    recipient: str,
+    account: str,
+    amount: float,
+    currency: str = "RSD",
+    payer: Optional[str] = None,
+    purpose: Optional[str] = None,
+    payment_code: Optional[str] = None,
+    model: Optional[str] = None,
+    reference: Optional[str] = None,
+) -> str:
+    """Строка IPS QR (платёжное поручение K:PR) по данным обязательства."""
+    fields = [
+        ("K", "PR"),
+        ("V", "01"),
+        ("C", "1"),
+        ("R", account_digits(account)),
+        ("N", _text(recipient, 70)),
+        ("I", f"{(currency or 'RSD').upper()}{amount:.2f}".replace(".", ",")),
+        ("P", _text(payer, 70)),
+        ("SF", _text(payment_code, 3) or "253"),
+        ("S", _text(purpose, 35)),
+    ]
+    ref = "".join((reference or "").split())
+    if ref:
+        fields.append(("RO", (model or "00").strip().zfill(2)[:2] + ref[:22]))
+    return "|".join(f"{k}:{v}" for k, v in fields if v)
+
+
+def payload_digest(payload: str, fmt: QRFormat) -> str:
+    return hashlib.sha256(f"{fmt}\n{payload}".encode("utf-8")).hexdigest()
+
+
+def _render(payload: str, fmt: QRFormat) -> bytes:
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=8, border=4)
+    qr.add_data(payload.encode("utf-8"))
+    qr.make(fit=True)
+    buffer = BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image().save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ImageCache:
+    """LRU изображений по хешу: память процесса, затем файл на диске, затем рендер."""
+
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: dict[str, asyncio.Future] = {}  # Рендер в процессе: одинаковые запросы ждут его
+        self.hits = 0
+        self.disk_hits = 0
+        self.renders = 0
+
+    def _get_memory(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+            return data
+
+    def _put_memory(self, digest: str, data: bytes) -> None:
+        with self._lock:
+            self._entries[digest] = data
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load_or_render(self, digest: str, payload: str, fmt: QRFormat) -> bytes:
+        """Синхронная часть (рабочий поток): файл кэша или рендер с атомарной записью файла."""
+        path = self.directory / f"{digest}.{fmt}"
+        try:
+            data = path.read_bytes()
+            with self._lock:
+                self.disk_hits += 1
+            return data
+        except FileNotFoundError:
+            pass
+        data = _render(payload, fmt)
+        with self._lock:
+            self.renders += 1
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # диск недоступен — остаётся кэш в памяти
+        return data
+
+    async def get(self, payload: str, fmt: QRFormat) -> tuple[str, bytes]:
+        """(хеш, изображение); промах памяти уходит в рабочий поток."""
+        digest = payload_digest(payload, fmt)
+        data = self._get_memory(digest)
+        if data is not None:
+            return digest, data
+        pending = self._pending.get(digest)
+        if pending is not None:
+            return digest, await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[digest] = future
+        try:
+            data = await asyncio.to_thread(self._load_or_render, digest, payload, fmt)
+            self._put_memory(digest, data)
+            future.set_result(data)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # ожидающих может не быть — не логировать «never retrieved»
+            raise
+        finally:
+            self._pending.pop(digest, None)
+        return digest, data
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "disk_hits": self.disk_hits, "renders": self.renders}
+
+
+qr_cache = ImageCache(settings.ips_qr_cache_dir, settings.ips_qr_cache_entries)
+
+
+def _pdf_font() -> str:
+    """Зарегистрировать TTF-шрифт (PDF_FONT_PATH или DejaVuSans) и вернуть имя; иначе Helvetica."""
+    if "IPSSans" in pdfmetrics.getRegisteredFontNames():
+        return "IPSSans"
+    for path in (settings.pdf_font_path, *FONT_CANDIDATES):
+        if path and Path(path).is_file():
+            pdfmetrics.registerFont(TTFont("IPSSans", path))
+            return "IPSSans"
+    return "Helvetica"
+
+
+def _build_sheet(title: str, slips: list[dict]) -> bytes:
+    """Синхронная сборка PDF (рабочий поток): по 4 поручения на страницу A4, QR слева, реквизиты справа."""
+    font = _pdf_font()
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    slot = (height - 3 * cm) / 4
+    for i, slip in enumerate(slips):
+        pos = i % 4
+        if pos == 0:
+            if i:
+                c.showPage()
+            c.setFont(font, 12)
+            c.drawString(1.5 * cm, height - 1.5 * cm, title)
+        top = height - 2 * cm - pos * slot
+        if slip["png"] is not None:
+            c.drawImage(ImageReader(BytesIO(slip["png"])), 1.5 * cm, top - 5 * cm, 5 * cm, 5 * cm)
+        else:
+            c.rect(1.5 * cm, top - 5 * cm, 5 * cm, 5 * cm)
+            c.setFont(font, 8)
+            c.drawCentredString(4 * cm, top - 2.5 * cm, "без IPS QR")
+        y = top - 0.6 * cm
+        c.setFont(font, 11)
+        c.drawString(7 * cm, y, slip["heading"])
+        c.setFont(font, 9)
+        for label, value in slip["lines"]:
+            y -= 0.55 * cm
+            c.drawString(7 * cm, y, f"{label}: {value}")
+        c.line(1.5 * cm, top - slot + 0.3 * cm, width - 1.5 * cm, top - slot + 0.3 * cm)
+    c.showPage()
+    c.save()
+    return buffer.getvalue()
+
+
+async def render_sheet(title: str, slips: list[dict]) -> bytes:
+    """
+    PDF с поручениями: slips — [{"payload" (None — без QR), "heading", "lines": [(подпись, значение), ...]}].
+    QR всех поручений рендерятся параллельно в рабочих потоках (через кэш), PDF собирается в потоке.
+    """
+    async def png(payload: Optional[str]) -> Optional[bytes]:
+        return (await qr_cache.get(payload, "png"))[1] if payload else None
+
+    images = await asyncio.gather(*(png(s["payload"]) for s in slips))
+    prepared = [{**s, "png": data} for s, data in zip(slips, images)]
+    return await asyncio.to_thread(_build_sheet, title, prepared)
@@ -0,0 +1,276 @@
+"""Дневной свод (daily_ledger_rollup): инкрементальное обновление при записи и полный пересчёт.
+
+Вклад записи в свод:
+- Income: revenue_accrual по issued_date (status != cancelled), измерения client/project/contract.
+- CashTransaction (type=income): revenue_cash по date, измерения берутся из связанного Income.
+- Expense: expense_accrual по date, expense_cash и taxes_cash по paid_date — сумма
+  effective_amount (сторно — отрицательной суммой своей датой, пара с оригиналом даёт 0),
+  измерения project/category/is_tax_related. effective_amount заполняется здесь же, до свода.
+
+Там же проставляются ключи периодов записей (period_keys); строки свода получают day_year/day_month/day_week.
+
+Обработчик before_flush вычитает старый вклад изменённых/удалённых объектов и
+добавляет новый — свод обновляется в той же транзакции, что и сами записи.
+Там же проверяется, что изменения не попадают в закрытые периоды (period_closing).
+Денежные меры при полном пересчёте берутся из журнала движения денег (money_journal),
+который ведётся по тем же правилам.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+
+from backend.models import Income, Expense, CashTransaction
+from backend.period_closing import ensure_periods_open
+from backend.period_keys import period_key_sql, period_key_values, refresh_period_columns
+
+MEASURES = ("revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash")
+
+INCOME_FIELDS = ("issued_date", "status", "amount_rsd", "client_id", "project_id", "contract_id")
+EXPENSE_FIELDS = ("date", "paid_date", "effective_amount", "project_id", "category", "is_tax_related")
+CASH_FIELDS = ("type", "source", "reference_id", "amount", "date")
+INCOME_DIMS = ("client_id", "project_id", "contract_id")
+
+# Ключ строки свода: (day, client_id, project_id, contract_id, category, is_tax_related)
+RollupKey = tuple[date, int, int, int, str, bool]
+
+
+def _key(
+    day: date,
+    client_id: Optional[int] = None,
+    project_id: Optional[int] = None,
+    contract_id: Optional[int] = None,
+    category: Optional[str] = None,
+    is_tax_related: Optional[bool] = False,
+) -> RollupKey:
+    return (day, client_id or 0, project_id or 0, contract_id or 0, category or "", bool(is_tax_related))
+
+
+def _old_values(obj, fields: tuple[str, ...]) -> dict:
+    """
+    Значения атрибутов до изменения (как в БД на начало flush). Не загруженные в объект
+    (истёк после expire/rollback, присвоение без загрузки) читаются из БД по ключу записи.
+    """
+    state = inspect(obj)
+    out = {}
+    missing = []
+    for f in fields:
+        v = state.committed_state[f] if f in state.committed_state else state.dict.get(f, NO_VALUE)
+        if v is NO_VALUE:
+            missing.append(f)
+            v = None
+        out[f] = v
+    if missing and state.key is not None and state.session is not None:
+        cls = type(obj)
+        row = state.session.connection().execute(
+            select(*(getattr(cls, f) for f in missing)).where(cls.id == state.key[1][0])
+        ).first()
+        if row is not None:
+            out.update(zip(missing, row))
+    return out
+
+
+def _new_values(obj, fields: tuple[str, ...]) -> dict:
+    return {f: getattr(obj, f) for f in fields}
+
+
+def income_contributions(v: dict) -> list[tuple[RollupKey, str, float]]:
+    if v["issued_date"] is None or (v["status"] or "issued") == "cancelled":
+        return []
+    key = _key(v["issued_date"], v["client_id"], v["project_id"], v["contract_id"])
+    return [(key, "revenue_accrual", float(v["amount_rsd"] or 0))]
+
+
+def effective_expense_amount(status: Optional[str], amount: Optional[float], reversal_of_id: Optional[int]) -> float:
+    """Вклад расхода в агрегаты: сторно — своей (отрицательной) суммой, аннулированная запись без сторно — 0."""
+    if reversal_of_id is None and (status or "paid") == "reversed":
+        return 0.0
+    return float(amount or 0)
+
+
+def _refresh_maintained_columns(session: Session) -> None:
+    """effective_amount расходов и ключи периодов дат — до сбора дельт и записи строк."""
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, Expense):
+            value = effective_expense_amount(obj.status, obj.amount, obj.reversal_of_id)
+            if obj.effective_amount != value:
+                obj.effective_amount = value
+        if isinstance(obj, (Income, Expense, CashTransaction)):
+            refresh_period_columns(obj)
+
+
+def expense_contributions(v: dict) -> list[tuple[RollupKey, str, float]]:
+    amount = float(v["effective_amount"] or 0)
+    if not amount:
+        return []
+    out = []
+    if v["date"] is not None:
+        out.append((_key(v["date"], None, v["project_id"], None, v["category"], v["is_tax_related"]), "expense_accrual", amount))
+    if v["paid_date"] is not None:
+        key = _key(v["paid_date"], None, v["project_id"], None, v["category"], v["is_tax_related"])
+        out.append((key, "expense_cash", amount))
+        if v["is_tax_related"]:
+            out.append((key, "taxes_cash", amount))
+    return out
+
+
+def cash_contributions(v: dict, dims: dict) -> list[tuple[RollupKey, str, float]]:
+    if v["type"] != "income" or v["date"] is None:
+        return []
+    key = _key(v["date"], dims.get("client_id"), dims.get("project_id"), dims.get("contract_id"))
+    return [(key, "revenue_cash", float(v["amount"] or 0))]
+
+
+def _income_dims(session: Session, v: dict, old: bool) -> dict:
+    """Измерения дохода, к которому относится денежная операция."""
+    if v["source"] != "invoice" or v["reference_id"] is None:
+        return {}
+    with session.no_autoflush:
+        income = session.get(Income, v["reference_id"])
+    if income is None:
+        return {}
+    return _old_values(income, INCOME_DIMS) if old else _new_values(income, INCOME_DIMS)
+
+
+def _collect_deltas(session: Session) -> dict[RollupKey, dict[str, float]]:
+    deltas: dict[RollupKey, dict[str, float]] = defaultdict(lambda: dict.fromkeys(MEASURES, 0.0))
+
+    def add(contribs, sign: float):
+        for key, measure, amount in contribs:
+            deltas[key][measure] += sign * amount
+
+    touched = set(session.new) | set(session.dirty) | set(session.deleted)
+    for obj in touched:
+        is_new = obj in session.new
+        is_deleted = obj in session.deleted
+        if isinstance(obj, Income):
+            if not is_new:
+                add(income_contributions(_old_values(obj, INCOME_FIELDS)), -1)
+            if not is_deleted:
+                add(income_contributions(_new_values(obj, INCOME_FIELDS)), +1)
+            if not is_new and not is_deleted:
+                old_dims = _old_values(obj, INCOME_DIMS)
+                new_dims = _new_values(obj, INCOME_DIMS)
+                if old_dims != new_dims:
+                    # Смена клиента/проекта/договора переносит и поступления по счёту
+                    with session.no_autoflush:
+                        cts = session.query(CashTransaction).filter(
+                            CashTransaction.source == "invoice",
+                            CashTransaction.reference_id == obj.id,
+                        ).all()
+                    for ct in cts:
+                        if ct in touched:
+                            continue
+                        cv = _new_values(ct, CASH_FIELDS)
+                        add(cash_contributions(cv, old_dims), -1)
+                        add(cash_contributions(cv, new_dims), +1)
+        elif isinstance(obj, Expense):
+            if not is_new:
+                add(expense_contributions(_old_values(obj, EXPENSE_FIELDS)), -1)
+            if not is_deleted:
+                add(expense_contributions(_new_values(obj, EXPENSE_FIELDS)), +1)
+        elif isinstance(obj, CashTransaction):
+            if not is_new:
+                old = _old_values(obj, CASH_FIELDS)
+                add(cash_contributions(old, _income_dims(session, old, old=True)), -1)
+            if not is_deleted:
+                new = _new_values(obj, CASH_FIELDS)
+                add(cash_contributions(new, _income_dims(session, new, old=False)), +1)
+
+    return {k: v for k, v in deltas.items() if any(abs(x) > 1e-9 for x in v.values())}
+
+
+UPSERT_SQL = text("""
+    INSERT INTO daily_ledger_rollup
+        (day, client_id, project_id, contract_id, category, is_tax_related, day_year, day_month, day_week,
+         revenue_accrual, revenue_cash, expense_accrual, expense_cash, taxes_cash)
+    VALUES
+        (:day, :client_id, :project_id, :contract_id, :category, :is_tax_related, :day_year, :day_month, :day_week,
+         :revenue_accrual, :revenue_cash, :expense_accrual, :expense_cash, :taxes_cash)
+    ON CONFLICT(day, client_id, project_id, contract_id, category, is_tax_related) DO UPDATE SET
+        revenue_accrual = revenue_accrual + excluded.revenue_accrual,
+        revenue_cash = revenue_cash + excluded.revenue_cash,
+        expense_accrual = expense_accrual + excluded.expense_accrual,
+        expense_cash = expense_cash + excluded.expense_cash,
+        taxes_cash = taxes_cash + excluded.taxes_cash
+""")
+
+
+def apply_deltas(session: Session, deltas: dict[RollupKey, dict[str, float]]) -> None:
+    if not deltas:
+        return
+    params = []
+    for (day, client_id, project_id, contract_id, category, is_tax), measures in deltas.items():
+        params.append({
+            "day": day.isoformat(),
+            "client_id": client_id,
+            "project_id": project_id,
+            "contract_id": contract_id,
+            "category": category,
+            "is_tax_related": int(is_tax),
+            **period_key_values("day", day),
+            **measures,
+        })
+    session.connection().execute(UPSERT_SQL, params)
+
+
+@event.listens_for(Session, "before_flush")
+def _rollup_before_flush(session: Session, flush_context, instances) -> None:
+    _refresh_maintained_columns(session)
+    deltas = _collect_deltas(session)
+    ensure_periods_open(session, (key[0] for key in deltas))
+    apply_deltas(session, deltas)
+
+
+# --- Полный пересчёт (backfill) ---
+
+# Все события журнала (строка — вклад одной записи в меры свода); основа пересчёта свода
+# и загрузки колоночного движка (analytics_engine). Денежные меры — из money_journal
+# (сторнирующие строки журнала гасят исходные при суммировании).
+LEDGER_EVENTS_SQL = """
+    SELECT i.date AS day, COALESCE(i.client_id, 0) AS client_id, COALESCE(i.project_id, 0) AS project_id,
+           COALESCE(i.contract_id, 0) AS contract_id, '' AS category, 0 AS is_tax_related,
+           i.amount_rsd AS ra, 0 AS rc, 0 AS ea, 0 AS ec, 0 AS tc
+    FROM income i
+    WHERE COALESCE(i.status, 'issued') != 'cancelled'
+    UNION ALL
+    SELECT e.date, 0, COALESCE(e.project_id, 0), 0, COALESCE(e.category, ''), COALESCE(e.is_tax_related, 0),
+           0, 0, e.effective_amount, 0, 0
+    FROM expenses e
+    WHERE e.effective_amount != 0
+    UNION ALL
+    SELECT j.entry_date, j.client_id, j.project_id, j.contract_id, j.category, j.is_tax_related,
+           0,
+           CASE WHEN j.direction = 'in' THEN j.amount ELSE 0 END,
+           0,
+           CASE WHEN j.direction = 'out' THEN -j.amount ELSE 0 END,
+           CASE WHEN j.direction = 'out' AND j.is_tax_related THEN -j.amount ELSE 0 END
+    FROM money_journal j
+"""
+
+_DAY_KEYS_SQL = ", ".join(period_key_sql("day"))
+
+REBUILD_SQL = [
+    "DELETE FROM daily_ledger_rollup",
+    f"""
+    INSERT INTO daily_ledger_rollup
+        (day, client_id, project_id, contract_id, category, is_tax_related, day_year, day_month, day_week,
+         revenue_accrual, revenue_cash, expense_accrual, expense_cash, taxes_cash)
+    SELECT day, client_id, project_id, contract_id, category, is_tax_related, {_DAY_KEYS_SQL},
+           SUM(ra), SUM(rc), SUM(ea), SUM(ec), SUM(tc)
+    FROM ({LEDGER_EVENTS_SQL})
+    GROUP BY day, client_id, project_id, contract_id, category, is_tax_related
+    """,
+]
+
+
+async def rebuild_daily_ledger_rollup(db: AsyncSession) -> int:
+    """Пересчитать свод с нуля по income/expenses и журналу движения денег. Возвращает число строк."""
+    for sql in REBUILD_SQL:
+        await db.execute(text(sql))
+    r = await db.execute(text("SELECT COUNT(*) FROM daily_ledger_rollup"))
+    return int(r.scalar() or 0)
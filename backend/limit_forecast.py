@@ -0,0 +1,168 @@
+"""Прогноз превышения лимитов паушала методом Монте-Карло.
+
+История — дневной доход (revenue_accrual свода, без аннулированных счетов — как в статусе лимитов
+дашборда и ряде по дням) за последние limit_forecast_history_days дней; current — тот же доход с 1 января
+и за 12 месяцев, что в get_income_limit_status. Каждый будущий день (с завтра на 12 месяцев вперёд) заполняется
+случайным днём истории (бутстрап): method=client — для каждого клиента независимо, доходы
+клиентов складываются; method=total — по дневной сумме всех клиентов.
+Пути считаются матрицами NumPy (путь × день): накопленная сумма, первый день выше лимита — argmax по маске.
+- 6 млн — доход с 1 января, до конца текущего года;
+- 8 млн — скользящее окно [день − 12 месяцев, день] до конца горизонта (факт окна + симуляция).
+
+Симуляция выполняется в рабочем потоке (asyncio.to_thread), результат кэшируется по версии
+данных (result_cache) — дашборд и остальные запросы расчёт не ждут. Требует numpy.
+"""
+import asyncio
+from datetime import date, timedelta
+from typing import Literal, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.config import get_settings
+from backend.models import DailyLedgerRollup
+
+try:
+    import numpy as np
+except ImportError:  # прогноз необязателен
+    np = None
+
+settings = get_settings()
+
+MAX_PATHS = 10000
+
+
+def limit_forecast_available() -> bool:
+    return np is not None
+
+
+async def _daily_income_by_client(db: AsyncSession, start: date, end: date):
+    """Дневной доход за [start, end] матрицей клиент × день (клиент 0 — без клиента)."""
+    R = DailyLedgerRollup
+    r = await db.execute(
+        select(R.day, R.client_id, func.sum(R.revenue_accrual))
+        .where(R.day >= start, R.day <= end)
+        .group_by(R.day, R.client_id)
+    )
+    rows = r.fetchall()
+    clients = sorted({row[1] for row in rows})
+    pos = {c: i for i, c in enumerate(clients)}
+    matrix = np.zeros((len(clients), (end - start).days + 1))
+    for day, client_id, amount in rows:
+        matrix[pos[client_id], (day - start).days] += float(amount or 0)
+    return clients, matrix
+
+
+def _simulate_daily(history, paths: int, days: int, method: str, rng):
+    """Матрица путь × день: будущий дневной доход из случайных дней истории (клиент × день)."""
+    n_hist = history.shape[1]
+    if method == "total":
+        return history.sum(axis=0)[rng.integers(n_hist, size=(paths, days))]
+    out = np.zeros((paths, days))
+    for row in history:
+        if row.any():
+            out += row[rng.integers(n_hist, size=(paths, days))]
+    return out
+
+
+def _crossing(over, first_day: date, already: bool, values_at_end) -> dict:
+    """Вероятность и даты превышения по маске путь × день (over), плюс перцентили итоговой суммы."""
+    crossed = over.any(axis=1) if over.shape[1] else np.zeros(over.shape[0], dtype=bool)
+    result = {
+        "already_exceeded": already,
+        "probability": 1.0 if already else round(float(crossed.mean()), 4),
+        "expected_date": None,
+        "date_p10": None,
+        "date_p50": None,
+        "date_p90": None,
+    }
+    if already:
+        for name in ("expected_date", "date_p10", "date_p50", "date_p90"):
+            result[name] = (first_day - timedelta(days=1)).isoformat()
+    elif crossed.any():
+        first = over.argmax(axis=1)[crossed]
+        p10, p50, p90 = np.percentile(first, [10, 50, 90], method="lower")
+        for name, offset in (("expected_date", round(float(first.mean()))), ("date_p10", p10), ("date_p50", p50), ("date_p90", p90)):
+            result[name] = (first_day + timedelta(days=int(offset))).isoformat()
+    p50, p90 = np.percentile(values_at_end, [50, 90]) if len(values_at_end) else (0.0, 0.0)
+    result["total_p50"] = round(float(p50), 2)
+    result["total_p90"] = round(float(p90), 2)
+    return result
+
+
+def _run_simulation(history, actual, actual_start: date, today: date, paths: int, method: str, seed: int) -> dict:
+    """Синхронная часть (в рабочем потоке): пути, окна лимитов, вероятности и даты превышения."""
+    first_day = today + timedelta(days=1)
+    horizon_end = today + relativedelta(months=12)
+    n_days = (horizon_end - today).days
+    n_year = (date(today.year, 12, 31) - today).days  # дней до конца года после today
+
+    rng = np.random.default_rng(seed)
+    cum = np.cumsum(_simulate_daily(history, paths, n_days, method, rng), axis=1)
+
+    prefix = np.concatenate([[0.0], np.cumsum(actual)])
+    ytd_actual = float(prefix[-1] - prefix[(date(today.year, 1, 1) - actual_start).days])
+    # Факт окна 12 месяцев будущего дня: [день − 12 месяцев, today] (окно не выходит за начало горизонта)
+    window_starts = np.array([
+        (first_day + timedelta(days=t) - relativedelta(months=12) - actual_start).days for t in range(n_days)
+    ])
+    actual_12m = prefix[-1] - prefix[window_starts]
+    income_12m_now = float(prefix[-1] - prefix[(today - relativedelta(months=12) - actual_start).days])
+
+    limit_6m = settings.income_limit_pausal
+    limit_8m = settings.income_limit_vat
+    year_income = ytd_actual + cum[:, :n_year]
+    rolling_12m = actual_12m + cum
+
+    return {
+        "limit_6m": {
+            "limit": limit_6m,
+            "horizon_to": date(today.year, 12, 31).isoformat(),
+            "current": round(ytd_actual, 2),
+            **_crossing(
+                year_income > limit_6m, first_day, ytd_actual > limit_6m,
+                year_income[:, -1] if n_year else np.full(paths, ytd_actual),
+            ),
+        },
+        "limit_8m": {
+            "limit": limit_8m,
+            "horizon_to": horizon_end.isoformat(),
+            "current": round(income_12m_now, 2),
+            **_crossing(rolling_12m > limit_8m, first_day, income_12m_now > limit_8m, rolling_12m.max(axis=1)),
+        },
+    }
+
+
+async def get_income_limit_forecast(
+    db: AsyncSession,
+    paths: Optional[int] = None,
+    method: Literal["client", "total"] = "client",
+    today: Optional[date] = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Вероятность и ожидаемая дата превышения лимитов 6 млн (до конца года) и 8 млн (12 месяцев вперёд).
+    total_p50/total_p90: 6 млн — доход года на 31 декабря, 8 млн — максимум скользящих 12 месяцев на горизонте.
+    """
+    today = today or date.today()
+    paths = max(1, min(paths or settings.limit_forecast_paths, MAX_PATHS))
+    history_start = today - timedelta(days=settings.limit_forecast_history_days - 1)
+    actual_start = min(history_start, today - relativedelta(months=12), date(today.year, 1, 1))
+    _, matrix = await _daily_income_by_client(db, actual_start, today)
+    history = matrix[:, (history_start - actual_start).days:]
+    actual = matrix.sum(axis=0)
+
+    result = await asyncio.to_thread(_run_simulation, history, actual, actual_start, today, paths, method, seed)
+    return {
+        "as_of": today.isoformat(),
+        "paths": paths,
+        "method": method,
+        "history": {
+            "from": history_start.isoformat(),
+            "to": today.isoformat(),
+            "clients": sum(1 for row in history if row.any()),
+            "total": float(history.sum()),
+        },
+        **result,
+    }
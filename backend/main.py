@@ -1,6 +1,7 @@
 """Главный модуль приложения ProspEl."""
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from backend.database import init_db
@@ -21,6 +22,11 @@ from backend.routers.expenses_router import router as expenses_router
 from backend.routers.planned_expenses_router import router as planned_expenses_router
 from backend.routers.bank_import_router import router as bank_import_router
 from backend.routers.projects_router import router as projects_router
+from backend.routers.periods_router import router as periods_router
+from backend.routers.scheduler_router import router as scheduler_router
+from backend.config import get_settings
+from backend.scheduler import scheduler
+from backend.period_closing import ClosedPeriodError
 
 
 @asynccontextmanager
@@ -46,8 +52,11 @@ async def lifespan(app: FastAPI):
         from backend.payments_service import ensure_payment_types
         await ensure_payment_types(db)
         await db.commit()
+    # Фоновые задачи (просрочка обязательств, агрегаты) — вне запросов
+    if get_settings().scheduler_enabled:
+        await scheduler.start()
     yield
-    # cleanup if needed
+    await scheduler.stop()
 
 
 app = FastAPI(
@@ -81,6 +90,14 @@ app.include_router(dashboard_router, prefix="/api")
 app.include_router(enterprise_router, prefix="/api")
 app.include_router(reports_router, prefix="/api")
 app.include_router(finance_router, prefix="/api")
+app.include_router(periods_router, prefix="/api")
+app.include_router(scheduler_router, prefix="/api")
+
+
+@app.exception_handler(ClosedPeriodError)
+async def closed_period_handler(request: Request, exc: ClosedPeriodError):
+    """Запись в закрытый период — 409."""
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
 
 
 @app.get("/")
@@ -0,0 +1,335 @@
+"""Версионированные миграции схемы БД.
+
+Выполняются при запуске (init_db) после create_all: каждая миграция
+применяется один раз, номер записывается в schema_migrations.
+"""
+from datetime import datetime
+from typing import Callable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from backend.cash_checkpoints import refresh_cash_checkpoints, rebuild_cash_checkpoints_sync
+from backend.database import Base
+from backend.ledger_rollup import REBUILD_SQL as ROLLUP_REBUILD_SQL
+from backend.money_journal import sync_money_journal
+from backend.period_keys import period_key_sql
+from backend.payments_service import sync_obligation_grid
+from backend.services import reconcile_number_sequences
+
+
+def _column_ddl(conn: Connection, column) -> str:
+    """DDL колонки для ALTER TABLE ADD COLUMN (без NOT NULL — SQLite требует DEFAULT)."""
+    ddl = f"{column.name} {column.type.compile(dialect=conn.dialect)}"
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if isinstance(default, bool):
+        ddl += f" DEFAULT {int(default)}"
+    elif isinstance(default, (int, float)):
+        ddl += f" DEFAULT {default}"
+    elif isinstance(default, str):
+        ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+    return ddl
+
+
+def add_column_if_missing(conn: Connection, table: str, ddl: str) -> bool:
+    """Добавить колонку, если её нет. ddl: 'name TYPE [DEFAULT ...]'."""
+    name = ddl.split()[0]
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if name in existing:
+        return False
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+    return True
+
+
+def _add_model_columns(conn: Connection) -> set[tuple[str, str]]:
+    """Добавить колонки моделей, которых нет в таблицах. Возвращает (таблица, колонка) добавленных."""
+    insp = inspect(conn)
+    tables = set(insp.get_table_names())
+    added = set()
+    for table in Base.metadata.tables.values():
+        if table.name not in tables:
+            continue
+        existing = {c["name"] for c in insp.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or column.primary_key:
+                continue
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(conn, column)}"))
+            added.add((table.name, column.name))
+    return added
+
+
+def _m001_add_missing_columns(conn: Connection) -> None:
+    """Старые БД: добавить колонки моделей, которых нет в таблицах."""
+    added = _add_model_columns(conn)
+    if ("income", "status") in added:
+        # ПАКЕТ 1: старые записи — status='paid' если paid_date есть, иначе 'issued'
+        conn.execute(text(
+            "UPDATE income SET status = CASE WHEN paid_date IS NOT NULL THEN 'paid' ELSE 'issued' END, "
+            "is_paid = CASE WHEN paid_date IS NOT NULL THEN 1 ELSE 0 END"
+        ))
+
+
+# Индексы горячих запросов: finance_service, dashboard_router, bank_import_router.
+# Порядок колонок: сначала равенство/диапазон из WHERE, затем покрываемые колонки (без обращения к таблице).
+HOT_PATH_INDEXES = [
+    # accrual: date BETWEEN, status != cancelled, SUM(amount_rsd)
+    "CREATE INDEX IF NOT EXISTS ix_income_date_status_amount ON income (date, status, amount_rsd)",
+    # cash: paid_date BETWEEN; AR: paid_date IS NULL ORDER BY date
+    "CREATE INDEX IF NOT EXISTS ix_income_paid_date ON income (paid_date, date, status, amount_rsd)",
+    "CREATE INDEX IF NOT EXISTS ix_income_client_date ON income (client_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_income_project_date ON income (project_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_income_bank_reference ON income (bank_reference)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_date_status_amount ON expenses (date, status, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_paid_date ON expenses (paid_date, status, is_tax_related, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_project_date ON expenses (project_id, date)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_bank_reference ON expenses (bank_reference)",
+    "CREATE INDEX IF NOT EXISTS ix_cash_transactions_type_date ON cash_transactions (type, date, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_cash_transactions_source_ref ON cash_transactions (source, reference_id)",
+    "CREATE INDEX IF NOT EXISTS ix_monthly_obligations_status_deadline ON monthly_obligations (status, deadline)",
+    "CREATE INDEX IF NOT EXISTS ix_monthly_obligations_payment_reference ON monthly_obligations (payment_reference)",
+    "CREATE INDEX IF NOT EXISTS ix_year_decisions_year_type ON year_decisions (year, payment_type_id)",
+    "CREATE INDEX IF NOT EXISTS ix_planned_expense_payments_due ON planned_expense_payments (planned_expense_id, due_date)",
+]
+
+
+# Агрегаты расходов по effective_amount (покрывающие: диапазон дат + сумма)
+EXPENSE_EFFECTIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_expenses_date_effective ON expenses (date, effective_amount)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_paid_date_effective ON expenses (paid_date, effective_amount)",
+]
+
+
+def _m002_hot_path_indexes(conn: Connection) -> None:
+    for ddl in HOT_PATH_INDEXES:
+        conn.execute(text(ddl))
+    if conn.dialect.name == "sqlite":
+        # Статистика для планировщика после создания индексов
+        conn.execute(text("ANALYZE"))
+
+
+def _m003_backfill_daily_ledger_rollup(conn: Connection) -> None:
+    """Заполнить daily_ledger_rollup по существующим записям (денежные меры — из журнала)."""
+    sync_money_journal(conn)
+    for sql in ROLLUP_REBUILD_SQL:
+        conn.execute(text(sql))
+
+
+def _m004_cash_balance_checkpoints(conn: Connection) -> None:
+    """Построить месячные точки остатка по своду."""
+    refresh_cash_checkpoints(conn)
+
+
+def _m005_period_closures_unique(conn: Connection) -> None:
+    """Один закрытый период на (year, month); снапшоты создаёт create_all."""
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_period_closures_year_month ON period_closures (year, month)"
+    ))
+
+
+def _m006_money_journal_backfill(conn: Connection) -> None:
+    """Журнал движения денег по существующим поступлениям и оплаченным расходам."""
+    sync_money_journal(conn)
+
+
+def _m007_expense_effective_amount(conn: Connection) -> None:
+    """
+    effective_amount расходов (сторно — своей отрицательной суммой), индексы агрегатов по нему;
+    свод, журнал и точки остатка пересчитываются по новому правилу.
+    """
+    add_column_if_missing(conn, "expenses", "effective_amount FLOAT NOT NULL DEFAULT 0")
+    conn.execute(text(
+        "UPDATE expenses SET effective_amount = "
+        "CASE WHEN reversal_of_id IS NULL AND COALESCE(status, 'paid') = 'reversed' THEN 0 ELSE amount END"
+    ))
+    for ddl in EXPENSE_EFFECTIVE_INDEXES:
+        conn.execute(text(ddl))
+    sync_money_journal(conn)
+    for sql in ROLLUP_REBUILD_SQL:
+        conn.execute(text(sql))
+    rebuild_cash_checkpoints_sync(conn)
+
+
+# Ключи периодов (period_keys): (таблица, колонка даты, префикс ключей)
+PERIOD_KEY_COLUMNS = [
+    ("income", "date", "issued"),
+    ("income", "paid_date", "paid"),
+    ("expenses", "date", "date"),
+    ("expenses", "paid_date", "paid"),
+    ("cash_transactions", "date", "date"),
+    ("daily_ledger_rollup", "day", "day"),
+    ("money_journal", "entry_date", "entry"),
+]
+
+# Группировка по году/месяцу/неделе — обход индекса: ключ периода первым (условие period_key_bounds
+# дублирует диапазон дат), затем покрываемые колонки
+PERIOD_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_income_issued_period ON income (issued_year, issued_month, status, amount_rsd)",
+    "CREATE INDEX IF NOT EXISTS ix_income_paid_period ON income (paid_year, paid_month, amount_rsd)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_date_period ON expenses (date_year, date_month, effective_amount)",
+    "CREATE INDEX IF NOT EXISTS ix_expenses_paid_period ON expenses "
+    "(paid_year, paid_month, is_tax_related, effective_amount)",
+    "CREATE INDEX IF NOT EXISTS ix_cash_transactions_period ON cash_transactions (type, date_year, date_month, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_daily_ledger_rollup_year ON daily_ledger_rollup (day_year, day)",
+    "CREATE INDEX IF NOT EXISTS ix_daily_ledger_rollup_month ON daily_ledger_rollup (day_month, day)",
+    "CREATE INDEX IF NOT EXISTS ix_daily_ledger_rollup_week ON daily_ledger_rollup (day_week, day)",
+    "CREATE INDEX IF NOT EXISTS ix_money_journal_year ON money_journal (entry_year, entry_date, direction, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_money_journal_month ON money_journal (entry_month, entry_date, direction, amount)",
+    "CREATE INDEX IF NOT EXISTS ix_money_journal_week ON money_journal (entry_week, entry_date, direction, amount)",
+]
+
+
+def _m008_period_keys(conn: Connection) -> None:
+    """Заполнить ключи периодов (год, YYYYMM, ISO-неделя) по датам и построить индексы группировки."""
+    for table, column, prefix in PERIOD_KEY_COLUMNS:
+        year, month, week = period_key_sql(column)
+        conn.execute(text(
+            f"UPDATE {table} SET {prefix}_year = {year}, {prefix}_month = {month}, {prefix}_week = {week} "
+            f"WHERE {column} IS NOT NULL"
+        ))
+    for ddl in PERIOD_INDEXES:
+        conn.execute(text(ddl))
+    if conn.dialect.name == "sqlite":
+        conn.execute(text("ANALYZE"))
+
+
+def _m009_number_sequences(conn: Connection) -> None:
+    """Засеять счётчики номеров счетов и договоров максимальными уже выданными NNNN по годам."""
+    reconcile_number_sequences(conn)
+
+
+def _m010_obligation_grid(conn: Connection) -> None:
+    """
+    Уникальность обязательства (year, month, payment_type_id): дубликаты удаляются (остаётся
+    оплаченное, затем первое), затем уникальный индекс и сетки всех лет с решениями.
+    """
+    conn.execute(text("""
+        DELETE FROM monthly_obligations WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY year, month, payment_type_id ORDER BY status = 'paid' DESC, id
+                ) AS rn
+                FROM monthly_obligations
+            ) WHERE rn > 1
+        )
+    """))
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_monthly_obligations_period "
+        "ON monthly_obligations (year, month, payment_type_id)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_monthly_obligations_period"))
+    conn.execute(text("UPDATE year_decisions SET version = 1 WHERE version IS NULL"))
+    for (year,) in conn.execute(text("SELECT DISTINCT year FROM year_decisions")).fetchall():
+        sync_obligation_grid(conn, year)
+
+
+MIGRATIONS: list[tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add_missing_columns", _m001_add_missing_columns),
+    (2, "hot_path_indexes", _m002_hot_path_indexes),
+    (3, "backfill_daily_ledger_rollup", _m003_backfill_daily_ledger_rollup),
+    (4, "cash_balance_checkpoints", _m004_cash_balance_checkpoints),
+    (5, "period_closures_unique", _m005_period_closures_unique),
+    (6, "money_journal_backfill", _m006_money_journal_backfill),
+    (7, "expense_effective_amount", _m007_expense_effective_amount),
+    (8, "period_keys", _m008_period_keys),
+    (9, "number_sequences", _m009_number_sequences),
+    (10, "obligation_grid", _m010_obligation_grid),
+]
+
+
+def run_migrations(conn: Connection) -> list[int]:
+    """Применить недостающие миграции. Возвращает номера применённых."""
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+    done = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    if 1 in done and any(version not in done for version, _, _ in MIGRATIONS):
+        # Колонки новых версий моделей нужны уже промежуточным миграциям (вставки свода и журнала)
+        _add_model_columns(conn)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        fn(conn)
+        conn.execute(
+            text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+            {"v": version, "n": name, "t": datetime.utcnow()},
+        )
+        applied.append(version)
+    return applied
+
+
+# Горячие запросы (в том виде, как их строит ORM) для EXPLAIN QUERY PLAN
+HOT_QUERIES: list[tuple[str, str]] = [
+    (
+        "finance.summary_rollup",
+        "SELECT day_month AS period, SUM(revenue_accrual), SUM(revenue_cash), "
+        "SUM(expense_accrual), SUM(expense_cash), SUM(taxes_cash) FROM daily_ledger_rollup "
+        "WHERE day >= :from AND day <= :to AND day_month >= 202501 AND day_month <= 202512 GROUP BY day_month",
+    ),
+    (
+        "finance.accounts_receivable",
+        "SELECT id, date, amount_rsd FROM income WHERE status != 'cancelled' AND paid_date IS NULL ORDER BY date",
+    ),
+    (
+        "finance.by_project_rollup",
+        "SELECT project_id, SUM(revenue_accrual), SUM(expense_accrual) FROM daily_ledger_rollup "
+        "WHERE day >= :from AND day <= :to GROUP BY project_id",
+    ),
+    (
+        "finance.cashflow_journal",
+        "SELECT entry_month AS period, SUM(CASE WHEN direction = 'in' THEN amount ELSE 0 END), "
+        "SUM(CASE WHEN direction = 'out' THEN amount ELSE 0 END) FROM money_journal "
+        "WHERE entry_date >= :from AND entry_date <= :to AND entry_month >= 202501 AND entry_month <= 202512 "
+        "GROUP BY entry_month",
+    ),
+    (
+        "dashboard.year_income",
+        "SELECT SUM(amount_rsd) FROM income WHERE issued_year = 2025",
+    ),
+    (
+        "dashboard.month_income",
+        "SELECT SUM(amount_rsd) FROM income WHERE issued_year = 2025 AND issued_month = 202501",
+    ),
+    (
+        "finance.cashflow_journal_week",
+        "SELECT entry_week, SUM(amount) FROM money_journal "
+        "WHERE entry_date >= :from AND entry_date <= :to AND entry_week >= 202501 AND entry_week <= 202601 "
+        "GROUP BY entry_week",
+    ),
+    (
+        "dashboard.year_expenses",
+        "SELECT SUM(expense_accrual) FROM daily_ledger_rollup WHERE day >= :from AND day <= :to",
+    ),
+    (
+        "expenses.effective_by_date",
+        "SELECT SUM(effective_amount) FROM expenses WHERE date >= :from AND date <= :to",
+    ),
+    (
+        "dashboard.obligations",
+        "SELECT * FROM monthly_obligations WHERE year = 2025 AND month = 1 AND payment_type_id = 1",
+    ),
+    (
+        "bank_import.income_duplicate",
+        "SELECT id FROM income WHERE bank_reference = 'REF'",
+    ),
+    (
+        "bank_import.expense_duplicate",
+        "SELECT id FROM expenses WHERE bank_reference = 'REF'",
+    ),
+    (
+        "bank_import.obligation_match",
+        "SELECT * FROM monthly_obligations WHERE status IN ('unpaid', 'overdue') "
+        "AND deadline >= :from AND deadline <= :to",
+    ),
+]
+
+
+def explain_hot_queries(conn: Connection) -> dict[str, list[str]]:
+    """EXPLAIN QUERY PLAN для каждого горячего запроса (только SQLite)."""
+    params = {"from": "2025-01-01", "to": "2025-12-31"}
+    plans = {}
+    for name, sql in HOT_QUERIES:
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params).fetchall()
+        plans[name] = [str(row[-1]) for row in rows]
+    return plans
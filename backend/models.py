@@ -1,7 +1,9 @@
 """Модели базы данных ProspEl."""
 from datetime import datetime, date
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Text, Float, Boolean, Date, DateTime, ForeignKey, Enum, UniqueConstraint
+from sqlalchemy import (
+    Column, Integer, String, Text, Float, Boolean, Date, DateTime, ForeignKey, Enum, UniqueConstraint, Index,
+)
 from sqlalchemy.orm import relationship
 from backend.database import Base
 import enum
@@ -122,6 +124,7 @@ class YearDecision(Base):
     currency = Column(String(5), default="RSD")
     is_provisional = Column(Boolean, default=False)  # Привремене аконтације
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Растёт при каждом изменении (штамп сетки обязательств)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -132,6 +135,9 @@ class YearDecision(Base):
 class MonthlyObligation(Base):
     """Месячное обязательство: год, месяц, тип, сумма, дедлайн, статус."""
     __tablename__ = "monthly_obligations"
+    __table_args__ = (
+        Index("uq_monthly_obligations_period", "year", "month", "payment_type_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     year = Column(Integer, nullable=False)
@@ -140,7 +146,7 @@ class MonthlyObligation(Base):
     decision_id = Column(Integer, ForeignKey("year_decisions.id"))
     amount = Column(Float, nullable=False)
     deadline = Column(Date, nullable=False)  # 15-е число месяца, следующего за отчётным
-    status = Column(String(20), default="unpaid")  # unpaid, paid, overdue
+    status = Column(String(20), default="unpaid")  # unpaid, paid (overdue на чтении — по deadline)
     paid_date = Column(Date)
     payment_reference = Column(String(100))
     payment_method = Column(String(20), default="manual")  # manual, bank_import
@@ -152,6 +158,15 @@ class MonthlyObligation(Base):
     decision = relationship("YearDecision", back_populates="obligations")
 
 
+class ObligationGrid(Base):
+    """Сетка обязательств года: штамп решений (id:version:is_active), по которому она построена."""
+    __tablename__ = "obligation_grids"
+
+    year = Column(Integer, primary_key=True)
+    decisions_stamp = Column(Text, nullable=False, default="")
+    generated_at = Column(DateTime, default=datetime.utcnow)
+
+
 class InvoiceSequence(Base):
     """Счётчик номеров счетов по годам (блокировка конкуренции при присвоении YYYY-NNNN)."""
     __tablename__ = "invoice_sequence"
@@ -160,6 +175,14 @@ class InvoiceSequence(Base):
     last_number = Column(Integer, nullable=False, default=0)
 
 
+class ContractSequence(Base):
+    """Счётчик номеров договоров по годам даты договора (формат YYYY-NNNN)."""
+    __tablename__ = "contract_sequence"
+
+    year = Column(Integer, primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)
+
+
 class ProjectSequence(Base):
     """Счётчик кодов проектов по годам (формат PR-YYYY-NNNN)."""
     __tablename__ = "project_sequence"
@@ -204,6 +227,10 @@ class CashTransaction(Base):
     reference_id = Column(Integer, nullable=False)  # income.id или expense.id
     amount = Column(Float, nullable=False)
     date = Column(Date, nullable=False)
+    # Ключи периодов даты (period_keys): YYYY, YYYYMM, ISO-неделя YYYYWW
+    date_year = Column(Integer)
+    date_month = Column(Integer)
+    date_week = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
@@ -225,6 +252,13 @@ class Income(Base):
     is_paid = Column(Boolean, default=False)
     paid_date = Column(Date)
     status = Column(String(20), nullable=False, default="issued")  # issued | paid | cancelled
+    # Ключи периодов дат счёта и оплаты (period_keys): YYYY, YYYYMM, ISO-неделя YYYYWW
+    issued_year = Column(Integer)
+    issued_month = Column(Integer)
+    issued_week = Column(Integer)
+    paid_year = Column(Integer)
+    paid_month = Column(Integer)
+    paid_week = Column(Integer)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
     income_type = Column(String(20), nullable=True)  # advance | intermediate | final | other
     note = Column(Text)
@@ -326,6 +360,16 @@ class Expense(Base):
     source = Column(String(20), nullable=False, default="manual")  # manual | planned | obligation | bank_import
     reversed_expense_id = Column(Integer, ForeignKey("expenses.id"), nullable=True)  # id сторнирующей записи
     reversal_of_id = Column(Integer, ForeignKey("expenses.id"), nullable=True)  # id сторнируемой записи
+    # Вклад в агрегаты расходов (ведётся при записи, ledger_rollup): amount, у сторно — отрицательная
+    # сумма своей датой; 0 — аннулированная запись без сторно (status=reversed, reversal_of_id пуст)
+    effective_amount = Column(Float, nullable=False, default=0)
+    # Ключи периодов date и paid_date (period_keys): YYYY, YYYYMM, ISO-неделя YYYYWW
+    date_year = Column(Integer)
+    date_month = Column(Integer)
+    date_week = Column(Integer)
+    paid_year = Column(Integer)
+    paid_month = Column(Integer)
+    paid_week = Column(Integer)
     note = Column(Text)
     project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -336,9 +380,86 @@ class Expense(Base):
     reversed_by = relationship("Expense", remote_side=[id], foreign_keys=[reversed_expense_id])
 
 
+class DailyLedgerRollup(Base):
+    """Дневные агрегаты доходов/расходов по измерениям. Обновляется в той же транзакции, что и записи (ledger_rollup)."""
+    __tablename__ = "daily_ledger_rollup"
+    __table_args__ = (
+        UniqueConstraint(
+            "day", "client_id", "project_id", "contract_id", "category", "is_tax_related",
+            name="uq_daily_ledger_rollup_key",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    # Ключи периодов дня (period_keys): группировка отчётов без strftime
+    day_year = Column(Integer)
+    day_month = Column(Integer)
+    day_week = Column(Integer)
+    # Измерения: 0 / "" = не задано (NULL не годится для уникального ключа)
+    client_id = Column(Integer, nullable=False, default=0)
+    project_id = Column(Integer, nullable=False, default=0)
+    contract_id = Column(Integer, nullable=False, default=0)
+    category = Column(String(50), nullable=False, default="")
+    is_tax_related = Column(Boolean, nullable=False, default=False)
+    revenue_accrual = Column(Float, nullable=False, default=0)
+    revenue_cash = Column(Float, nullable=False, default=0)
+    expense_accrual = Column(Float, nullable=False, default=0)
+    expense_cash = Column(Float, nullable=False, default=0)
+    taxes_cash = Column(Float, nullable=False, default=0)
+
+
+class MoneyJournalEntry(Base):
+    """
+    Журнал движения денег (только добавление). Строка — поступление (direction=in, amount > 0)
+    или выплата (out, amount < 0). Изменение/удаление источника — сторнирующая строка
+    (reverses_id, сумма с обратным знаком) и новая строка. Ведётся money_journal.
+    """
+    __tablename__ = "money_journal"
+    __table_args__ = (
+        Index("ix_money_journal_date", "entry_date", "direction", "amount"),
+        Index("ix_money_journal_reference", "reference_type", "reference_id"),
+        Index("ix_money_journal_reverses", "reverses_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    entry_date = Column(Date, nullable=False)
+    entry_year = Column(Integer)
+    entry_month = Column(Integer)
+    entry_week = Column(Integer)
+    amount = Column(Float, nullable=False)  # со знаком: + поступление, − выплата
+    direction = Column(String(3), nullable=False)  # in | out
+    source = Column(String(30), nullable=False)  # invoice | manual | planned | obligation | bank_import ...
+    reference_type = Column(String(30), nullable=False)  # cash_transaction | expense
+    reference_id = Column(Integer, nullable=False)
+    # Измерения как в daily_ledger_rollup: 0 / "" = не задано
+    client_id = Column(Integer, nullable=False, default=0)
+    project_id = Column(Integer, nullable=False, default=0)
+    contract_id = Column(Integer, nullable=False, default=0)
+    category = Column(String(50), nullable=False, default="")
+    is_tax_related = Column(Boolean, nullable=False, default=False)
+    reverses_id = Column(Integer, ForeignKey("money_journal.id"), nullable=True)  # сторнируемая строка
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CashBalanceCheckpoint(Base):
+    """Контрольная точка остатка денег на конец месяца (cash_checkpoints).
+
+    cumulative_net — накопленный денежный поток (поступления − оплаченные расходы) с начала учёта
+    по конец месяца; остаток = Enterprise.opening_cash_balance + cumulative_net.
+    """
+    __tablename__ = "cash_balance_checkpoints"
+
+    month_start = Column(Date, primary_key=True)  # первое число месяца
+    inflow = Column(Float, nullable=False, default=0)
+    outflow = Column(Float, nullable=False, default=0)
+    cumulative_net = Column(Float, nullable=False, default=0)
+
+
 class PeriodClosure(Base):
     """Закрытие периода (year, month) — для управленческого учёта."""
     __tablename__ = "period_closures"
+    __table_args__ = (UniqueConstraint("year", "month", name="uq_period_closures_year_month"),)
 
     id = Column(Integer, primary_key=True, index=True)
     year = Column(Integer, nullable=False)
@@ -347,6 +468,45 @@ class PeriodClosure(Base):
     closed_by_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
 
 
+class PeriodSnapshot(Base):
+    """Замороженные месячные агрегаты закрытого периода (те же измерения и меры, что daily_ledger_rollup)."""
+    __tablename__ = "period_snapshots"
+    __table_args__ = (
+        UniqueConstraint(
+            "month_start", "client_id", "project_id", "contract_id", "category", "is_tax_related",
+            name="uq_period_snapshots_key",
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    month_start = Column(Date, nullable=False)
+    client_id = Column(Integer, nullable=False, default=0)
+    project_id = Column(Integer, nullable=False, default=0)
+    contract_id = Column(Integer, nullable=False, default=0)
+    category = Column(String(50), nullable=False, default="")
+    is_tax_related = Column(Boolean, nullable=False, default=False)
+    revenue_accrual = Column(Float, nullable=False, default=0)
+    revenue_cash = Column(Float, nullable=False, default=0)
+    expense_accrual = Column(Float, nullable=False, default=0)
+    expense_cash = Column(Float, nullable=False, default=0)
+    taxes_cash = Column(Float, nullable=False, default=0)
+
+
+class KpoSnapshotRow(Base):
+    """Строка КПО закрытого месяца в том виде, как она была на момент закрытия."""
+    __tablename__ = "kpo_snapshot_rows"
+
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(Integer, nullable=False, index=True)
+    month = Column(Integer, nullable=False)
+    income_id = Column(Integer, nullable=False)
+    issued_date = Column(Date, nullable=False)
+    invoice_number = Column(String(50))
+    client_name = Column(String(200))
+    description = Column(Text)
+    amount_rsd = Column(Float, nullable=False)
+
+
 class PlannedExpense(Base):
     """Планируемые (периодические) расходы — аренда, интернет, телефон и т.д."""
     __tablename__ = "planned_expenses"
@@ -408,3 +568,27 @@ class AuditLog(Base):
     description = Column(Text)
     ip_address = Column(String(50))
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SchedulerJob(Base):
+    """Отметка последнего запуска фоновой задачи (scheduler) и статистика длительности."""
+    __tablename__ = "scheduler_jobs"
+
+    name = Column(String(50), primary_key=True)
+    last_run_at = Column(DateTime)  # Локальное время начала последнего запуска
+    last_status = Column(String(10))  # ok, error
+    last_error = Column(Text)
+    last_result = Column(Text)  # JSON
+    last_duration_ms = Column(Float)
+    max_duration_ms = Column(Float, default=0)
+    total_duration_ms = Column(Float, default=0)
+    run_count = Column(Integer, default=0)
+
+
+class SchedulerLock(Base):
+    """Блокировка единственного экземпляра планировщика: владелец и время продления аренды."""
+    __tablename__ = "scheduler_lock"
+
+    id = Column(Integer, primary_key=True)  # Всегда 1
+    owner = Column(String(100), nullable=False)
+    heartbeat_at = Column(DateTime, nullable=False)
@@ -0,0 +1,179 @@
+"""Журнал движения денег (money_journal): единый источник денежных отчётов.
+
+Строки журнала:
+- CashTransaction (type=income): поступление по date, +amount, измерения — из связанного Income.
+- Expense (paid_date задан): выплата по paid_date, −effective_amount (сторно — возврат с + знаком),
+  измерения project/category/is_tax_related.
+
+Журнал только дополняется. После каждого flush (after_flush — id новых записей уже известны)
+для затронутых источников действующие строки (не сторно и не сторнированные) сравниваются
+с состоянием в БД; при расхождении добавляются сторнирующие строки (reverses_id) и новые.
+Тот же код сверяет весь журнал при backfill (backfill_money_journal.py, миграции).
+
+По журналу строятся денежные меры свода при пересчёте (ledger_rollup.LEDGER_EVENTS_SQL),
+месячные точки остатка (cash_checkpoints) и cash flow — одна выборка по индексу (entry_date, …).
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Optional
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from backend.cash_checkpoints import invalidate_cash_checkpoints, refresh_cash_checkpoints
+from backend.models import Income, Expense, CashTransaction
+from backend.period_keys import period_key_values
+
+ENTRY_FIELDS = (
+    "entry_date", "amount", "direction", "source",
+    "client_id", "project_id", "contract_id", "category", "is_tax_related",
+)
+INCOME_DIMS = ("client_id", "project_id", "contract_id")
+
+# Ожидаемые строки журнала по текущему состоянию источников (reference_id + ENTRY_FIELDS)
+EXPECTED_SQL = {
+    "cash_transaction": """
+        SELECT ct.id AS reference_id, ct.date AS entry_date, ct.amount AS amount, 'in' AS direction,
+               ct.source AS source, COALESCE(i.client_id, 0) AS client_id, COALESCE(i.project_id, 0) AS project_id,
+               COALESCE(i.contract_id, 0) AS contract_id, '' AS category, 0 AS is_tax_related
+        FROM cash_transactions ct
+        LEFT JOIN income i ON ct.source = 'invoice' AND i.id = ct.reference_id
+        WHERE ct.type = 'income' AND ct.date IS NOT NULL
+    """,
+    "expense": """
+        SELECT e.id AS reference_id, e.paid_date AS entry_date, -e.effective_amount AS amount, 'out' AS direction,
+               COALESCE(e.source, 'manual') AS source, 0 AS client_id, COALESCE(e.project_id, 0) AS project_id,
+               0 AS contract_id, COALESCE(e.category, '') AS category, COALESCE(e.is_tax_related, 0) AS is_tax_related
+        FROM expenses e
+        WHERE e.paid_date IS NOT NULL AND e.effective_amount != 0
+    """,
+}
+
+# Действующие строки: не сторно и ещё не сторнированы
+LIVE_SQL = """
+    SELECT j.id, j.reference_id, j.entry_date, j.amount, j.direction, j.source,
+           j.client_id, j.project_id, j.contract_id, j.category, j.is_tax_related
+    FROM money_journal j
+    WHERE j.reference_type = :reference_type AND j.reverses_id IS NULL
+      AND NOT EXISTS (SELECT 1 FROM money_journal r WHERE r.reverses_id = j.id)
+"""
+
+INSERT_SQL = text("""
+    INSERT INTO money_journal
+        (entry_date, entry_year, entry_month, entry_week, amount, direction, source, reference_type, reference_id,
+         client_id, project_id, contract_id, category, is_tax_related, reverses_id, created_at)
+    VALUES
+        (:entry_date, :entry_year, :entry_month, :entry_week, :amount, :direction, :source, :reference_type,
+         :reference_id, :client_id, :project_id, :contract_id, :category, :is_tax_related, :reverses_id, :created_at)
+""")
+
+
+def _signature(row) -> tuple:
+    """Сравнимый вид строки журнала (ENTRY_FIELDS)."""
+    m = row._mapping
+    return (
+        str(m["entry_date"])[:10],
+        round(float(m["amount"] or 0), 6),
+        m["direction"],
+        m["source"] or "",
+        int(m["client_id"] or 0),
+        int(m["project_id"] or 0),
+        int(m["contract_id"] or 0),
+        m["category"] or "",
+        int(bool(m["is_tax_related"])),
+    )
+
+
+def _select(conn: Connection, sql: str, ids: Optional[set[int]], **params):
+    if ids is None:
+        return conn.execute(text(sql), params)
+    stmt = text(f"SELECT * FROM ({sql}) WHERE reference_id IN :ids").bindparams(bindparam("ids", expanding=True))
+    return conn.execute(stmt, {**params, "ids": sorted(ids)})
+
+
+def sync_money_journal(conn: Connection, refs: Optional[dict[str, set[int]]] = None) -> list[date]:
+    """
+    Привести журнал к состоянию источников: refs — {reference_type: {id, ...}} (None — весь журнал).
+    Возвращает даты добавленных строк.
+    """
+    now = datetime.utcnow()
+    rows = []
+    for reference_type, sql in EXPECTED_SQL.items():
+        ids = None if refs is None else refs.get(reference_type)
+        if ids is not None and not ids:
+            continue
+        expected = defaultdict(list)
+        for row in _select(conn, sql, ids):
+            expected[row.reference_id].append(_signature(row))
+        live = defaultdict(list)
+        for row in _select(conn, LIVE_SQL, ids, reference_type=reference_type):
+            live[row.reference_id].append((row.id, _signature(row)))
+        for reference_id in (ids if ids is not None else expected.keys() | live.keys()):
+            want = sorted(expected.get(reference_id, []))
+            have = live.get(reference_id, [])
+            if sorted(sig for _, sig in have) == want:
+                continue
+            for entry_id, sig in have:
+                rows.append((reference_type, reference_id, sig, entry_id))
+            rows.extend((reference_type, reference_id, sig, None) for sig in want)
+    if not rows:
+        return []
+    params = []
+    for reference_type, reference_id, sig, reverses_id in rows:
+        values = dict(zip(ENTRY_FIELDS, sig))
+        if reverses_id is not None:
+            values["amount"] = -values["amount"]
+        params.append({
+            **values,
+            **period_key_values("entry", date.fromisoformat(values["entry_date"])),
+            "reference_type": reference_type,
+            "reference_id": reference_id,
+            "reverses_id": reverses_id,
+            "created_at": now,
+        })
+    conn.execute(INSERT_SQL, params)
+    return [date.fromisoformat(p["entry_date"]) for p in params]
+
+
+def _touched_references(session: Session) -> dict[str, set[int]]:
+    refs: dict[str, set[int]] = {"cash_transaction": set(), "expense": set()}
+    moved_incomes = []
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, CashTransaction):
+            refs["cash_transaction"].add(obj.id)
+        elif isinstance(obj, Expense):
+            refs["expense"].add(obj.id)
+        elif isinstance(obj, Income) and obj in session.dirty:
+            state = inspect(obj)
+            if any(state.attrs[f].history.has_changes() for f in INCOME_DIMS):
+                moved_incomes.append(obj.id)
+    if moved_incomes:
+        # Смена клиента/проекта/договора переносит и поступления по счёту
+        r = session.connection().execute(
+            text(
+                "SELECT id FROM cash_transactions WHERE source = 'invoice' AND reference_id IN :ids"
+            ).bindparams(bindparam("ids", expanding=True)),
+            {"ids": moved_incomes},
+        )
+        refs["cash_transaction"].update(row[0] for row in r)
+    return refs
+
+
+@event.listens_for(Session, "after_flush")
+def _journal_after_flush(session: Session, flush_context) -> None:
+    refs = _touched_references(session)
+    if not any(refs.values()):
+        return
+    conn = session.connection()
+    days = sync_money_journal(conn, refs)
+    if days:
+        # Денежная запись задним числом: сбросить точки остатка с её месяца и достроить
+        invalidate_cash_checkpoints(conn, min(days))
+        refresh_cash_checkpoints(conn)
+
+
+async def backfill_money_journal(db: AsyncSession) -> int:
+    """Сверить весь журнал с источниками (после ручных правок БД). Возвращает число добавленных строк."""
+    return await db.run_sync(lambda session: len(sync_money_journal(session.connection())))
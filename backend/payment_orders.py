@@ -0,0 +1,231 @@
+"""Пакет платёжных поручений (налог за пренос) за год или диапазон месяцев.
+
+Поручения — по неоплаченным обязательствам (MonthlyObligation со статусом не paid) и, по желанию,
+по неоплаченным платежам планируемых расходов в том же диапазоне. Данные загружаются одним набором
+запросов: обязательства вместе с решениями и типами платежей (JOIN), предприятие — один раз,
+планируемые расходы и их отметки оплаты — по запросу на таблицу.
+
+Форматы пакета:
+- pdf — листы с IPS QR и реквизитами (ips_qr.render_sheet: QR параллельно в рабочих потоках);
+- csv — для импорта в е-банкинг: «;», UTF-8 с BOM, одна строка — одно поручение;
+- xml — <nalozi_za_prenos> с элементами <nalog> тех же полей.
+У планируемых расходов нет счёта получателя — такие поручения без QR и с пустым счётом (заполняются в банке).
+"""
+import asyncio
+import calendar
+import csv
+import xml.etree.ElementTree as ET
+from datetime import date
+from io import StringIO
+from typing import Literal, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.ips_qr import account_digits, ips_payload, render_sheet
+from backend.models import (
+    Enterprise, MonthlyObligation, PaymentType, PlannedExpense, PlannedExpensePayment, YearDecision,
+)
+from backend.payments_service import payment_purpose_with_year
+from backend.planned_expenses_service import payment_dates_in_range
+
+OrdersFormat = Literal["pdf", "csv", "xml"]
+MEDIA_TYPES = {"pdf": "application/pdf", "csv": "text/csv; charset=utf-8", "xml": "application/xml"}
+
+# Поля поручения в CSV/XML (имена колонок — как в шаблонах импорта сербских банков)
+EXPORT_FIELDS = (
+    ("racun_platioca", "payer_account"),
+    ("naziv_platioca", "payer"),
+    ("racun_primaoca", "recipient_account"),
+    ("naziv_primaoca", "recipient"),
+    ("iznos", "amount"),
+    ("valuta", "currency"),
+    ("sifra_placanja", "payment_code"),
+    ("model", "model"),
+    ("poziv_na_broj", "reference"),
+    ("svrha", "purpose"),
+    ("rok", "due_date"),
+    ("datum_valute", "value_date"),
+)
+
+
+def format_account(account: Optional[str]) -> str:
+    """Счёт в виде NNN-NNNNNNNNNNNNN-NN (18 цифр); нераспознанный — как есть."""
+    digits = account_digits(account or "")
+    if len(digits) != 18:
+        return (account or "").strip()
+    return f"{digits[:3]}-{digits[3:16]}-{digits[16:]}"
+
+
+def _payer(ent: Optional[Enterprise]) -> str:
+    payer = f"{ent.name or 'Предузетник'}" if ent else "Предузетник"
+    if ent and ent.address:
+        payer += f", {ent.address}"
+    return payer
+
+
+def obligation_order(ob: MonthlyObligation, dec: YearDecision, pt: PaymentType, ent: Optional[Enterprise]) -> dict:
+    """Поручение по обязательству: реквизиты решения, плательщик — предприятие, строка IPS QR."""
+    order = {
+        "kind": "obligation",
+        "id": ob.id,
+        "title": f"{pt.name_sr} — {ob.month:02d}/{ob.year}",
+        "due_date": ob.deadline,
+        "payer": _payer(ent),
+        "payer_account": format_account(ent.bank_account) if ent else "",
+        "recipient": dec.recipient_name or "",
+        "recipient_account": format_account(dec.recipient_account),
+        "recipient_account_stored": dec.recipient_account or "",  # как в решении (IPSQRData.account)
+        "amount": round(float(ob.amount or 0), 2),
+        "currency": dec.currency or "RSD",
+        "payment_code": dec.sifra_placanja or "",
+        "model": dec.model or "",
+        "reference": dec.poziv_na_broj or "",
+        "purpose": payment_purpose_with_year(dec.payment_purpose, ob.year),
+    }
+    order["payload"] = ips_payload(
+        recipient=order["recipient"], account=dec.recipient_account, amount=order["amount"],
+        currency=order["currency"], payer=order["payer"], purpose=order["purpose"],
+        payment_code=order["payment_code"], model=order["model"], reference=order["reference"],
+    )
+    return order
+
+
+def planned_order(pe: PlannedExpense, due: date, ent: Optional[Enterprise]) -> dict:
+    """Поручение по платежу планируемого расхода (без счёта получателя и без QR)."""
+    return {
+        "kind": "planned",
+        "id": pe.id,
+        "title": f"{pe.name} — {due.strftime('%d.%m.%Y')}",
+        "due_date": due,
+        "payer": _payer(ent),
+        "payer_account": format_account(ent.bank_account) if ent else "",
+        "recipient": pe.name,
+        "recipient_account": "",
+        "recipient_account_stored": "",
+        "amount": round(float(pe.amount or 0), 2),
+        "currency": pe.currency or "RSD",
+        "payment_code": "221",  # Промет робе и услуга
+        "model": "",
+        "reference": "",
+        "purpose": (pe.description or pe.name)[:35],
+        "payload": None,
+    }
+
+
+def _obligations_query():
+    """Обязательства вместе с решениями и типами платежей — один JOIN."""
+    return (
+        select(MonthlyObligation, YearDecision, PaymentType)
+        .join(YearDecision, YearDecision.id == MonthlyObligation.decision_id)
+        .join(PaymentType, PaymentType.id == MonthlyObligation.payment_type_id)
+    )
+
+
+async def _enterprise(db: AsyncSession) -> Optional[Enterprise]:
+    return (await db.execute(select(Enterprise).limit(1))).scalar_one_or_none()
+
+
+async def load_obligation_order(db: AsyncSession, obligation_id: int) -> Optional[dict]:
+    """Поручение по одному обязательству (любой статус) — для IPS QR; None — нет обязательства или решения."""
+    row = (await db.execute(_obligations_query().where(MonthlyObligation.id == obligation_id))).first()
+    if row is None:
+        return None
+    ob, dec, pt = row
+    return obligation_order(ob, dec, pt, await _enterprise(db))
+
+
+async def load_payment_orders(
+    db: AsyncSession,
+    first: date,
+    last: date,
+    include_planned: bool = False,
+) -> list[dict]:
+    """Поручения по неоплаченным обязательствам за месяцы [first, last] (по первым числам) в порядке срока."""
+    period = MonthlyObligation.year * 100 + MonthlyObligation.month
+    q = _obligations_query().where(
+        period >= first.year * 100 + first.month,
+        period <= last.year * 100 + last.month,
+        MonthlyObligation.status != "paid",
+    ).order_by(MonthlyObligation.deadline, PaymentType.sort_order, MonthlyObligation.payment_type_id)
+    rows = (await db.execute(q)).all()
+    ent = await _enterprise(db)
+    orders = [obligation_order(ob, dec, pt, ent) for ob, dec, pt in rows]
+
+    if include_planned:
+        range_end = date(last.year, last.month, calendar.monthrange(last.year, last.month)[1])
+        items = (await db.execute(select(PlannedExpense).where(PlannedExpense.is_active == True))).scalars().all()
+        paid = set()
+        if items:
+            r = await db.execute(
+                select(PlannedExpensePayment.planned_expense_id, PlannedExpensePayment.due_date).where(
+                    PlannedExpensePayment.planned_expense_id.in_([pe.id for pe in items]),
+                    PlannedExpensePayment.due_date >= first,
+                    PlannedExpensePayment.due_date <= range_end,
+                )
+            )
+            paid = set(r.all())
+        for pe in items:
+            for due in payment_dates_in_range(pe, first, range_end, limit=400):
+                if (pe.id, due) not in paid:
+                    orders.append(planned_order(pe, due, ent))
+        orders.sort(key=lambda o: (o["due_date"], o["kind"] != "obligation"))
+    return orders
+
+
+def _export_rows(orders: list[dict], today: date) -> list[dict]:
+    """Строки CSV/XML: суммы с двумя знаками, даты ISO, дата валюты — срок, но не раньше today."""
+    rows = []
+    for o in orders:
+        values = {**o, "amount": f"{o['amount']:.2f}", "due_date": o["due_date"].isoformat(),
+                  "value_date": max(o["due_date"], today).isoformat()}
+        rows.append({name: values[key] for name, key in EXPORT_FIELDS})
+    return rows
+
+
+def _build_csv(orders: list[dict], today: date) -> bytes:
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[name for name, _ in EXPORT_FIELDS], delimiter=";", lineterminator="\r\n")
+    writer.writeheader()
+    writer.writerows(_export_rows(orders, today))
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def _build_xml(orders: list[dict], today: date) -> bytes:
+    rows = _export_rows(orders, today)
+    root = ET.Element("nalozi_za_prenos", {
+        "broj_naloga": str(len(rows)),
+        "ukupan_iznos": f"{sum(o['amount'] for o in orders):.2f}",
+        "datum_kreiranja": today.isoformat(),
+    })
+    for row in rows:
+        nalog = ET.SubElement(root, "nalog")
+        for name, value in row.items():
+            ET.SubElement(nalog, name).text = value
+    ET.indent(root)
+    return ET.tostring(root, encoding="utf-8", xml_declaration=True)
+
+
+def _slip(order: dict) -> dict:
+    return {
+        "payload": order["payload"],
+        "heading": f"{order['title']}, рок {order['due_date'].strftime('%d.%m.%Y')}",
+        "lines": [
+            ("Износ", f"{order['amount']:,.2f} {order['currency']}"),
+            ("Прималац", order["recipient"]),
+            ("Рачун", order["recipient_account"] or "—"),
+            ("Шифра плаћања", order["payment_code"]),
+            ("Модел / позив на број", f"{order['model']} {order['reference']}".strip()),
+            ("Сврха", order["purpose"]),
+            ("Уплатилац", order["payer"]),
+        ],
+    }
+
+
+async def render_payment_orders(title: str, orders: list[dict], fmt: OrdersFormat, today: Optional[date] = None) -> bytes:
+    """Пакет поручений в формате fmt; сборка — в рабочих потоках."""
+    today = today or date.today()
+    if fmt == "pdf":
+        return await render_sheet(title, [_slip(o) for o in orders])
+    builder = _build_csv if fmt == "csv" else _build_xml
+    return await asyncio.to_thread(builder, orders, today)
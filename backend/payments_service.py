@@ -1,9 +1,12 @@
 """Сервис обязательных платежей — по ТЗ решений Пореске управе."""
-from datetime import date
-from sqlalchemy import select
+from datetime import date, datetime
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
 from backend.models import PaymentType, YearDecision, MonthlyObligation
+from backend.result_cache import mark_finance_change
 
 
 def deadline_for_month(year: int, month: int) -> date:
@@ -37,60 +40,179 @@ async def ensure_payment_types(db: AsyncSession) -> None:
     await db.flush()
 
 
-async def get_or_create_obligations(
+# Штамп решений года: меняется при создании, изменении (version), деактивации и удалении решения
+STAMP_SQL = text("""
+    SELECT COALESCE(group_concat(stamp, ','), '') FROM (
+        SELECT id || ':' || COALESCE(version, 1) || ':' || COALESCE(is_active, 1) AS stamp
+        FROM year_decisions WHERE year = :y ORDER BY id
+    )
+""")
+
+# Сетка года одним оператором: 12 месяцев × тип платежа по действующему решению
+# (непривременое предпочтительнее), у неоплаченных — сумма и решение обновляются
+GRID_UPSERT_SQL = text("""
+    WITH months(month) AS (VALUES (1), (2), (3), (4), (5), (6), (7), (8), (9), (10), (11), (12))
+    INSERT INTO monthly_obligations (year, month, payment_type_id, decision_id, amount, deadline, status,
+                                     payment_method, created_at)
+    SELECT d.year, m.month, d.payment_type_id, d.id, d.monthly_amount,
+           date(printf('%04d-%02d-15', d.year, m.month), '+1 month'), 'unpaid', 'manual', :now
+    FROM year_decisions d CROSS JOIN months m
+    WHERE d.year = :y AND d.id = (
+        SELECT d2.id FROM year_decisions d2
+        WHERE d2.year = d.year AND d2.payment_type_id = d.payment_type_id AND d2.is_active = 1
+        ORDER BY d2.is_provisional ASC, d2.id ASC LIMIT 1
+    )
+    ON CONFLICT(year, month, payment_type_id) DO UPDATE SET
+        decision_id = excluded.decision_id, amount = excluded.amount
+    WHERE monthly_obligations.status != 'paid'
+""")
+
+# Неоплаченные обязательства типов, у которых в году не осталось действующего решения
+# (деактивировано или удалено), из сетки убираются; оплаченные остаются как история
+GRID_PRUNE_SQL = text("""
+    DELETE FROM monthly_obligations
+    WHERE year = :y AND status != 'paid' AND NOT EXISTS (
+        SELECT 1 FROM year_decisions d
+        WHERE d.year = :y AND d.payment_type_id = monthly_obligations.payment_type_id AND d.is_active = 1
+    )
+""")
+
+GRID_STATE_SQL = text("""
+    INSERT INTO obligation_grids (year, decisions_stamp, generated_at) VALUES (:y, :stamp, :now)
+    ON CONFLICT(year) DO UPDATE SET decisions_stamp = excluded.decisions_stamp, generated_at = excluded.generated_at
+""")
+
+_GRID_YEARS = "obligation_grid_years"
+
+
+def sync_obligation_grid(conn: Connection, year: int, force: bool = False) -> int:
+    """
+    Построить сетку обязательств года, если решения изменились с прошлой генерации (штамп).
+    Оплаченные не меняются, дубликаты исключены уникальным (year, month, payment_type_id);
+    неоплаченные без действующего решения удаляются.
+    Возвращает число вставленных/обновлённых/удалённых строк (0 — сетка актуальна).
+    """
+    stamp = conn.execute(STAMP_SQL, {"y": year}).scalar() or ""
+    current = conn.execute(text("SELECT decisions_stamp FROM obligation_grids WHERE year = :y"), {"y": year}).scalar()
+    if not force and current == stamp:
+        return 0
+    now = datetime.utcnow()
+    n = max(conn.execute(GRID_UPSERT_SQL, {"y": year, "now": now}).rowcount, 0)
+    n += max(conn.execute(GRID_PRUNE_SQL, {"y": year}).rowcount, 0)
+    conn.execute(GRID_STATE_SQL, {"y": year, "stamp": stamp, "now": now})
+    return n
+
+
+async def ensure_obligation_grid(db: AsyncSession, year: int, force: bool = False) -> int:
+    """sync_obligation_grid в сессии запроса."""
+    return await db.run_sync(lambda session: sync_obligation_grid(session.connection(), year, force))
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_decision_versions(session: Session, flush_context, instances) -> None:
+    years = session.info.setdefault(_GRID_YEARS, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, YearDecision):
+            continue
+        if obj in session.dirty:
+            if not session.is_modified(obj, include_collections=False):
+                continue
+            obj.version = (obj.version or 1) + 1
+            years.update(v for v in inspect(obj).attrs.year.history.deleted if v is not None)
+        if obj.year is not None:
+            years.add(obj.year)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_grids_after_flush(session: Session, flush_context) -> None:
+    years = session.info.pop(_GRID_YEARS, None)
+    if years:
+        conn = session.connection()
+        for year in sorted(years):
+            sync_obligation_grid(conn, year)
+
+
+# Привременые решения следующего года из действующих решений прошлого (по одному на тип платежа,
+# непривременое предпочтительнее): позив на број — poziv_na_broj_next. Типы, у которых в году
+# уже есть решение, пропускаются — повторный запуск ничего не добавляет
+ROLLOVER_SQL = text("""
+    INSERT INTO year_decisions (year, payment_type_id, period_start, period_end, monthly_amount, base_amount,
+                                rate_percent, recipient_name, recipient_account, sifra_placanja, model,
+                                poziv_na_broj, poziv_na_broj_next, payment_purpose, currency, is_provisional,
+                                is_active, version, created_at, updated_at)
+    SELECT :y, d.payment_type_id, printf('%04d-01-01', :y), printf('%04d-12-31', :y), d.monthly_amount,
+           d.base_amount, d.rate_percent, d.recipient_name, d.recipient_account, d.sifra_placanja, d.model,
+           COALESCE(NULLIF(d.poziv_na_broj_next, ''), d.poziv_na_broj), NULL, d.payment_purpose, d.currency, 1,
+           1, 1, :now, :now
+    FROM year_decisions d
+    WHERE d.year = :y - 1 AND d.is_active = 1 AND d.id = (
+        SELECT d2.id FROM year_decisions d2
+        WHERE d2.year = d.year AND d2.payment_type_id = d.payment_type_id AND d2.is_active = 1
+        ORDER BY d2.is_provisional ASC, d2.id ASC LIMIT 1
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM year_decisions x WHERE x.year = :y AND x.payment_type_id = d.payment_type_id
+    )
+""")
+
+MAX_ROLLOVER_YEARS = 30
+
+
+def rollover_obligation_years(conn: Connection, year_from: int, year_to: int, clone: bool = True) -> list[dict]:
+    """
+    Сетки обязательств за годы [year_from, year_to] в транзакции conn: для каждого года после
+    первого (clone) — привременые решения из решений прошлого года (ROLLOVER_SQL), затем сетка
+    года по штампу решений. Идемпотентно: повторный запуск возвращает нули.
+    Возвращает по годам: {year, decisions_created, obligations_created}.
+    """
+    count_sql = text("SELECT COUNT(*) FROM monthly_obligations WHERE year = :y")
+    now = datetime.utcnow()
+    report = []
+    for year in range(year_from, year_to + 1):
+        decisions = 0
+        if clone and year > year_from:
+            decisions = max(conn.execute(ROLLOVER_SQL, {"y": year, "now": now}).rowcount, 0)
+        before = conn.execute(count_sql, {"y": year}).scalar()
+        sync_obligation_grid(conn, year)
+        report.append({
+            "year": year,
+            "decisions_created": decisions,
+            "obligations_created": conn.execute(count_sql, {"y": year}).scalar() - before,
+        })
+    return report
+
+
+async def rollover_years(db: AsyncSession, year_from: int, year_to: int, clone: bool = True) -> list[dict]:
+    """rollover_obligation_years в сессии (коммит — вызывающим); кэш отчётов сбрасывается при коммите."""
+    report = await db.run_sync(
+        lambda session: rollover_obligation_years(session.connection(), year_from, year_to, clone)
+    )
+    if any(r["decisions_created"] or r["obligations_created"] for r in report):
+        mark_finance_change(db.sync_session)
+    return report
+
+
+def obligation_status(ob: MonthlyObligation, today: date) -> str:
+    """Статус на дату: paid — по отметке, иначе overdue/unpaid по deadline (хранимый overdue не используется)."""
+    if ob.status == "paid":
+        return "paid"
+    return "overdue" if ob.deadline < today else "unpaid"
+
+
+async def list_obligations(
     db: AsyncSession, year: int, payment_type_code: str | None = None
-) -> list[MonthlyObligation]:
-    """Получить или создать месячные обязательства за год. Обновить overdue."""
-    today = date.today()
-    # Решения на год: своё или привремене с прошлого
+) -> list[tuple[MonthlyObligation, PaymentType]]:
+    """Обязательства года с типом платежа — одна выборка, без записи."""
     q = (
-        select(YearDecision)
-        .where(YearDecision.year == year, YearDecision.is_active == True)
-        .join(PaymentType)
+        select(MonthlyObligation, PaymentType)
+        .join(PaymentType, PaymentType.id == MonthlyObligation.payment_type_id)
+        .where(MonthlyObligation.year == year)
+        .order_by(MonthlyObligation.month, MonthlyObligation.payment_type_id)
     )
     if payment_type_code:
         q = q.where(PaymentType.code == payment_type_code)
-    q = q.order_by(YearDecision.payment_type_id, YearDecision.is_provisional.asc())
     r = await db.execute(q)
-    decisions = r.scalars().all()
-    # Группируем по payment_type_id, берём первое (не provisional предпочтительнее)
-    by_type = {}
-    for d in decisions:
-        if d.payment_type_id not in by_type or not d.is_provisional:
-            by_type[d.payment_type_id] = d
-
-    result = []
-    for pt_id, dec in by_type.items():
-        for month in range(1, 13):
-            r2 = await db.execute(
-                select(MonthlyObligation).where(
-                    MonthlyObligation.year == year,
-                    MonthlyObligation.month == month,
-                    MonthlyObligation.payment_type_id == pt_id,
-                )
-            )
-            ob = r2.scalar_one_or_none()
-            if not ob:
-                dl = deadline_for_month(year, month)
-                ob = MonthlyObligation(
-                    year=year,
-                    month=month,
-                    payment_type_id=pt_id,
-                    decision_id=dec.id,
-                    amount=dec.monthly_amount,
-                    deadline=dl,
-                    status="unpaid" if dl >= today else "overdue",
-                )
-                db.add(ob)
-                await db.flush()
-            elif ob.status != "paid":
-                # Обновляем только неоплаченные: overdue и amount
-                if ob.deadline < today:
-                    ob.status = "overdue"
-                ob.amount = dec.monthly_amount
-            result.append(ob)
-    result.sort(key=lambda x: (x.month, x.payment_type_id))
-    return result
+    return [(ob, pt) for ob, pt in r.all()]
 
 
 def presets_2026() -> list[dict]:
@@ -0,0 +1,229 @@
+"""Закрытие периодов: снапшоты месячных агрегатов и КПО, запрет записей в закрытые месяцы.
+
+При закрытии месяца (period_closures) строки daily_ledger_rollup за месяц сворачиваются в
+period_snapshots (по тем же измерениям), строки КПО копируются в kpo_snapshot_rows.
+Отчёты берут закрытые месяцы из снапшотов (ledger_source) и сканируют свод только по открытым.
+Любая запись, меняющая агрегаты или КПО закрытого месяца, отклоняется (ClosedPeriodError → 409).
+"""
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from sqlalchemy import select, func, and_, or_, text, union_all, inspect, literal_column, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from backend.models import Income, Client, DailyLedgerRollup, PeriodSnapshot, PeriodClosure, KpoSnapshotRow
+from backend.period_keys import PERIOD_SUFFIXES, period_key_sql
+
+# Поля дохода, попадающие в книгу КПО
+KPO_FIELDS = ("issued_date", "invoice_number", "client_id", "client_name", "description", "amount_rsd")
+
+LEDGER_DIMS = ("client_id", "project_id", "contract_id", "category", "is_tax_related")
+LEDGER_MEASURES = ("revenue_accrual", "revenue_cash", "expense_accrual", "expense_cash", "taxes_cash")
+LEDGER_PERIOD_KEYS = tuple(f"day_{s}" for s in PERIOD_SUFFIXES)
+
+
+class ClosedPeriodError(Exception):
+    """Запись затрагивает закрытый период."""
+
+    def __init__(self, year: int, month: int):
+        self.year = year
+        self.month = month
+        super().__init__(f"Период {month:02d}.{year} закрыт — изменения запрещены. Откройте период заново.")
+
+
+def _month_bounds(year: int, month: int) -> tuple[date, date]:
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+# --- Запрет записей (вызывается из before_flush свода) ---
+
+def _kpo_months(session: Session) -> set[tuple[int, int]]:
+    """Месяцы, строки КПО которых меняются в этом flush."""
+    months = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, Income):
+            continue
+        state = inspect(obj)
+        if obj in session.dirty and not any(state.attrs[f].history.has_changes() for f in KPO_FIELDS):
+            continue
+        for d in (obj.issued_date, *state.attrs.issued_date.history.deleted):
+            if isinstance(d, date):
+                months.add((d.year, d.month))
+    return months
+
+
+def ensure_periods_open(session: Session, days: Iterable[date]) -> None:
+    """ClosedPeriodError, если затронутые дни свода (days) или строки КПО лежат в закрытом месяце."""
+    months = {(d.year, d.month) for d in days} | _kpo_months(session)
+    if not months:
+        return
+    closed = {
+        (row[0], row[1])
+        for row in session.connection().execute(text("SELECT year, month FROM period_closures"))
+    }
+    hit = sorted(months & closed)
+    if hit:
+        raise ClosedPeriodError(*hit[0])
+
+
+# --- Закрытие / открытие ---
+
+SNAPSHOT_SQL = text("""
+    INSERT INTO period_snapshots
+        (month_start, client_id, project_id, contract_id, category, is_tax_related,
+         revenue_accrual, revenue_cash, expense_accrual, expense_cash, taxes_cash)
+    SELECT :month_start, client_id, project_id, contract_id, category, is_tax_related,
+           SUM(revenue_accrual), SUM(revenue_cash), SUM(expense_accrual), SUM(expense_cash), SUM(taxes_cash)
+    FROM daily_ledger_rollup
+    WHERE day >= :start AND day < :end
+    GROUP BY client_id, project_id, contract_id, category, is_tax_related
+""")
+
+KPO_SNAPSHOT_SQL = text("""
+    INSERT INTO kpo_snapshot_rows
+        (year, month, income_id, issued_date, invoice_number, client_name, description, amount_rsd)
+    SELECT :year, :month, i.id, i.date, i.invoice_number, COALESCE(i.client_name, c.name), i.description, i.amount_rsd
+    FROM income i
+    LEFT JOIN clients c ON c.id = i.client_id
+    WHERE i.date >= :start AND i.date < :end
+""")
+
+
+async def get_closure(db: AsyncSession, year: int, month: int) -> Optional[PeriodClosure]:
+    r = await db.execute(select(PeriodClosure).where(PeriodClosure.year == year, PeriodClosure.month == month))
+    return r.scalar_one_or_none()
+
+
+async def close_period(db: AsyncSession, year: int, month: int, user_id: Optional[int]) -> PeriodClosure:
+    """Заморозить месяц: снапшот агрегатов и КПО + запись в period_closures."""
+    start, end = _month_bounds(year, month)
+    params = {"year": year, "month": month, "start": start.isoformat(), "end": end.isoformat()}
+    await db.execute(SNAPSHOT_SQL, {**params, "month_start": start.isoformat()})
+    await db.execute(KPO_SNAPSHOT_SQL, params)
+    closure = PeriodClosure(year=year, month=month, closed_at=datetime.utcnow(), closed_by_user_id=user_id)
+    db.add(closure)
+    await db.flush()
+    return closure
+
+
+async def reopen_period(db: AsyncSession, closure: PeriodClosure) -> None:
+    """Снять закрытие: удалить снапшоты месяца, отчёты снова читают свод."""
+    start, _ = _month_bounds(closure.year, closure.month)
+    await db.execute(text("DELETE FROM period_snapshots WHERE month_start = :m"), {"m": start.isoformat()})
+    await db.execute(
+        text("DELETE FROM kpo_snapshot_rows WHERE year = :y AND month = :m"),
+        {"y": closure.year, "m": closure.month},
+    )
+    await db.delete(closure)
+    await db.flush()
+
+
+# --- Чтение ---
+
+async def closed_months_within(db: AsyncSession, date_from: date, date_to: date) -> list[date]:
+    """Первые числа закрытых месяцев, целиком лежащих в [date_from, date_to]."""
+    r = await db.execute(
+        select(PeriodClosure.year, PeriodClosure.month).where(
+            PeriodClosure.year >= date_from.year, PeriodClosure.year <= date_to.year
+        )
+    )
+    out = []
+    for y, m in r.fetchall():
+        start, end = _month_bounds(y, m)
+        if start >= date_from and end <= date_to + timedelta(days=1):
+            out.append(start)
+    return sorted(out)
+
+
+def _open_segments(day_col, date_from: date, date_to: date, closed: list[date]) -> list:
+    """Условия на отрезки [date_from, date_to] между закрытыми месяцами (closed — первые числа, по возрастанию)."""
+    segments = []
+    cursor = date_from
+    for start in closed:
+        if cursor < start:
+            segments.append(and_(day_col >= cursor, day_col < start))
+        cursor = _month_bounds(start.year, start.month)[1]
+    if cursor <= date_to:
+        segments.append(and_(day_col >= cursor, day_col <= date_to))
+    return segments
+
+
+async def ledger_source(
+    db: AsyncSession, date_from: date, date_to: date, use_snapshots: bool = True, name: str = "ledger"
+):
+    """
+    Подзапрос с колонками свода (day, ключи периодов day_*, измерения, меры) за [date_from, date_to]:
+    открытые месяцы — строки daily_ledger_rollup, закрытые — одна строка снапшота на комбинацию
+    измерений с day = первое число месяца. use_snapshots=False (группировка по дням) — только свод.
+    name — имя подзапроса (несколько источников в одном запросе).
+    """
+    R = DailyLedgerRollup
+    rollup_cols = [
+        R.day.label("day"),
+        *[getattr(R, c) for c in LEDGER_PERIOD_KEYS],
+        *[getattr(R, c) for c in LEDGER_DIMS],
+        *[getattr(R, c) for c in LEDGER_MEASURES],
+    ]
+    closed = await closed_months_within(db, date_from, date_to) if use_snapshots else []
+    if not closed:
+        return select(*rollup_cols).where(R.day >= date_from, R.day <= date_to).subquery(name)
+
+    segments = _open_segments(R.day, date_from, date_to, closed)
+
+    S = PeriodSnapshot
+    # Ключи периодов снапшота — по month_start (строк мало: одна на комбинацию измерений за месяц)
+    snapshot_keys = [
+        literal_column(sql, Integer).label(c)
+        for c, sql in zip(LEDGER_PERIOD_KEYS, period_key_sql("period_snapshots.month_start"))
+    ]
+    snapshot = select(
+        S.month_start.label("day"),
+        *snapshot_keys,
+        *[getattr(S, c) for c in LEDGER_DIMS],
+        *[getattr(S, c) for c in LEDGER_MEASURES],
+    ).where(S.month_start.in_(closed))
+    if not segments:
+        return snapshot.subquery(name)
+    return union_all(select(*rollup_cols).where(or_(*segments)), snapshot).subquery(name)
+
+
+async def kpo_rows(db: AsyncSession, date_from: date, date_to: date) -> list[dict]:
+    """Строки КПО за [date_from, date_to]: закрытые месяцы — из kpo_snapshot_rows, открытые — из income."""
+    closed = await closed_months_within(db, date_from, date_to)
+    rows = []
+    if closed:
+        K = KpoSnapshotRow
+        r = await db.execute(
+            select(K).where(or_(*[and_(K.year == d.year, K.month == d.month) for d in closed]))
+        )
+        rows.extend(
+            {
+                "income_id": k.income_id,
+                "issued_date": k.issued_date,
+                "invoice_number": k.invoice_number,
+                "client_name": k.client_name,
+                "description": k.description,
+                "amount_rsd": k.amount_rsd,
+            }
+            for k in r.scalars().all()
+        )
+    segments = _open_segments(Income.issued_date, date_from, date_to, closed)
+    if segments:
+        r = await db.execute(
+            select(
+                Income.id.label("income_id"),
+                Income.issued_date,
+                Income.invoice_number,
+                func.coalesce(Income.client_name, Client.name).label("client_name"),
+                Income.description,
+                Income.amount_rsd,
+            )
+            .outerjoin(Client, Client.id == Income.client_id)
+            .where(or_(*segments))
+        )
+        rows.extend(dict(row._mapping) for row in r.fetchall())
+    rows.sort(key=lambda x: (x["issued_date"], x["income_id"]))
+    return rows
@@ -0,0 +1,96 @@
+"""Целочисленные ключи периодов: группировка отчётов по индексу вместо strftime на каждую строку.
+
+Рядом с датой хранятся <префикс>_year (YYYY), <префикс>_month (YYYY*100+MM) и <префикс>_week
+(ISO-неделя YYYY*100+WW, год — по четвергу недели):
+- income: issued_* (дата счёта), paid_*; expenses: date_*, paid_*; cash_transactions: date_*;
+- daily_ledger_rollup: day_*; money_journal: entry_*.
+
+ORM-записи получают ключи в before_flush свода (ledger_rollup), строки свода и журнала — при вставке,
+существующие строки — миграцией (period_key_sql).
+"""
+from datetime import date
+from typing import Literal, Optional
+
+PERIOD_SUFFIXES = ("year", "month", "week")
+
+# Ключи записей, которые ведёт ORM: модель -> ((атрибут даты, префикс ключей, колонка даты в БД), ...)
+ORM_PERIOD_COLUMNS = {
+    "Income": (("issued_date", "issued", "date"), ("paid_date", "paid", "paid_date")),
+    "Expense": (("date", "date", "date"), ("paid_date", "paid", "paid_date")),
+    "CashTransaction": (("date", "date", "date"),),
+}
+
+
+def period_keys(d: Optional[date]) -> tuple[Optional[int], Optional[int], Optional[int]]:
+    """(год, YYYYMM, ISO-неделя YYYYWW) даты; для None — (None, None, None)."""
+    if d is None:
+        return None, None, None
+    iso_year, iso_week, _ = d.isocalendar()
+    return d.year, d.year * 100 + d.month, iso_year * 100 + iso_week
+
+
+def period_key_values(prefix: str, d: Optional[date]) -> dict[str, Optional[int]]:
+    """{<prefix>_year, <prefix>_month, <prefix>_week} для вставки строк."""
+    return {f"{prefix}_{s}": v for s, v in zip(PERIOD_SUFFIXES, period_keys(d))}
+
+
+def period_key_sql(column: str) -> tuple[str, str, str]:
+    """SQL-выражения тех же ключей по колонке даты ('YYYY-MM-DD') — для пересчёта и заполнения."""
+    thursday = f"date({column}, '-3 days', 'weekday 4')"
+    return (
+        f"CAST(strftime('%Y', {column}) AS INTEGER)",
+        f"CAST(strftime('%Y%m', {column}) AS INTEGER)",
+        f"CAST(strftime('%Y', {thursday}) AS INTEGER) * 100 + (CAST(strftime('%j', {thursday}) AS INTEGER) - 1) / 7 + 1",
+    )
+
+
+def refresh_period_columns(obj) -> None:
+    """Проставить ключи периодов ORM-записи по её датам (только изменившиеся значения)."""
+    for attr, prefix, _ in ORM_PERIOD_COLUMNS.get(type(obj).__name__, ()):
+        for name, value in period_key_values(prefix, getattr(obj, attr)).items():
+            if getattr(obj, name) != value:
+                setattr(obj, name, value)
+
+
+def period_group_key(
+    source, date_column: str, prefix: str, group_by: Literal["day", "week", "month", "quarter", "year"]
+):
+    """
+    Выражение группировки (source — модель или .c подзапроса): day — сама дата date_column,
+    week/month/year — колонка <prefix>_<group_by>, quarter — YYYY*10+Q из <prefix>_month.
+    """
+    if group_by == "day":
+        return getattr(source, date_column)
+    if group_by == "quarter":
+        month = getattr(source, f"{prefix}_month")
+        return (month // 100) * 10 + (month % 100 + 2) // 3
+    return getattr(source, f"{prefix}_{group_by}")
+
+
+def period_key_bounds(
+    source, prefix: str, group_by: Literal["day", "week", "month", "quarter", "year"], date_from: date, date_to: date
+) -> list:
+    """
+    Условия на колонку ключа, дублирующие диапазон дат [date_from, date_to]: планировщик идёт по индексу
+    (<ключ>, ...) и получает строки уже в порядке группировки. Для day — пусто (индекс по самой дате).
+    """
+    if group_by == "day":
+        return []
+    suffix = "month" if group_by == "quarter" else group_by
+    i = PERIOD_SUFFIXES.index(suffix)
+    column = getattr(source, f"{prefix}_{suffix}")
+    return [column >= period_keys(date_from)[i], column <= period_keys(date_to)[i]]
+
+
+def period_label(value, group_by: Literal["day", "week", "month", "quarter", "year"]) -> str:
+    """Ключ периода в ответе API: YYYY-MM-DD | YYYY-Www | YYYY-MM | YYYY-Qn | YYYY."""
+    if group_by == "day":
+        return str(value)[:10]
+    v = int(value)
+    if group_by == "week":
+        return f"{v // 100}-W{v % 100:02d}"
+    if group_by == "month":
+        return f"{v // 100}-{v % 100:02d}"
+    if group_by == "quarter":
+        return f"{v // 10}-Q{v % 10}"
+    return str(v)
@@ -0,0 +1,148 @@
+"""Кэш результатов финансовых отчётов (in-process LRU с ограничением по памяти).
+
+Ключ: (endpoint, параметры запроса, версия данных). Версия увеличивается после каждого
+коммита, затронувшего Income / Expense / CashTransaction / Enterprise (а также Project и
+Client — их названия и статусы попадают в отчёты; планируемые расходы и обязательства —
+в прогноз), и кэш при этом очищается целиком.
+Версия берётся до вычисления: результат, посчитанный во время параллельной записи,
+попадает под старую версию и больше не выдаётся.
+"""
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend.config import get_settings
+from backend.models import (
+    Income, Expense, CashTransaction, Enterprise, Project, Client,
+    PlannedExpense, PlannedExpensePayment, MonthlyObligation, YearDecision,
+)
+
+TRACKED_MODELS = (
+    Income, Expense, CashTransaction, Enterprise, Project, Client,
+    PlannedExpense, PlannedExpensePayment, MonthlyObligation, YearDecision,
+)
+
+_FLAG = "finance_data_changed"
+
+
+class ResultCache:
+    """LRU: вытесняет самые старые записи, пока суммарный размер больше max_bytes."""
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key[-1] != self.version:
+                return  # данные изменились во время вычисления
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def bump_version(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "version": self.version,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_settings = get_settings()
+finance_cache = ResultCache(_settings.finance_cache_max_bytes, _settings.finance_cache_max_entries)
+
+
+def _freeze(params: dict[str, Any]) -> tuple:
+    return tuple(sorted((k, v if isinstance(v, Hashable) else repr(v)) for k, v in params.items()))
+
+
+async def cached(endpoint: str, params: dict[str, Any], compute: Callable[[], Awaitable[Any]]) -> Any:
+    """Вернуть результат из кэша или вычислить compute() и сохранить. Результат нельзя изменять."""
+    key = (endpoint, _freeze(params), finance_cache.version)
+    found, value = finance_cache.get(key)
+    if found:
+        return value
+    value = await compute()
+    finance_cache.put(key, value, len(json.dumps(value, default=str)))
+    return value
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_finance_change(session: Session, flush_context) -> None:
+    if session.info.get(_FLAG):
+        return
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            session.info[_FLAG] = True
+            return
+
+
+_invalidation_callbacks: list[Callable[[], None]] = []
+
+
+def subscribe_invalidation(callback: Callable[[], None]) -> None:
+    """Вызывать callback() при изменении данных прямым SQL (mark_finance_change) — сброс снимков в памяти."""
+    _invalidation_callbacks.append(callback)
+
+
+def mark_finance_change(session: Session) -> None:
+    """
+    Отметить изменение данных прямым SQL мимо ORM: версия кэша сменится при коммите сессии,
+    снимки подписчиков (колоночный движок) сбрасываются сразу.
+    """
+    session.info[_FLAG] = True
+    for callback in _invalidation_callbacks:
+        callback()
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session: Session) -> None:
+    if session.info.pop(_FLAG, False):
+        finance_cache.bump_version()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session: Session) -> None:
+    session.info.pop(_FLAG, None)
@@ -50,18 +50,20 @@ async def update_me(
     current_user: User = Depends(get_current_user_required),
 ):
     """Обновить профиль текущего пользователя (язык и т.д.)."""
+    # current_user загружен read-only сессией — изменяем копию из сессии записи
+    user = await db.get(User, current_user.id)
     if data.default_language is not None:
         if data.default_language not in ("sr", "ru"):
             raise HTTPException(400, "Язык должен быть sr или ru")
-        current_user.default_language = data.default_language
+        user.default_language = data.default_language
     await db.flush()
-    await db.refresh(current_user)
+    await db.refresh(user)
     return UserResponse(
-        id=current_user.id,
-        username=current_user.username,
-        full_name=current_user.full_name,
-        role=current_user.role,
-        default_language=current_user.default_language or "sr",
-        is_active=current_user.is_active,
-        created_at=current_user.created_at,
+        id=user.id,
+        username=user.username,
+        full_name=user.full_name,
+        role=user.role,
+        default_language=user.default_language or "sr",
+        is_active=user.is_active,
+        created_at=user.created_at,
     )
@@ -1,4 +1,5 @@
 """Импорт доходов и расходов из банковских изводов."""
+from collections import Counter
 from datetime import date, timedelta
 from typing import Optional, Any
 
@@ -10,7 +11,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from backend.database import get_db
 from backend.models import Income, Expense, User, CashTransaction, MonthlyObligation
 from backend.auth import get_current_user_required, require_edit_access
-from backend.services import allocate_next_invoice_number
+from backend.services import advance_sequence, reserve_invoice_numbers
 from backend.bank_parser import parse_izvod_xls
 
 router = APIRouter(prefix="/bank-import", tags=["bank-import"])
@@ -52,11 +53,14 @@ async def apply_import(
     """
     Создать доходы и расходы из выбранных транзакций.
     Формат: [{"type": "income"|"expense", "tx": {...}, "client_id": null, "invoice_number": null}]
+    Номера счетов без invoice_number выделяются блоком на год — один запрос к счётчику на весь импорт.
     """
     created_income = 0
     created_expense = 0
     errors = []
     transactions = body.transactions
+    rows = []
+    seen_refs = set()
 
     for i, item in enumerate(transactions):
         tx = item.tx
@@ -98,13 +102,26 @@ async def apply_import(
                 if r_ob.scalar_one_or_none():
                     errors.append(f"Строка {i + 1}: расход с номером платёжного поручения {ref} уже учтён в обязательствах")
                     continue
-
+            # Повтор референции внутри того же файла
+            if (tx_type, ref) in seen_refs:
+                errors.append(f"Строка {i + 1}: референция {ref} повторяется в импорте")
+                continue
+            seen_refs.add((tx_type, ref))
+        rows.append((item, tx_type, ref, d, amount, description, payer))
+
+    # Ручные номера поднимают счётчик до резервирования, блоки — по одному запросу на год
+    for item, tx_type, _, d, *_ in rows:
+        if tx_type == "income" and item.invoice_number:
+            await advance_sequence(db, "invoice_sequence", d.year, item.invoice_number)
+    need = Counter(d.year for item, tx_type, _, d, *_ in rows if tx_type == "income" and not item.invoice_number)
+    reserved = {year: iter(await reserve_invoice_numbers(db, year, n)) for year, n in need.items()}
+
+    for item, tx_type, ref, d, amount, description, payer in rows:
         if tx_type == "income":
             invoice_number = item.invoice_number
             invoice_year_val = d.year
             if not invoice_number:
-                next_n = await allocate_next_invoice_number(db, d.year)
-                invoice_number = f"{d.year}-{next_n:04d}"
+                invoice_number = f"{d.year}-{next(reserved[d.year]):04d}"
             income = Income(
                 issued_date=d,
                 invoice_number=invoice_number,
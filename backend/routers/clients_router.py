@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Client, User
 from backend.schemas import ClientCreate, ClientUpdate, ClientResponse, ClientBrief
 from backend.auth import get_current_user_required, require_edit_access
@@ -15,7 +15,7 @@ router = APIRouter(prefix="/clients", tags=["clients"])
 async def list_clients(
     search: str = Query("", description="Поиск по имени"),
     archived: bool = Query(False, description="Включая архивных"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список клиентов."""
@@ -32,7 +32,7 @@ async def list_clients(
 @router.get("/brief", response_model=list[ClientBrief])
 async def list_clients_brief(
     search: str = Query(""),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Краткий список для выпадающих списков."""
@@ -61,7 +61,7 @@ async def create_client(
 @router.get("/{client_id}", response_model=ClientResponse)
 async def get_client(
     client_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить клиента."""
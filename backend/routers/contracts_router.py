@@ -6,10 +6,11 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Contract, ContractItem, Client, User
 from backend.schemas import ContractCreate, ContractUpdate, ContractResponse, ContractItemCreate, ContractItemResponse
 from backend.auth import get_current_user_required, require_edit_access
+from backend.services import advance_sequence, allocate_next_contract_number, peek_next_sequence_number
 
 router = APIRouter(prefix="/contracts", tags=["contracts"])
 
@@ -21,7 +22,7 @@ async def list_contracts(
     year: Optional[int] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список договоров."""
@@ -44,25 +45,11 @@ async def list_contracts(
 @router.get("/next-number/")
 async def next_contract_number(
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
-    """Следующий номер договора."""
-    y = year or date.today().year
-    r = await db.execute(
-        select(Contract).where(
-            Contract.date >= date(y, 1, 1),
-            Contract.date <= date(y, 12, 31)
-        )
-    )
-    contracts = r.scalars().all()
-    nums = []
-    for c in contracts:
-        parts = str(c.number).split("-")
-        if len(parts) == 2 and parts[1].isdigit():
-            nums.append(int(parts[1]))
-    next_num = max(nums, default=0) + 1
-    return {"number": f"{y}-{next_num:04d}"}
+    """Следующий номер договора (чтение счётчика года, номер не выделяется)."""
+    return {"number": await peek_next_sequence_number(db, "contract_sequence", year or date.today().year)}
 
 
 @router.post("/create", response_model=ContractResponse)
@@ -87,8 +74,14 @@ async def create_contract(
     else:
         amount = data.amount
 
+    number = (data.number or "").strip()
+    if number:
+        await advance_sequence(db, "contract_sequence", data.date.year, number)
+    else:
+        number = f"{data.date.year}-{await allocate_next_contract_number(db, data.date.year):04d}"
+
     contract = Contract(
-        number=data.number,
+        number=number,
         date=data.date,
         client_id=data.client_id,
         project_id=data.project_id,
@@ -119,7 +112,7 @@ async def create_contract(
 
     await db.flush()
     await db.refresh(contract)
-    await db.refresh(contract, ["client", "items"])
+    await db.refresh(contract, ["client", "items", "incomes"])
     return _contract_to_response(contract)
 
 
@@ -163,7 +156,7 @@ def _contract_to_response(c: Contract) -> ContractResponse:
 @router.get("/{contract_id}", response_model=ContractResponse)
 async def get_contract(
     contract_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить договор."""
@@ -196,6 +189,8 @@ async def update_contract(
     items_data = data_dict.pop("items", None)
     for k, v in data_dict.items():
         setattr(contract, k, v)
+    if data_dict.get("number"):
+        await advance_sequence(db, "contract_sequence", contract.date.year, contract.number)
     if items_data is not None:
         for ci in list(contract.items):
             await db.delete(ci)
@@ -218,7 +213,7 @@ async def update_contract(
         contract.amount = amount
     await db.flush()
     await db.refresh(contract)
-    await db.refresh(contract, ["client", "items"])
+    await db.refresh(contract, ["client", "items", "incomes"])
     return _contract_to_response(contract)
 
 
@@ -1,17 +1,23 @@
 """Роутер дашборда и отчётов."""
 from datetime import date, timedelta
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import select, func
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from backend.database import get_db
-from backend.models import Income, Payment, Expense, PlannedExpense, PlannedExpensePayment, MonthlyObligation, PaymentType, User
-from backend.schemas import DashboardStats, DashboardIncomeResponse, IncomeLimitStatus, UpcomingObligationItem, UpcomingPlannedItem
+from backend.database import get_read_db
+from backend.models import Income, Payment, PlannedExpense, PlannedExpensePayment, MonthlyObligation, PaymentType, User
+from backend.schemas import (
+    DashboardStats, DashboardIncomeResponse, IncomeLimitStatus, IncomeLimitSeries, UpcomingObligationItem, UpcomingPlannedItem,
+)
 from backend.auth import get_current_user_required
-from backend.services import get_income_total, get_income_total_12_months, get_income_limit_status
+from backend.services import (
+    get_income_total, get_income_total_12_months, get_income_limit_status, get_income_limit_series, get_expense_total,
+)
 from backend.planned_expenses_service import planned_expenses_sum_until_including_overdue, payment_dates_in_range
-from backend.payments_service import get_or_create_obligations
 from backend.config import get_settings
+from backend.limit_forecast import get_income_limit_forecast, limit_forecast_available, MAX_PATHS
+from backend.result_cache import cached
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 settings = get_settings()
@@ -20,7 +26,7 @@ settings = get_settings()
 @router.get("", response_model=DashboardStats)
 async def get_dashboard(
     year: int = Query(None, description="Год (по умолчанию текущий)"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Сводные данные дашборда."""
@@ -31,23 +37,11 @@ async def get_dashboard(
     month_income = await get_income_total(db, year=y, month=today.month)
     limit_status = await get_income_limit_status(db, y)
 
-    # Расходы за год и месяц
-    r_yr = await db.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0)).where(
-            Expense.date >= date(y, 1, 1),
-            Expense.date <= date(y, 12, 31),
-        )
-    )
-    year_expenses = float(r_yr.scalar() or 0)
+    # Расходы за год и месяц (сторно учтено в своде)
+    year_expenses = await get_expense_total(db, date(y, 1, 1), date(y, 12, 31))
     import calendar
     last_day = calendar.monthrange(y, today.month)[1]
-    r_mo = await db.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0)).where(
-            Expense.date >= date(y, today.month, 1),
-            Expense.date <= date(y, today.month, last_day),
-        )
-    )
-    month_expenses = float(r_mo.scalar() or 0)
+    month_expenses = await get_expense_total(db, date(y, today.month, 1), date(y, today.month, last_day))
 
     balance_month = month_income - month_expenses
     balance_year = year_income - year_expenses
@@ -69,13 +63,12 @@ async def get_dashboard(
         planned_items, range_start, month_end, paid_pairs
     )
 
-    # Обязательные платежи: создаём если нет, добавляем в сумму до конца месяца и собираем предупреждения
-    await get_or_create_obligations(db, y)
+    # Обязательные платежи (сетка строится при изменении решений): сумма до конца месяца и предупреждения
     r_ob = await db.execute(
         select(MonthlyObligation).where(
             MonthlyObligation.year == y,
-            MonthlyObligation.status.in_(["unpaid", "overdue"]),
-        )
+            MonthlyObligation.status != "paid",
+        ).order_by(MonthlyObligation.deadline)
     )
     unpaid_ob = r_ob.scalars().all()
     pt_ids = list({o.payment_type_id for o in unpaid_ob})
@@ -174,10 +167,47 @@ async def get_dashboard(
 @router.get("/income-limits", response_model=IncomeLimitStatus)
 async def get_income_limits(
     year: int = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Статус лимитов дохода."""
     y = year or date.today().year
     status = await get_income_limit_status(db, y)
     return IncomeLimitStatus(**status)
+
+
+# Не больше 10 лет точек в одном ответе
+INCOME_LIMIT_SERIES_MAX_DAYS = 3660
+
+
+@router.get("/income-limits/series", response_model=IncomeLimitSeries)
+async def get_income_limits_series(
+    from_: date = Query(None, alias="from", description="Начало (по умолчанию 1 января текущего года)"),
+    to: date = Query(None, description="Конец (по умолчанию сегодня)"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Доход за скользящие 12 месяцев и с начала года на каждый день диапазона, с днём пика."""
+    today = date.today()
+    date_to = to or today
+    date_from = from_ or date(date_to.year, 1, 1)
+    if date_from > date_to:
+        raise HTTPException(400, "from позже to")
+    if (date_to - date_from).days >= INCOME_LIMIT_SERIES_MAX_DAYS:
+        raise HTTPException(400, f"Диапазон не больше {INCOME_LIMIT_SERIES_MAX_DAYS} дней")
+    return IncomeLimitSeries(**await get_income_limit_series(db, date_from, date_to))
+
+
+@router.get("/income-limits/forecast")
+async def get_income_limits_forecast(
+    paths: int = Query(None, ge=100, le=MAX_PATHS, description="Число симулированных путей"),
+    method: Literal["client", "total"] = Query("client", description="Бутстрап по клиентам или по дневной сумме"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Вероятность и ожидаемая дата превышения лимитов 6 млн и 8 млн (Монте-Карло, кэш по версии данных)."""
+    if not limit_forecast_available():
+        raise HTTPException(503, "Прогноз недоступен: не установлен numpy")
+    today = date.today()
+    params = {"today": today, "paths": paths, "method": method}
+    return await cached("income_limit_forecast", params, lambda: get_income_limit_forecast(db, paths, method, today))
@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Enterprise, User
 from backend.schemas import EnterpriseBase, EnterpriseUpdate, EnterpriseResponse
 from backend.auth import get_current_user_required, require_admin
@@ -13,7 +13,7 @@ router = APIRouter(prefix="/enterprise", tags=["enterprise"])
 
 @router.get("", response_model=EnterpriseResponse | None)
 async def get_enterprise(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить данные предприятия."""
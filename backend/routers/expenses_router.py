@@ -2,14 +2,14 @@
 from datetime import date
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select, func
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Expense, User, Project
 from backend.schemas import ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseReverseRequest, BulkAssignProject
 from backend.auth import get_current_user_required, require_edit_access
-from backend.services import create_expense_reversal
+from backend.services import create_expense_reversal, get_expense_total
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
@@ -21,7 +21,7 @@ async def list_expenses(
     category: Optional[str] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список расходов с фильтрацией."""
@@ -92,7 +92,7 @@ async def bulk_assign_project_expenses(
 @router.get("/{expense_id}", response_model=ExpenseResponse)
 async def get_expense(
     expense_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить расход."""
@@ -175,7 +175,7 @@ async def delete_expense(
 async def get_expense_totals(
     year: Optional[int] = Query(None),
     month: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Суммы расходов за год и месяц."""
@@ -183,22 +183,10 @@ async def get_expense_totals(
     y = year or today.year
     m = month or today.month
 
-    r_year = await db.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0)).where(
-            Expense.date >= date(y, 1, 1),
-            Expense.date <= date(y, 12, 31),
-        )
-    )
-    year_total = float(r_year.scalar() or 0)
+    year_total = await get_expense_total(db, date(y, 1, 1), date(y, 12, 31))
 
     import calendar
     last_day = calendar.monthrange(y, m)[1]
-    r_month = await db.execute(
-        select(func.coalesce(func.sum(Expense.amount), 0)).where(
-            Expense.date >= date(y, m, 1),
-            Expense.date <= date(y, m, last_day),
-        )
-    )
-    month_total = float(r_month.scalar() or 0)
+    month_total = await get_expense_total(db, date(y, m, 1), date(y, m, last_day))
 
     return {"year_expenses": year_total, "month_expenses": month_total}
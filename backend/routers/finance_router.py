@@ -1,17 +1,35 @@
 """Роутер финансовых отчётов (accrual/cash)."""
 from datetime import date
 from typing import Optional, Literal
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-from backend.database import get_db
+from backend.database import get_read_db
 from backend.models import User
 from backend.auth import get_current_user_required
-from backend.finance_service import get_finance_summary, get_accounts_receivable, get_cashflow, get_finance_by_project
+from backend.result_cache import cached, finance_cache
+from backend.forecast_service import get_cash_forecast, forecast_available, MAX_HORIZON_MONTHS
+from backend.finance_service import (
+    get_finance_summary, get_accounts_receivable, decode_ar_cursor, get_cashflow, get_cash_balance,
+    get_finance_by_project, get_finance_cube, CUBE_DIMENSIONS, CUBE_MEASURES, shape_series,
+    parse_compare_to,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/finance", tags=["finance"])
 
 
+def _check_compare_to(compare_to: Optional[str], date_from: date, date_to: date) -> None:
+    if compare_to is None:
+        return
+    try:
+        parse_compare_to(compare_to, date_from, date_to)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail="Неверный compare_to: previous_period | previous_year | <N>d|w|m|y",
+        )
+
+
 @router.get("/summary")
 async def finance_summary(
     from_: date = Query(..., alias="from", description="Начало периода"),
@@ -23,7 +41,11 @@ async def finance_summary(
     project_id: Optional[int] = Query(None),
     category: Optional[str] = Query(None),
     is_tax_related: Optional[bool] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    sparse: bool = Query(False, description="Не возвращать периоды с нулевыми мерами"),
+    max_points: Optional[int] = Query(None, ge=3, le=10000, description="Прорядить ряд до N точек (LTTB)"),
+    format_: Literal["rows", "columns"] = Query("rows", alias="format", description="columns — параллельные массивы"),
+    compare_to: Optional[str] = Query(None, description="Сравнение: previous_period | previous_year | смещение назад <N>d|w|m|y"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Финансовый агрегатор: метрики accrual и cash по периодам."""
@@ -38,16 +60,46 @@ async def finance_summary(
         filters["category"] = category
     if is_tax_related is not None:
         filters["is_tax_related"] = is_tax_related
-    return await get_finance_summary(db, from_, to, group_by, mode, filters)
+    _check_compare_to(compare_to, from_, to)
+    params = {"from": from_, "to": to, "group_by": group_by, "mode": mode, "compare_to": compare_to, **filters}
+
+    def summary():
+        return get_finance_summary(db, from_, to, group_by, mode, filters, compare_to=compare_to)
+
+    if not (sparse or max_points or format_ == "columns"):
+        return await cached("summary", params, summary)
+
+    async def compute():
+        result = await cached("summary", params, summary)
+        return shape_series(result, sparse=sparse, max_points=max_points, columnar=format_ == "columns")
+
+    shaped = {**params, "sparse": sparse, "max_points": max_points, "format": format_}
+    return await cached("summary_shaped", shaped, compute)
 
 
 @router.get("/ar")
 async def finance_ar(
-    db: AsyncSession = Depends(get_db),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы (по умолчанию — все)"),
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    bucket: Optional[Literal["0_30", "31_60", "61_90", "90_plus"]] = Query(None),
+    totals_only: bool = Query(False, description="Только итоги и подытоги по клиентам"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
-    """Дебиторская задолженность: unpaid incomes (paid_date is null)."""
-    return await get_accounts_receivable(db)
+    """Дебиторская задолженность: unpaid incomes (paid_date is null), старение и подытоги по клиентам."""
+    if cursor:
+        try:
+            decode_ar_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Неверный cursor")
+    # days_outstanding зависит от текущей даты
+    today = date.today()
+    params = {"today": today, "limit": limit, "cursor": cursor, "bucket": bucket, "totals_only": totals_only}
+    return await cached(
+        "ar",
+        params,
+        lambda: get_accounts_receivable(db, today, limit=limit, cursor=cursor, bucket=bucket, totals_only=totals_only),
+    )
 
 
 @router.get("/cashflow")
@@ -55,11 +107,22 @@ async def finance_cashflow(
     from_: date = Query(..., alias="from", description="Начало периода"),
     to: date = Query(..., alias="to", description="Конец периода"),
     group_by: Literal["day", "month", "year"] = Query("month"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Cash flow: opening + inflow - outflow = closing (cumulative)."""
-    return await get_cashflow(db, from_, to, group_by)
+    params = {"from": from_, "to": to, "group_by": group_by}
+    return await cached("cashflow", params, lambda: get_cashflow(db, from_, to, group_by))
+
+
+@router.get("/balance")
+async def finance_balance(
+    as_of: date = Query(..., description="Дата: остаток на начало дня"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Остаток денежных средств на дату (по месячным контрольным точкам)."""
+    return await cached("balance", {"as_of": as_of}, lambda: get_cash_balance(db, as_of))
 
 
 @router.get("/by-project")
@@ -67,8 +130,83 @@ async def finance_by_project(
     from_: date = Query(..., alias="from", description="Начало периода"),
     to: date = Query(..., alias="to", description="Конец периода"),
     mode: Literal["accrual", "cash"] = Query("accrual"),
-    db: AsyncSession = Depends(get_db),
+    status: Optional[str] = Query(None, description="Статус проекта: lead | active | completed | archived"),
+    client_id: Optional[int] = Query(None),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы (по умолчанию — все проекты)"),
+    compare_to: Optional[str] = Query(None, description="Сравнение: previous_period | previous_year | смещение назад <N>d|w|m|y"),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Аналитика по проектам: revenue, expenses, profit."""
-    return await get_finance_by_project(db, from_, to, mode)
+    _check_compare_to(compare_to, from_, to)
+    params = {
+        "from": from_, "to": to, "mode": mode, "status": status, "client_id": client_id,
+        "skip": skip, "limit": limit, "compare_to": compare_to,
+    }
+    return await cached(
+        "by-project",
+        params,
+        lambda: get_finance_by_project(
+            db, from_, to, mode, status=status, client_id=client_id, skip=skip, limit=limit, compare_to=compare_to
+        ),
+    )
+
+
+def _parse_list(value: Optional[str], allowed: tuple[str, ...], name: str) -> list[str]:
+    items = [v.strip() for v in (value or "").split(",") if v.strip()]
+    unknown = [v for v in items if v not in allowed]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные {name}: {', '.join(unknown)}. Допустимо: {', '.join(allowed)}",
+        )
+    return list(dict.fromkeys(items))
+
+
+@router.get("/cube")
+async def finance_cube(
+    from_: date = Query(..., alias="from", description="Начало периода"),
+    to: date = Query(..., alias="to", description="Конец периода"),
+    dims: Optional[str] = Query(None, description="Измерения через запятую: " + ", ".join(CUBE_DIMENSIONS)),
+    measures: Optional[str] = Query(None, description="Меры через запятую (по умолчанию все): " + ", ".join(CUBE_MEASURES)),
+    period: Literal["day", "week", "month", "quarter", "year"] = Query("month"),
+    subtotals: bool = Query(False, description="Добавить подытоги по всем подмножествам измерений"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Финансовый куб для сводных таблиц: любые измерения × меры одним запросом."""
+    dim_list = _parse_list(dims, CUBE_DIMENSIONS, "измерения")
+    measure_list = _parse_list(measures, CUBE_MEASURES, "меры") or list(CUBE_MEASURES)
+    params = {
+        "from": from_, "to": to, "dims": tuple(dim_list), "measures": tuple(measure_list),
+        "period": period, "subtotals": subtotals,
+    }
+    return await cached(
+        "cube",
+        params,
+        lambda: get_finance_cube(db, from_, to, dim_list, measure_list, period=period, subtotals=subtotals),
+    )
+
+
+@router.get("/forecast")
+async def finance_forecast(
+    months: int = Query(12, ge=1, le=MAX_HORIZON_MONTHS, description="Горизонт прогноза, месяцев"),
+    granularity: Literal["day", "month"] = Query("month"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Прогноз остатка денег: дебиторка, планируемые расходы, обязательства; прогноз лимитов паушала."""
+    if not forecast_available():
+        raise HTTPException(status_code=503, detail="Прогноз недоступен: не установлен numpy")
+    today = date.today()
+    params = {"today": today, "months": months, "granularity": granularity}
+    return await cached("forecast", params, lambda: get_cash_forecast(db, months, granularity, today))
+
+
+@router.get("/cache-stats")
+async def finance_cache_stats(
+    current_user: User = Depends(get_current_user_required),
+):
+    """Состояние кэша отчётов: версия данных, записи, объём, hits/misses."""
+    return finance_cache.stats()
@@ -7,11 +7,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import IntegrityError
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Income, Client, User, CashTransaction, Project
 from backend.schemas import IncomeCreate, IncomeUpdate, IncomeResponse, IncomeMarkPaid, BulkAssignProject
 from backend.auth import get_current_user_required, require_edit_access
-from backend.services import get_income_total, get_next_invoice_number, allocate_next_invoice_number
+from backend.services import (
+    get_income_total, allocate_next_invoice_number, advance_sequence, peek_next_sequence_number, invoice_number_gaps,
+)
 
 router = APIRouter(prefix="/income", tags=["income"])
 
@@ -23,7 +25,7 @@ async def list_income(
     client_id: Optional[int] = Query(None),
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список доходов с фильтрацией."""
@@ -79,6 +81,7 @@ async def create_income(
         invoice_number = f"{year}-{next_n:04d}"
     else:
         invoice_year_val = data.invoice_year or _invoice_year_from_number(invoice_number) or (data.issued_date.year if data.issued_date else date.today().year)
+        await advance_sequence(db, "invoice_sequence", invoice_year_val, invoice_number)
 
     status_val = data.status or ("paid" if data.paid_date else "issued")
     income = Income(
@@ -124,7 +127,7 @@ async def create_income(
 async def check_invoice_exists(
     invoice_number: str = Query(..., description="Номер счёта"),
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Проверить, существует ли счёт с таким номером в указанном году (период счёта)."""
@@ -144,21 +147,21 @@ async def check_invoice_exists(
 @router.get("/next-invoice-number")
 async def next_invoice_number(
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
-    """Следующий номер счёта за год (NNNN сбрасывается на 0001 в новом году)."""
-    y = year or date.today().year
-    r = await db.execute(
-        select(Income).where(
-            or_(
-                Income.invoice_year == y,
-                and_(Income.invoice_year.is_(None), Income.issued_date >= date(y, 1, 1), Income.issued_date <= date(y, 12, 31)),
-            )
-        )
-    )
-    incomes = r.scalars().all()
-    return {"invoice_number": get_next_invoice_number(incomes, y)}
+    """Следующий номер счёта за год (NNNN сбрасывается на 0001 в новом году): чтение invoice_sequence."""
+    return {"invoice_number": await peek_next_sequence_number(db, "invoice_sequence", year or date.today().year)}
+
+
+@router.get("/invoice-number-gaps")
+async def invoice_number_gaps_report(
+    year: Optional[int] = Query(None),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Пропуски нумерации счетов за год (удалённые счета, неиспользованные номера зарезервированных блоков)."""
+    return await invoice_number_gaps(db, year or date.today().year)
 
 
 @router.post("/bulk-assign-project")
@@ -188,7 +191,7 @@ async def bulk_assign_project_income(
 @router.get("/{income_id}", response_model=IncomeResponse)
 async def get_income(
     income_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить запись дохода."""
@@ -287,6 +290,8 @@ async def update_income(
     paid_date_new = dump.get("paid_date")
     for k, v in dump.items():
         setattr(income, k, v)
+    if dump.get("invoice_number"):
+        await advance_sequence(db, "invoice_sequence", income.invoice_year or _invoice_year_from_number(income.invoice_number), income.invoice_number)
     if "paid_date" in dump or "status" in dump:
         income.is_paid = income.status == "paid"
     await db.flush()
@@ -342,4 +347,5 @@ async def delete_income(
         await db.delete(ct)
         await db.flush()
     await db.delete(income)
+    await db.flush()  # ошибки записи (закрытый период) — до отправки ответа, а не при коммите
     return {"ok": True}
@@ -1,13 +1,13 @@
 """Роутер обязательных платежей (решения Пореске управе) — ТЗ."""
 from datetime import date
-from typing import Optional
+from typing import Literal, Optional
 import calendar
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.services import create_expense_reversal
-from backend.models import PaymentType, YearDecision, MonthlyObligation, Enterprise, User, Expense
+from backend.models import PaymentType, YearDecision, MonthlyObligation, User, Expense
 from backend.schemas import (
     PaymentTypeResponse,
     YearDecisionCreate,
@@ -18,12 +18,23 @@ from backend.schemas import (
     IPSQRData,
 )
 from backend.auth import get_current_user_required, require_edit_access
+from backend.ips_qr import MEDIA_TYPES, qr_cache
+from backend.payment_orders import (
+    MEDIA_TYPES as ORDER_MEDIA_TYPES,
+    OrdersFormat,
+    load_obligation_order,
+    load_payment_orders,
+    render_payment_orders,
+)
 from backend.payments_service import (
     ensure_payment_types,
-    get_or_create_obligations,
+    ensure_obligation_grid,
+    list_obligations as load_obligations,
+    obligation_status,
     deadline_for_month,
-    payment_purpose_with_year,
     presets_2026,
+    rollover_years,
+    MAX_ROLLOVER_YEARS,
 )
 
 router = APIRouter(prefix="/obligations", tags=["obligations"])
@@ -36,13 +47,40 @@ async def generate_obligations(
     current_user: User = Depends(require_edit_access),
 ):
     """
-    Создать/обновить MonthlyObligation на 12 месяцев по активным YearDecision.
-    Берёт YearDecision где year=YYYY и is_active=true.
-    Не создаёт дубликаты и не изменяет оплаченные обязательства.
+    Пересобрать MonthlyObligation на 12 месяцев по активным YearDecision (year=YYYY, is_active=true).
+    Обычно не нужно: сетка строится при каждом изменении решений. Дубликаты исключены
+    уникальным (year, month, payment_type_id), оплаченные обязательства не изменяются.
+    """
+    await ensure_payment_types(db)
+    await ensure_obligation_grid(db, year, force=True)
+    return {"ok": True, "count": len(await load_obligations(db, year))}
+
+
+@router.post("/rollover")
+async def rollover_obligations(
+    year_from: int = Query(..., description="Первый год"),
+    year_to: int = Query(..., description="Последний год"),
+    clone: bool = Query(True, description="Создать привременые решения из решений прошлого года"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_edit_access),
+):
+    """
+    Перенос решений и сетки обязательств за годы year_from..year_to одной транзакцией: каждый год
+    после первого получает привременые решения из прошлого (позив — poziv_na_broj_next) для типов
+    без решения, затем сетку 12 месяцев. Повторный вызов ничего не добавляет.
     """
+    if year_from > year_to:
+        raise HTTPException(400, "year_from позже year_to")
+    if year_to - year_from + 1 > MAX_ROLLOVER_YEARS:
+        raise HTTPException(400, f"Не более {MAX_ROLLOVER_YEARS} лет за раз")
     await ensure_payment_types(db)
-    obligations = await get_or_create_obligations(db, year, None)
-    return {"ok": True, "count": len(obligations)}
+    years = await rollover_years(db, year_from, year_to, clone)
+    return {
+        "ok": True,
+        "years": years,
+        "decisions_created": sum(y["decisions_created"] for y in years),
+        "obligations_created": sum(y["obligations_created"] for y in years),
+    }
 
 
 @router.get("/types", response_model=list[PaymentTypeResponse])
@@ -60,42 +98,33 @@ async def list_payment_types(
 async def list_obligations(
     year: int = Query(..., description="Год"),
     payment_type: Optional[str] = Query(None, description="Код типа: tax, pio, health, unemployment"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
-    """Календарь обязательств за год. Создаёт обязательства если их нет (по решениям)."""
-    await ensure_payment_types(db)
-    obligations = await get_or_create_obligations(db, year, payment_type)
-    pt_ids = list({ob.payment_type_id for ob in obligations})
-    type_map = {}
-    if pt_ids:
-        r_pt = await db.execute(select(PaymentType).where(PaymentType.id.in_(pt_ids)))
-        for t in r_pt.scalars().all():
-            type_map[t.id] = t
-    result = []
-    for ob in obligations:
-        pt = type_map.get(ob.payment_type_id)
-        d = MonthlyObligationResponse(
+    """Календарь обязательств за год (только чтение; просрочка — по deadline на сегодня)."""
+    today = date.today()
+    return [
+        MonthlyObligationResponse(
             id=ob.id,
             year=ob.year,
             month=ob.month,
             payment_type_id=ob.payment_type_id,
-            payment_type_code=pt.code if pt else None,
-            payment_type_name=pt.name_sr if pt else None,
+            payment_type_code=pt.code,
+            payment_type_name=pt.name_sr,
             amount=ob.amount,
             deadline=ob.deadline.isoformat(),
-            status=ob.status,
+            status=obligation_status(ob, today),
             paid_date=ob.paid_date,
             payment_reference=ob.payment_reference,
         )
-        result.append(d)
-    return result
+        for ob, pt in await load_obligations(db, year, payment_type)
+    ]
 
 
 @router.get("/decisions", response_model=list[YearDecisionResponse])
 async def list_decisions(
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список решений по годам."""
@@ -129,7 +158,7 @@ async def list_decisions(
 @router.get("/decisions/{dec_id}", response_model=YearDecisionResponse)
 async def get_decision(
     dec_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить решение по id."""
@@ -306,68 +335,137 @@ async def mark_obligation_unpaid(
                 created_by=current_user.id,
             )
         ob.expense_id = None
-    today = date.today()
-    ob.status = "overdue" if ob.deadline < today else "unpaid"
+    ob.status = "unpaid"
     ob.paid_date = None
     ob.payment_reference = None
     return {"ok": True}
 
 
+async def _obligation_ips_data(db: AsyncSession, ob_id: int) -> IPSQRData:
+    """Реквизиты поручения и строка IPS QR: обязательство, решение и тип — одним запросом."""
+    o = await load_obligation_order(db, ob_id)
+    if o is None:
+        raise HTTPException(404, "Обязательство не найдено")
+    return IPSQRData(
+        payer=o["payer"], recipient=o["recipient"], account=o["recipient_account_stored"],
+        account_formatted=o["recipient_account"], amount=o["amount"], currency=o["currency"],
+        purpose=o["purpose"], model=o["model"], reference=o["reference"],
+        payment_code=o["payment_code"] or None, payload=o["payload"],
+    )
+
+
 @router.get("/obligations/{ob_id}/ips-qr", response_model=IPSQRData)
 async def get_ips_qr(
     ob_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Данные для IPS QR (NBS) по обязательству."""
-    ob = await db.get(MonthlyObligation, ob_id)
-    if not ob or not ob.decision_id:
-        raise HTTPException(404, "Обязательство не найдено")
-    dec = await db.get(YearDecision, ob.decision_id)
-    if not dec:
-        raise HTTPException(404, "Решение не найдено")
-    ent = await db.execute(select(Enterprise).limit(1))
-    e = ent.scalar_one_or_none()
-    payer = f"{e.name or 'Предузетник'}" if e else "Предузетник"
-    if e and e.address:
-        payer += f", {e.address}"
-    purpose = payment_purpose_with_year(dec.payment_purpose, ob.year)
-    return IPSQRData(
-        payer=payer,
-        recipient=dec.recipient_name,
-        account=dec.recipient_account,
-        amount=ob.amount,
-        currency=dec.currency,
-        purpose=purpose,
-        model=dec.model,
-        reference=dec.poziv_na_broj,
+    return await _obligation_ips_data(db, ob_id)
+
+
+@router.get("/obligations/{ob_id}/ips-qr/image")
+async def get_ips_qr_image(
+    ob_id: int,
+    request: Request,
+    format: Literal["png", "svg"] = Query("png"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    Изображение IPS QR (PNG или SVG), отрисованное на сервере. Кэш по хешу строки поручения
+    (память + диск); ETag — тот же хеш, If-None-Match отвечает 304.
+    """
+    data = await _obligation_ips_data(db, ob_id)
+    digest, image = await qr_cache.get(data.payload, format)
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=image, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+def _month_arg(value: str) -> date:
+    try:
+        y, m = value.split("-")
+        return date(int(y), int(m), 1)
+    except ValueError:
+        raise HTTPException(400, f"Месяц ожидается как YYYY-MM: {value}")
+
+
+@router.get("/ips-qr/sheet")
+async def get_ips_qr_sheet(
+    year: int = Query(..., description="Год"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """PDF для печати: неоплаченные обязательства года с QR и реквизитами, по сроку (4 на страницу A4)."""
+    orders = await load_payment_orders(db, date(year, 1, 1), date(year, 12, 1))
+    if not orders:
+        raise HTTPException(404, "Нет неоплаченных обязательств за год")
+    pdf = await render_payment_orders(f"IPS QR — неплаћене обавезе {year}", orders, "pdf")
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f"attachment; filename=ips_qr_{year}.pdf"},
+    )
+
+
+@router.get("/payment-orders")
+async def get_payment_orders(
+    year: Optional[int] = Query(None, description="Год (весь год)"),
+    month_from: Optional[str] = Query(None, alias="from", description="Первый месяц YYYY-MM"),
+    month_to: Optional[str] = Query(None, alias="to", description="Последний месяц YYYY-MM"),
+    include_planned: bool = Query(False, description="Добавить неоплаченные платежи планируемых расходов"),
+    format: OrdersFormat = Query("pdf"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """
+    Пакет платёжных поручений (налог за пренос) по неоплаченным обязательствам за год или
+    диапазон месяцев from..to: pdf — листы с IPS QR, csv/xml — файл для импорта в е-банкинг.
+    """
+    if month_from or month_to:
+        first = _month_arg(month_from or month_to)
+        last = _month_arg(month_to or month_from)
+    elif year is not None:
+        first, last = date(year, 1, 1), date(year, 12, 1)
+    else:
+        raise HTTPException(400, "Укажите year или from/to")
+    if first > last:
+        raise HTTPException(400, "Начало диапазона позже конца")
+    orders = await load_payment_orders(db, first, last, include_planned=include_planned)
+    if not orders:
+        raise HTTPException(404, "Нет неоплаченных поручений за период")
+    span = f"{first:%Y-%m}" if first == last else f"{first:%Y-%m}_{last:%Y-%m}"
+    content = await render_payment_orders(f"Налози за пренос {span.replace('_', ' — ')}", orders, format)
+    return Response(
+        content=content,
+        media_type=ORDER_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename=nalozi_{span}.{format}",
+            "X-Orders-Count": str(len(orders)),
+        },
     )
 
 
 @router.get("/summary")
 async def get_obligations_summary(
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Сводка: к оплате, просрочено (для дашборда)."""
     y = year or date.today().year
     r = await db.execute(
-        select(MonthlyObligation).where(MonthlyObligation.year == y)
+        select(MonthlyObligation).where(MonthlyObligation.year == y, MonthlyObligation.status != "paid")
     )
     items = r.scalars().all()
     today = date.today()
-    unpaid_count = sum(1 for i in items if i.status in ("unpaid", "overdue"))
-    overdue_count = sum(1 for i in items if i.status == "overdue")
-    overdue_sum = sum(i.amount for i in items if i.status == "overdue")
-    next_deadline = None
-    for i in sorted(items, key=lambda x: x.deadline):
-        if i.status in ("unpaid", "overdue") and i.deadline >= today:
-            next_deadline = i.deadline.isoformat()
-            break
+    overdue = [i for i in items if i.deadline < today]
+    upcoming = [i.deadline for i in items if i.deadline >= today]
     return {
-        "unpaid_count": unpaid_count,
-        "overdue_count": overdue_count,
-        "overdue_sum": overdue_sum,
-        "next_deadline": next_deadline,
+        "unpaid_count": len(items),
+        "overdue_count": len(overdue),
+        "overdue_sum": sum(i.amount for i in overdue),
+        "next_deadline": min(upcoming).isoformat() if upcoming else None,
     }
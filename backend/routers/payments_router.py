@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Payment, ContributionRates, User
 from backend.schemas import PaymentResponse, PaymentUpdate, ContributionRatesCreate, ContributionRatesResponse
 from backend.auth import get_current_user_required, require_edit_access
@@ -35,7 +35,7 @@ async def list_payments(
 @router.get("/rates", response_model=list[ContributionRatesResponse])
 async def list_rates(
     year: Optional[int] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список ставок налогов и взносов."""
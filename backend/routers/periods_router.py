@@ -0,0 +1,53 @@
+"""Роутер закрытия периодов (месяцев)."""
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import get_db, get_read_db
+from backend.models import PeriodClosure, User, UserRole
+from backend.schemas import PeriodCloseRequest, PeriodClosureResponse
+from backend.auth import get_current_user_required, require_role
+from backend.period_closing import close_period, get_closure, reopen_period
+
+router = APIRouter(prefix="/periods", tags=["periods"])
+
+
+@router.get("", response_model=list[PeriodClosureResponse])
+async def list_closures(
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_required),
+):
+    """Закрытые периоды, от последнего к первому."""
+    r = await db.execute(select(PeriodClosure).order_by(PeriodClosure.year.desc(), PeriodClosure.month.desc()))
+    return r.scalars().all()
+
+
+@router.post("/close", response_model=PeriodClosureResponse)
+async def close(
+    data: PeriodCloseRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_role(UserRole.ADMIN, UserRole.ACCOUNTANT)),
+):
+    """Закрыть месяц: снапшот агрегатов и КПО, дальнейшие записи в месяц запрещены (409)."""
+    today = date.today()
+    if (data.year, data.month) >= (today.year, today.month):
+        raise HTTPException(status_code=400, detail="Можно закрыть только завершившийся месяц")
+    if await get_closure(db, data.year, data.month):
+        raise HTTPException(status_code=409, detail="Период уже закрыт")
+    return await close_period(db, data.year, data.month, current_user.id)
+
+
+@router.post("/reopen")
+async def reopen(
+    data: PeriodCloseRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(require_role(UserRole.ADMIN, UserRole.ACCOUNTANT)),
+):
+    """Открыть месяц заново: снапшоты удаляются, отчёты снова читают свод."""
+    closure = await get_closure(db, data.year, data.month)
+    if closure is None:
+        raise HTTPException(status_code=404, detail="Период не закрыт")
+    await reopen_period(db, closure)
+    return {"ok": True}
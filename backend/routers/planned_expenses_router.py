@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.services import create_expense_reversal
 from backend.models import PlannedExpense, PlannedExpensePayment, Expense, User
 from backend.planned_expenses_service import next_payment_dates, payment_dates_in_range
@@ -26,7 +26,7 @@ router = APIRouter(prefix="/planned-expenses", tags=["planned-expenses"])
 async def list_planned_expenses(
     is_active: Optional[bool] = Query(None),
     category: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список планируемых расходов."""
@@ -43,7 +43,7 @@ async def list_planned_expenses(
 @router.get("/upcoming", response_model=list[UpcomingPaymentItem])
 async def get_upcoming_payments(
     days: int = Query(60, ge=1, le=365),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Предстоящие платежи: просроченные + в ближайшие N дней. Неоплаченные по дате, оплаченные в конце."""
@@ -197,7 +197,7 @@ async def create_planned_expense(
 @router.get("/{expense_id}", response_model=PlannedExpenseResponse)
 async def get_planned_expense(
     expense_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить планируемый расход."""
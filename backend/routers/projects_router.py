@@ -4,7 +4,7 @@ from sqlalchemy import case, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from backend.database import get_db
+from backend.database import get_db, get_read_db
 from backend.models import Project, User
 from backend.schemas import ProjectCreate, ProjectUpdate, ProjectResponse
 from backend.auth import get_current_user_required, require_edit_access
@@ -26,7 +26,7 @@ def _project_status_sort_order():
 @router.get("", response_model=list[ProjectResponse])
 async def list_projects(
     show_archived: bool = Query(False, description="Показывать архивированные"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Список проектов. Сортировка: active/lead → completed → archived, затем по name."""
@@ -62,7 +62,7 @@ async def create_project(
 @router.get("/{project_id}", response_model=ProjectResponse)
 async def get_project(
     project_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Получить проект."""
@@ -1,15 +1,17 @@
 """Роутер отчётов и экспорта."""
+import calendar
 from datetime import date
 from io import BytesIO
+from typing import Optional
 from fastapi import APIRouter, Depends, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from backend.database import get_db
-from backend.models import Income, Client, Enterprise, User
+from backend.database import get_read_db
+from backend.models import Enterprise, User
 from backend.auth import get_current_user_required
+from backend.period_closing import kpo_rows
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -19,29 +21,28 @@ from reportlab.lib.units import cm
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
+def _kpo_range(year: int, month: Optional[int]) -> tuple[date, date]:
+    """Границы книги КПО: год или месяц года."""
+    if month:
+        return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+    return date(year, 1, 1), date(year, 12, 31)
+
+
 @router.get("/kpo/csv")
 async def export_kpo_csv(
     year: int = Query(...),
     month: int = Query(None, description="Месяц (опционально)"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Экспорт книги КПО в CSV."""
-    q = select(Income).options(selectinload(Income.client)).where(
-        Income.issued_date >= date(year, 1, 1),
-        Income.issued_date <= date(year, 12, 31)
-    ).order_by(Income.issued_date, Income.id)
-    if month:
-        import calendar
-        last = calendar.monthrange(year, month)[1]
-        q = q.where(Income.issued_date >= date(year, month, 1), Income.issued_date <= date(year, month, last))
-    r = await db.execute(q)
-    incomes = list(r.scalars().all())
+    incomes = await kpo_rows(db, *_kpo_range(year, month))
 
     lines = ["Дата;№ счёта;Клиент;Основание;Сумма (RSD)"]
     for i in incomes:
-        client = i.client_name or (i.client.name if i.client else "")
-        lines.append(f"{i.issued_date};{i.invoice_number};{client};{i.description or ''};{i.amount_rsd:.2f}")
+        lines.append(
+            f"{i['issued_date']};{i['invoice_number']};{i['client_name'] or ''};{i['description'] or ''};{i['amount_rsd']:.2f}"
+        )
 
     content = "\n".join(lines).encode("utf-8-sig")
     return StreamingResponse(
@@ -55,20 +56,11 @@ async def export_kpo_csv(
 async def export_kpo_pdf(
     year: int = Query(...),
     month: int = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user_required),
 ):
     """Экспорт книги КПО в PDF."""
-    q = select(Income).options(selectinload(Income.client)).where(
-        Income.issued_date >= date(year, 1, 1),
-        Income.issued_date <= date(year, 12, 31)
-    ).order_by(Income.issued_date, Income.id)
-    if month:
-        import calendar
-        last = calendar.monthrange(year, month)[1]
-        q = q.where(Income.issued_date >= date(year, month, 1), Income.issued_date <= date(year, month, last))
-    r = await db.execute(q)
-    incomes = list(r.scalars().all())
+    incomes = await kpo_rows(db, *_kpo_range(year, month))
 
     r_ent = await db.execute(select(Enterprise).limit(1))
     ent = r_ent.scalar_one_or_none()
@@ -93,9 +85,9 @@ async def export_kpo_pdf(
     data = [["Датум", "Бр. рачуна", "Клијент", "Основа", "Износ (RSD)"]]
     total = 0
     for i in incomes:
-        client = i.client_name or (i.client.name if i.client else "-")
-        data.append([str(i.issued_date), i.invoice_number, client[:30], (i.description or "")[:40], f"{i.amount_rsd:,.2f}"])
-        total += i.amount_rsd
+        client = i["client_name"] or "-"
+        data.append([str(i["issued_date"]), i["invoice_number"], client[:30], (i["description"] or "")[:40], f"{i['amount_rsd']:,.2f}"])
+        total += i["amount_rsd"]
 
     data.append(["", "", "", "УКУПНО:", f"{total:,.2f}"])
 
@@ -0,0 +1,16 @@
+"""Роутер фонового планировщика: состояние задач."""
+from fastapi import APIRouter, Depends
+
+from backend.models import User, UserRole
+from backend.auth import require_role
+from backend.scheduler import scheduler
+
+router = APIRouter(prefix="/scheduler", tags=["scheduler"])
+
+
+@router.get("/status")
+async def scheduler_status(
+    current_user: User = Depends(require_role(UserRole.ADMIN, UserRole.ACCOUNTANT)),
+):
+    """Задачи планировщика: расписание, последний запуск, статус, длительности, следующий запуск; владелец блокировки."""
+    return await scheduler.status()
@@ -0,0 +1,214 @@
+"""Фоновый планировщик задач: asyncio-задача в процессе приложения (запуск из main.lifespan).
+
+Каждые scheduler_tick_seconds экземпляр берёт или продлевает блокировку scheduler_lock
+(аренда scheduler_lock_ttl_seconds): при нескольких воркерах задачи выполняет только владелец,
+после падения владельца блокировку забирает другой. Отметки последнего запуска хранятся
+в scheduler_jobs — после перезапуска просроченная задача выполняется на первом такте.
+
+Задачи (каждая — в своей транзакции писателя):
+- aggregates — каждые scheduler_aggregates_minutes: точки остатка (cash_checkpoints) до прошлого
+  месяца и сетки обязательств текущего и следующего года (по штампу решений).
+Просрочку обязательств задача не хранит: статус overdue вычисляется при чтении по deadline
+(payments_service.obligation_status). Время отметок — локальное (как date.today() в остальном коде).
+Состояние (status) читается через пул чтения и не занимает подключение писателя.
+"""
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+
+from backend.cash_checkpoints import refresh_cash_checkpoints
+from backend.config import get_settings
+from backend.database import AsyncSessionLocal, ReadSessionLocal
+from backend.models import SchedulerJob, SchedulerLock
+from backend.payments_service import sync_obligation_grid
+from backend.result_cache import finance_cache
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class Job(NamedTuple):
+    name: str
+    schedule: str  # Описание расписания для статуса
+    next_run: Callable[[Optional[datetime]], Optional[datetime]]  # None — на ближайшем такте
+    run: Callable[[Connection, datetime], dict]
+
+
+def every(minutes: int) -> Callable[[Optional[datetime]], Optional[datetime]]:
+    return lambda last: None if last is None else last + timedelta(minutes=minutes)
+
+
+def _aggregates_job(conn: Connection, now: datetime) -> dict:
+    return {
+        "cash_checkpoints": refresh_cash_checkpoints(conn, now.date()),
+        "obligations": sum(sync_obligation_grid(conn, y) for y in (now.year, now.year + 1)),
+    }
+
+
+JOBS = [
+    Job("aggregates", f"каждые {settings.scheduler_aggregates_minutes} мин",
+        every(settings.scheduler_aggregates_minutes), _aggregates_job),
+]
+
+ACQUIRE_SQL = text("""
+    INSERT INTO scheduler_lock (id, owner, heartbeat_at) VALUES (1, :owner, :now)
+    ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, heartbeat_at = excluded.heartbeat_at
+    WHERE scheduler_lock.owner = excluded.owner OR scheduler_lock.heartbeat_at < :stale
+""")
+
+MARK_SQL = text("""
+    INSERT INTO scheduler_jobs (name, last_run_at, last_status, last_error, last_result, last_duration_ms,
+                                max_duration_ms, total_duration_ms, run_count)
+    VALUES (:name, :run_at, :status, :error, :result, :ms, :ms, :ms, 1)
+    ON CONFLICT(name) DO UPDATE SET
+        last_run_at = excluded.last_run_at, last_status = excluded.last_status, last_error = excluded.last_error,
+        last_result = excluded.last_result, last_duration_ms = excluded.last_duration_ms,
+        max_duration_ms = MAX(COALESCE(max_duration_ms, 0), excluded.last_duration_ms),
+        total_duration_ms = COALESCE(total_duration_ms, 0) + excluded.last_duration_ms,
+        run_count = COALESCE(run_count, 0) + 1
+""")
+
+
+class Scheduler:
+    """Цикл планировщика: блокировка экземпляра, выбор задач по отметкам, запуск и запись длительности."""
+
+    def __init__(self, jobs: list[Job]):
+        self.jobs = jobs
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.running: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="prospel-scheduler")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.is_leader:
+            async with AsyncSessionLocal() as db:
+                await db.execute(text("DELETE FROM scheduler_lock WHERE owner = :owner"), {"owner": self.owner})
+                await db.commit()
+            self.is_leader = False
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception:
+                logger.exception("Такт планировщика завершился ошибкой")
+            await asyncio.sleep(settings.scheduler_tick_seconds)
+
+    async def _acquire(self, now: datetime) -> bool:
+        """Взять или продлить блокировку экземпляра (аренда истекает без продления)."""
+        stale = now - timedelta(seconds=settings.scheduler_lock_ttl_seconds)
+        async with AsyncSessionLocal() as db:
+            await db.execute(ACQUIRE_SQL, {"owner": self.owner, "now": now, "stale": stale})
+            owner = (await db.execute(text("SELECT owner FROM scheduler_lock WHERE id = 1"))).scalar()
+            await db.commit()
+        self.is_leader = owner == self.owner
+        return self.is_leader
+
+    async def _markers(self) -> dict[str, SchedulerJob]:
+        async with ReadSessionLocal() as db:
+            r = await db.execute(select(SchedulerJob))
+            return {m.name: m for m in r.scalars().all()}
+
+    async def tick(self, now: Optional[datetime] = None) -> list[str]:
+        """Один такт: при владении блокировкой выполнить задачи, срок которых наступил. Возвращает их имена."""
+        now = now or datetime.now()
+        if not await self._acquire(now):
+            return []
+        markers = await self._markers()
+        ran = []
+        for job in self.jobs:
+            marker = markers.get(job.name)
+            due = job.next_run(marker.last_run_at if marker else None)
+            if due is None or due <= now:
+                await self.run_job(job, now)
+                ran.append(job.name)
+        return ran
+
+    async def run_job(self, job: Job, now: datetime) -> dict:
+        """Выполнить задачу в транзакции писателя и записать отметку (успех или ошибка)."""
+        self.running = job.name
+        t0 = time.perf_counter()
+        status, error, result = "ok", None, {}
+        try:
+            async with AsyncSessionLocal() as db:
+                try:
+                    result = await db.run_sync(lambda session: job.run(session.connection(), now))
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+        except Exception as e:
+            logger.exception("Задача планировщика %s завершилась ошибкой", job.name)
+            status, error = "error", str(e)
+        finally:
+            self.running = None
+        ms = round((time.perf_counter() - t0) * 1000, 3)
+        async with AsyncSessionLocal() as db:
+            await db.execute(MARK_SQL, {
+                "name": job.name, "run_at": now, "status": status, "error": error,
+                "result": json.dumps(result), "ms": ms,
+            })
+            await db.commit()
+        if status == "ok" and any(result.values()):
+            # Изменения прямым SQL мимо ORM — кэш отчётов по версии данных сбрасывается явно
+            finance_cache.bump_version()
+        return result
+
+    async def status(self, now: Optional[datetime] = None) -> dict:
+        """Состояние для GET /scheduler/status: блокировка, задачи, длительности, следующий запуск."""
+        now = now or datetime.now()
+        markers = await self._markers()
+        async with ReadSessionLocal() as db:
+            lock = (await db.execute(select(SchedulerLock).where(SchedulerLock.id == 1))).scalar_one_or_none()
+        jobs = []
+        for job in self.jobs:
+            m = markers.get(job.name)
+            next_run = job.next_run(m.last_run_at if m else None)
+            jobs.append({
+                "name": job.name,
+                "schedule": job.schedule,
+                "running": self.running == job.name,
+                "last_run_at": m.last_run_at.isoformat() if m and m.last_run_at else None,
+                "last_status": m.last_status if m else None,
+                "last_error": m.last_error if m else None,
+                "last_result": json.loads(m.last_result) if m and m.last_result else None,
+                "last_duration_ms": m.last_duration_ms if m else None,
+                "avg_duration_ms": round(m.total_duration_ms / m.run_count, 3) if m and m.run_count else None,
+                "max_duration_ms": m.max_duration_ms if m else None,
+                "run_count": m.run_count if m else 0,
+                "next_run_at": max(next_run, now).isoformat() if next_run else now.isoformat(),
+            })
+        return {
+            "enabled": settings.scheduler_enabled,
+            "instance": self.owner,
+            "is_leader": self.is_leader,
+            "lock": {
+                "owner": lock.owner,
+                "heartbeat_at": lock.heartbeat_at.isoformat(),
+            } if lock else None,
+            "jobs": jobs,
+        }
+
+
+scheduler = Scheduler(JOBS)
@@ -278,6 +278,7 @@ class ContractBase(BaseModel):
 
 
 class ContractCreate(ContractBase):
+    number: Optional[str] = None  # пусто — следующий YYYY-NNNN по году даты договора
     items: Optional[list[ContractItemCreate]] = None
 
 
@@ -425,12 +426,15 @@ class IPSQRData(BaseModel):
     """Данные для IPS QR (NBS)."""
     payer: str
     recipient: str
-    account: str
+    account: str  # Счёт получателя как в решении
     amount: float
     currency: str
     purpose: str
     model: str
     reference: str
+    payment_code: Optional[str] = None
+    payload: Optional[str] = None  # Строка IPS QR (K:PR|V:01|…) для рендера на клиенте
+    account_formatted: Optional[str] = None  # Тот же счёт в виде NNN-NNNNNNNNNNNNN-NN (как в пакете поручений)
 
 
 # --- ContributionRates ---
@@ -498,6 +502,25 @@ class IncomeLimitStatus(BaseModel):
     exceeded_8m: bool
 
 
+class IncomeLimitPoint(BaseModel):
+    """Доход на день: скользящие 12 месяцев (лимит 8 млн) и с начала года (лимит 6 млн)."""
+    date: DateType
+    income_12m: float
+    year_income: float
+    percent_8m: float
+    percent_6m: float
+
+
+class IncomeLimitSeries(BaseModel):
+    date_from: DateType
+    date_to: DateType
+    limit_6m: int
+    limit_8m: int
+    points: list[IncomeLimitPoint]
+    peak_8m: IncomeLimitPoint  # день максимума скользящих 12 месяцев
+    peak_6m: IncomeLimitPoint  # день максимума дохода с начала года
+
+
 class UpcomingObligationItem(BaseModel):
     """Неоплаченное обязательство для предупреждения на дашборде."""
     id: int
@@ -647,3 +670,19 @@ class PlannedExpenseMarkPaid(BaseModel):
 class PlannedExpenseUnmarkPaid(BaseModel):
     planned_expense_id: int
     due_date: DateType
+
+
+class PeriodCloseRequest(BaseModel):
+    year: int = Field(..., ge=2000, le=2100)
+    month: int = Field(..., ge=1, le=12)
+
+
+class PeriodClosureResponse(BaseModel):
+    id: int
+    year: int
+    month: int
+    closed_at: datetime
+    closed_by_user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
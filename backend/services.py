@@ -1,10 +1,10 @@
 """Бизнес-логика ProspEl."""
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from typing import Optional
 from sqlalchemy import select, func, and_, text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from backend.models import Income, Client, Payment, ContributionRates, Enterprise
+from backend.models import Income, Client, Payment, ContributionRates, Enterprise, DailyLedgerRollup
 from backend.config import get_settings
 
 settings = get_settings()
@@ -17,22 +17,13 @@ async def get_income_total(
     start_date: Optional[date] = None,
     end_date: Optional[date] = None
 ) -> float:
-    """Сумма доходов за период."""
-    from datetime import date as date_type
-    import calendar
-
-    q = select(func.coalesce(func.sum(Income.amount_rsd), 0)).select_from(Income)
+    """Сумма доходов за период без аннулированных счетов (как revenue_accrual свода)."""
+    q = select(func.coalesce(func.sum(Income.amount_rsd), 0)).select_from(Income).where(Income.status != "cancelled")
+    # Год/месяц — по ключам периодов (индекс issued_year, issued_month, ...)
     if year and month:
-        last_day = calendar.monthrange(year, month)[1]
-        q = q.where(
-            Income.issued_date >= date_type(year, month, 1),
-            Income.issued_date <= date_type(year, month, last_day)
-        )
+        q = q.where(Income.issued_year == year, Income.issued_month == year * 100 + month)
     elif year:
-        q = q.where(
-            Income.issued_date >= date_type(year, 1, 1),
-            Income.issued_date <= date_type(year, 12, 31)
-        )
+        q = q.where(Income.issued_year == year)
     if start_date:
         q = q.where(Income.issued_date >= start_date)
     if end_date:
@@ -41,6 +32,20 @@ async def get_income_total(
     return float(result.scalar() or 0)
 
 
+async def get_expense_total(db: AsyncSession, start_date: date, end_date: date) -> float:
+    """
+    Сумма расходов по дате расхода за период: сторно уже учтено (effective_amount),
+    читается дневной свод — стоимость не зависит от числа записей и сторно.
+    """
+    r = await db.execute(
+        select(func.coalesce(func.sum(DailyLedgerRollup.expense_accrual), 0)).where(
+            DailyLedgerRollup.day >= start_date,
+            DailyLedgerRollup.day <= end_date,
+        )
+    )
+    return float(r.scalar() or 0)
+
+
 async def get_income_total_12_months(db: AsyncSession, as_of: date) -> float:
     """Доход за последние 12 месяцев (для лимита 8 млн)."""
     from dateutil.relativedelta import relativedelta
@@ -58,41 +63,149 @@ def _invoice_year_from_record(i: Income) -> Optional[int]:
     return None
 
 
-def get_next_invoice_number(db_incomes: list[Income], year: int) -> str:
-    """Следующий номер счёта за год (формат YYYY-NNNN). NNNN сбрасывается на 0001 в новом году."""
-    nums = []
-    for i in db_incomes:
-        if not i.invoice_number:
-            continue
-        if _invoice_year_from_record(i) != year:
-            continue
-        s = str(i.invoice_number).strip()
-        if "-" in s:
-            parts = s.split("-", 1)
-            if len(parts) == 2 and parts[1].isdigit():
-                nums.append(int(parts[1]))
-        elif s.isdigit():
-            nums.append(int(s))
-    next_num = max(nums, default=0) + 1
-    return f"{year}-{next_num:04d}"
+def sequence_number(number: Optional[str]) -> Optional[int]:
+    """Порядковый номер NNNN из номера YYYY-NNNN (или номера из одних цифр); иначе None."""
+    s = (number or "").strip()
+    if "-" in s:
+        parts = s.split("-", 1)
+        if len(parts) == 2 and parts[1].isdigit():
+            return int(parts[1])
+        return None
+    return int(s) if s.isdigit() else None
 
 
-async def allocate_next_invoice_number(db: AsyncSession, year: int) -> int:
-    """Атомарно выделить следующий порядковый номер счёта за год (блокировка конкуренции)."""
+# Счётчики номеров по годам: таблица -> формат номера YYYY-NNNN
+SEQUENCE_TABLES = ("invoice_sequence", "contract_sequence")
+
+
+async def _reserve_sequence_block(db: AsyncSession, table: str, year: int, count: int) -> range:
+    """Атомарно сдвинуть счётчик года на count одним оператором (INSERT … ON CONFLICT … RETURNING)."""
+    assert table in SEQUENCE_TABLES and count > 0
     r = await db.execute(
-        text("""
-            INSERT INTO invoice_sequence (year, last_number) VALUES (:y, 1)
-            ON CONFLICT(year) DO UPDATE SET last_number = last_number + 1
+        text(f"""
+            INSERT INTO {table} (year, last_number) VALUES (:y, :n)
+            ON CONFLICT(year) DO UPDATE SET last_number = last_number + :n
             RETURNING last_number
         """),
-        {"y": year},
+        {"y": year, "n": count},
     )
     row = r.fetchone()
-    if row is not None:
-        return int(row[0])
-    r2 = await db.execute(text("SELECT last_number FROM invoice_sequence WHERE year = :y"), {"y": year})
-    row2 = r2.fetchone()
-    return int(row2[0]) if row2 else 1
+    if row is None:
+        r2 = await db.execute(text(f"SELECT last_number FROM {table} WHERE year = :y"), {"y": year})
+        row = r2.fetchone()
+    last = int(row[0]) if row else count
+    return range(last - count + 1, last + 1)
+
+
+async def _allocate_sequence(db: AsyncSession, table: str, year: int) -> int:
+    """Атомарно увеличить счётчик года и вернуть новый номер."""
+    return (await _reserve_sequence_block(db, table, year, 1))[0]
+
+
+async def peek_next_sequence_number(db: AsyncSession, table: str, year: int) -> str:
+    """Следующий номер YYYY-NNNN без выделения: одно чтение счётчика по ключу года."""
+    assert table in SEQUENCE_TABLES
+    r = await db.execute(text(f"SELECT last_number FROM {table} WHERE year = :y"), {"y": year})
+    return f"{year}-{int(r.scalar() or 0) + 1:04d}"
+
+
+async def advance_sequence(db: AsyncSession, table: str, year: Optional[int], number: Optional[str]) -> None:
+    """Номер введён вручную: поднять счётчик года до его NNNN, чтобы автонумерация не выдала дубль."""
+    assert table in SEQUENCE_TABLES
+    n = sequence_number(number)
+    if year is None or n is None:
+        return
+    await db.execute(
+        text(f"""
+            INSERT INTO {table} (year, last_number) VALUES (:y, :n)
+            ON CONFLICT(year) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+        """),
+        {"y": year, "n": n},
+    )
+
+
+async def allocate_next_invoice_number(db: AsyncSession, year: int) -> int:
+    """Атомарно выделить следующий порядковый номер счёта за год (блокировка конкуренции)."""
+    return await _allocate_sequence(db, "invoice_sequence", year)
+
+
+async def reserve_invoice_numbers(db: AsyncSession, year: int, count: int) -> range:
+    """
+    Зарезервировать непрерывный блок из count номеров счетов года одним запросом к счётчику
+    (пакетный выпуск, импорт выписки). Возвращает диапазон NNNN; неиспользованные номера блока
+    остаются пропусками (invoice_number_gaps).
+    """
+    return await _reserve_sequence_block(db, "invoice_sequence", year, count)
+
+
+async def invoice_number_gaps(db: AsyncSession, year: int) -> dict:
+    """Пропуски нумерации счетов года: NNNN из 1..last_number счётчика, которых нет среди счетов."""
+    r = await db.execute(text("SELECT last_number FROM invoice_sequence WHERE year = :y"), {"y": year})
+    last = int(r.scalar() or 0)
+    r = await db.execute(
+        select(Income.invoice_number).where(
+            Income.invoice_number.is_not(None),
+            (Income.invoice_year == year)
+            | (Income.invoice_year.is_(None) & Income.invoice_number.like(f"{year}-%")),
+        )
+    )
+    used = {n for n in (sequence_number(v) for v in r.scalars()) if n is not None}
+    gaps = []
+    start = None
+    for n in range(1, last + 2):
+        if n <= last and n not in used:
+            start = n if start is None else start
+        elif start is not None:
+            gaps.append({"from": f"{year}-{start:04d}", "to": f"{year}-{n - 1:04d}", "count": n - start})
+            start = None
+    return {
+        "year": year,
+        "last_number": last,
+        "issued": len(used),
+        "missing": sum(g["count"] for g in gaps),
+        "gaps": gaps,
+    }
+
+
+async def allocate_next_contract_number(db: AsyncSession, year: int) -> int:
+    """Атомарно выделить следующий порядковый номер договора за год (YYYY-NNNN по году даты договора)."""
+    return await _allocate_sequence(db, "contract_sequence", year)
+
+
+def reconcile_number_sequences(conn) -> dict[str, int]:
+    """
+    Сверка счётчиков с уже выданными номерами (однократно, миграцией): last_number каждого года —
+    не меньше максимального NNNN среди счетов и договоров этого года. Возвращает число затронутых лет.
+    """
+    sources = {
+        "invoice_sequence": (
+            (_invoice_year_from_record(row), row.invoice_number)
+            for row in conn.execute(text(
+                "SELECT invoice_year, invoice_number FROM income WHERE invoice_number IS NOT NULL"
+            ))
+        ),
+        "contract_sequence": (
+            (int(str(row.date)[:4]) if row.date else None, row.number)
+            for row in conn.execute(text("SELECT date, number FROM contracts WHERE number IS NOT NULL"))
+        ),
+    }
+    result = {}
+    for table, pairs in sources.items():
+        last: dict[int, int] = {}
+        for year, number in pairs:
+            n = sequence_number(number)
+            if year is not None and n is not None:
+                last[year] = max(last.get(year, 0), n)
+        if last:
+            conn.execute(
+                text(f"""
+                    INSERT INTO {table} (year, last_number) VALUES (:y, :n)
+                    ON CONFLICT(year) DO UPDATE SET last_number = MAX(last_number, excluded.last_number)
+                """),
+                [{"y": y, "n": n} for y, n in last.items()],
+            )
+        result[table] = len(last)
+    return result
 
 
 async def allocate_next_project_code(db: AsyncSession) -> str:
@@ -149,6 +262,7 @@ async def create_expense_reversal(
         amount=-expense.amount,
         currency=expense.currency or "RSD",
         category=expense.category,
+        project_id=getattr(expense, "project_id", None),
         paid_date=rev_date,
         status="reversed",
         source=source,
@@ -166,7 +280,7 @@ async def create_expense_reversal(
 
 
 async def get_income_limit_status(db: AsyncSession, year: int) -> dict:
-    """Статус лимитов дохода."""
+    """Статус лимитов дохода (без аннулированных счетов — те же суммы, что в ряде и прогнозе лимитов)."""
     year_income = await get_income_total(db, year=year)
     today = date.today()
     income_12m = await get_income_total_12_months(db, today)
@@ -189,6 +303,60 @@ async def get_income_limit_status(db: AsyncSession, year: int) -> dict:
     }
 
 
+async def get_income_limit_series(db: AsyncSession, date_from: date, date_to: date) -> dict:
+    """
+    Доход за скользящие 12 месяцев (лимит 8 млн) и с начала года (лимит 6 млн) на каждый день
+    [date_from, date_to]. Окно дня d — [d − 12 месяцев, d], как в get_income_total_12_months.
+    Одна выборка дневных сумм свода (revenue_accrual — без аннулированных счетов) и линейный
+    проход по префиксным суммам; peak_8m / peak_6m — день максимального использования лимита.
+    """
+    from dateutil.relativedelta import relativedelta
+    lo = min(date_from - relativedelta(months=12), date(date_from.year, 1, 1))
+    R = DailyLedgerRollup
+    r = await db.execute(
+        select(R.day, func.sum(R.revenue_accrual)).where(R.day >= lo, R.day <= date_to).group_by(R.day)
+    )
+    daily = [0.0] * ((date_to - lo).days + 1)
+    for day, amount in r.fetchall():
+        daily[(day - lo).days] += float(amount or 0)
+    prefix = [0.0]
+    for v in daily:
+        prefix.append(prefix[-1] + v)
+
+    limit_6m = settings.income_limit_pausal
+    limit_8m = settings.income_limit_vat
+    points = []
+    peak_8m = peak_6m = None
+    d = date_from
+    while d <= date_to:
+        end = (d - lo).days + 1
+        income_12m = round(prefix[end] - prefix[(d - relativedelta(months=12) - lo).days], 2)
+        year_income = round(prefix[end] - prefix[(date(d.year, 1, 1) - lo).days], 2)
+        point = {
+            "date": d,
+            "income_12m": income_12m,
+            "year_income": year_income,
+            "percent_8m": round(income_12m / limit_8m * 100, 2) if limit_8m else 0,
+            "percent_6m": round(year_income / limit_6m * 100, 2) if limit_6m else 0,
+        }
+        points.append(point)
+        if peak_8m is None or income_12m > peak_8m["income_12m"]:
+            peak_8m = point
+        if peak_6m is None or year_income > peak_6m["year_income"]:
+            peak_6m = point
+        d += timedelta(days=1)
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "limit_6m": limit_6m,
+        "limit_8m": limit_8m,
+        "points": points,
+        "peak_8m": peak_8m,
+        "peak_6m": peak_6m,
+    }
+
+
 async def get_or_create_payment(
     db: AsyncSession,
     year: int,
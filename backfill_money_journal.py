@@ -0,0 +1,29 @@
+"""Заполнение журнала движения денег ProspEl (backfill).
+
+Сверяет money_journal с cash_transactions и оплаченными расходами: для записей без строк
+журнала добавляет их, для изменённых в обход приложения — сторно и новые строки.
+Журнал только дополняется; повторный запуск ничего не добавляет.
+Денежные меры свода и точки остатка после этого пересчитывает rebuild_aggregates.py.
+
+Запуск: python backfill_money_journal.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from backend.database import AsyncSessionLocal, init_db
+from backend.money_journal import backfill_money_journal
+
+
+async def main():
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        added = await backfill_money_journal(db)
+        await db.commit()
+    print(f"money_journal: добавлено {added} строк")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
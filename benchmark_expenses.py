@@ -0,0 +1,121 @@
+"""Замер стоимости агрегатов расходов при росте числа сторно.
+
+Создаёт временную SQLite-БД со схемой ProspEl: live расходов за 2023–2025 и для каждого
+числа пар из --reversals — столько же пар «оригинал + сторно». Для суммы расходов за 2025 год
+сравниваются:
+- status: SUM(amount) с фильтром по статусу (прежний путь finance, сторнированные оригиналы считаются);
+- pairing: пары сторно на чтении (NOT EXISTS по индексу reversal_of_id);
+- effective: SUM(effective_amount) по индексу (date, effective_amount);
+- rollup: SUM(expense_accrual) по дневному своду (дашборд, /expenses/totals, finance).
+
+Запуск: python benchmark_expenses.py [--live 20000] [--reversals 0,10000,50000,200000]
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sqlalchemy import create_engine, text
+
+from backend.database import Base
+from backend.ledger_rollup import REBUILD_SQL
+from backend.migrations import EXPENSE_EFFECTIVE_INDEXES, HOT_PATH_INDEXES
+
+QUERIES = {
+    "status": "SELECT SUM(amount) FROM expenses WHERE date >= :from AND date <= :to AND status != 'reversed'",
+    "pairing": (
+        "SELECT SUM(e.amount) FROM expenses e WHERE e.date >= :from AND e.date <= :to "
+        "AND e.reversal_of_id IS NULL "
+        "AND NOT EXISTS (SELECT 1 FROM expenses r WHERE r.reversal_of_id = e.id)"
+    ),
+    "effective": "SELECT SUM(effective_amount) FROM expenses WHERE date >= :from AND date <= :to",
+    "rollup": "SELECT SUM(expense_accrual) FROM daily_ledger_rollup WHERE day >= :from AND day <= :to",
+}
+# Для честного сравнения пары на чтении получают свой индекс
+PAIRING_INDEX = "CREATE INDEX IF NOT EXISTS ix_bench_expenses_reversal_of ON expenses (reversal_of_id)"
+PARAMS = {"from": "2025-01-01", "to": "2025-12-31"}
+START = date(2023, 1, 1)
+CATEGORIES = ("materials", "services", "other", "tax")
+
+
+def _expense(rng: random.Random, next_id: int, **extra) -> dict:
+    d = (START + timedelta(days=rng.randrange(3 * 365))).isoformat()
+    amount = float(rng.randint(100, 50000))
+    row = {
+        "id": next_id, "date": d, "paid_date": d, "description": "bench", "amount": amount,
+        "effective_amount": amount, "category": rng.choice(CATEGORIES), "status": "paid",
+        "source": "manual", "is_tax_related": 0, "reversal_of_id": None, "reversed_expense_id": None,
+    }
+    row.update(extra)
+    return row
+
+
+INSERT_SQL = text("""
+    INSERT INTO expenses (id, date, paid_date, description, amount, effective_amount, category, status,
+                          source, is_tax_related, reversal_of_id, reversed_expense_id)
+    VALUES (:id, :date, :paid_date, :description, :amount, :effective_amount, :category, :status,
+            :source, :is_tax_related, :reversal_of_id, :reversed_expense_id)
+""")
+
+
+def _fill(conn, live: int, pairs: int, rng: random.Random) -> None:
+    rows = [_expense(rng, i + 1) for i in range(live)]
+    next_id = live + 1
+    for _ in range(pairs):
+        original = _expense(rng, next_id, reversed_expense_id=next_id + 1)
+        storno = {
+            **original, "id": next_id + 1, "amount": -original["amount"], "effective_amount": -original["amount"],
+            "status": "reversed", "reversal_of_id": next_id, "reversed_expense_id": None,
+        }
+        rows.extend((original, storno))
+        next_id += 2
+    conn.execute(INSERT_SQL, rows)
+    for sql in REBUILD_SQL:
+        conn.execute(text(sql))
+    conn.execute(text("ANALYZE"))
+
+
+def _timed(conn, sql: str, repeat: int = 7) -> tuple[float, float]:
+    """Медиана времени (мс) и результат."""
+    times = []
+    value = 0.0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        value = conn.execute(text(sql), PARAMS).scalar() or 0.0
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--live", type=int, default=20000, help="Расходов без сторно")
+    parser.add_argument("--reversals", default="0,10000,50000,200000", help="Числа пар оригинал+сторно")
+    args = parser.parse_args()
+    counts = [int(x) for x in args.reversals.split(",") if x.strip()]
+
+    print(f"{'пар сторно':>11} | " + " | ".join(f"{name:>16}" for name in QUERIES))
+    for pairs in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/bench.db")
+            Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                for ddl in (*HOT_PATH_INDEXES, *EXPENSE_EFFECTIVE_INDEXES, PAIRING_INDEX):
+                    conn.execute(text(ddl))
+                _fill(conn, args.live, pairs, random.Random(42))
+            with engine.connect() as conn:
+                cells = []
+                for sql in QUERIES.values():
+                    ms, value = _timed(conn, sql)
+                    cells.append(f"{ms:7.2f} мс {value / 1e6:5.0f}M")
+            engine.dispose()
+        print(f"{pairs:>11} | " + " | ".join(f"{c:>16}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Применение миграций схемы ProspEl и просмотр планов горячих запросов.
+
+Запуск:
+  python migrate_db.py            — применить недостающие миграции
+  python migrate_db.py --explain  — дополнительно вывести EXPLAIN QUERY PLAN горячих запросов
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from sqlalchemy import text
+from backend.database import engine, init_db
+from backend.migrations import explain_hot_queries
+
+
+async def main(explain: bool):
+    await init_db()
+    async with engine.connect() as conn:
+        r = await conn.execute(text("SELECT version, name, applied_at FROM schema_migrations ORDER BY version"))
+        for version, name, applied_at in r.fetchall():
+            print(f"{version:>4}  {name:<40} {applied_at}")
+        if explain:
+            if engine.dialect.name != "sqlite":
+                print("EXPLAIN QUERY PLAN доступен только для SQLite.")
+                return
+            plans = await conn.run_sync(explain_hot_queries)
+            for name, lines in plans.items():
+                print(f"\n{name}")
+                for line in lines:
+                    print(f"  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции БД ProspEl")
+    parser.add_argument("--explain", action="store_true", help="EXPLAIN QUERY PLAN горячих запросов")
+    args = parser.parse_args()
+    asyncio.run(main(args.explain))
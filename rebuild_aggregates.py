@@ -0,0 +1,35 @@
+"""Пересчёт производных агрегатов ProspEl (backfill).
+
+Сверяет журнал движения денег (money_journal) с cash_transactions и expenses,
+пересоздаёт daily_ledger_rollup по income, expenses и журналу,
+затем месячные точки остатка (cash_balance_checkpoints).
+Нужен после ручных правок БД в обход приложения.
+
+Запуск: python rebuild_aggregates.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from backend.cash_checkpoints import rebuild_cash_checkpoints
+from backend.database import AsyncSessionLocal, init_db
+from backend.ledger_rollup import rebuild_daily_ledger_rollup
+from backend.money_journal import backfill_money_journal
+
+
+async def main():
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        journal = await backfill_money_journal(db)
+        rows = await rebuild_daily_ledger_rollup(db)
+        checkpoints = await rebuild_cash_checkpoints(db)
+        await db.commit()
+    print(f"money_journal: добавлено {journal} строк")
+    print(f"daily_ledger_rollup: {rows} строк")
+    print(f"cash_balance_checkpoints: {checkpoints} месяцев")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,39 @@
+"""Перенос решений и заполнение сетки обязательств ProspEl за несколько лет (backfill).
+
+Для каждого года диапазона после первого создаёт привременые решения из решений прошлого
+года (позив на број — poziv_na_broj_next) для типов платежа без решения в этом году,
+затем строит сетку обязательств 12 месяцев. Всё — одной транзакцией; повторный запуск
+ничего не добавляет. --no-clone — только сетки по существующим решениям.
+
+Запуск: python rollover_obligations.py 2022 2027 [--no-clone]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from backend.database import AsyncSessionLocal, init_db
+from backend.payments_service import ensure_payment_types, rollover_years
+
+
+async def main(year_from: int, year_to: int, clone: bool):
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        await ensure_payment_types(db)
+        report = await rollover_years(db, year_from, year_to, clone)
+        await db.commit()
+    for r in report:
+        print(f"{r['year']}: решений {r['decisions_created']}, обязательств {r['obligations_created']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("year_from", type=int)
+    parser.add_argument("year_to", type=int)
+    parser.add_argument("--no-clone", action="store_true", help="не создавать привременые решения")
+    args = parser.parse_args()
+    if args.year_from > args.year_to:
+        parser.error("year_from позже year_to")
+    asyncio.run(main(args.year_from, args.year_to, not args.no_clone))
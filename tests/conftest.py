@@ -0,0 +1,41 @@
+"""Общие фикстуры: временная БД SQLite (aiosqlite), новая для каждого теста.
+
+Переменные окружения задаются до импорта backend — движок и настройки создаются при импорте.
+Асинхронные тесты выполняются плагином anyio (pytestmark = pytest.mark.anyio).
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_TMP = Path(tempfile.mkdtemp(prefix="prospel-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{(_TMP / 'test.db').as_posix()}"
+os.environ["SCHEDULER_ENABLED"] = "false"
+os.environ["IPS_QR_CACHE_DIR"] = str(_TMP / "ips_qr_cache")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backend.database import AsyncSessionLocal, engine, get_db_path, init_db, read_engine  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    """Сессия писателя на пустой БД со всеми таблицами и миграциями; коммиты — в самом тесте."""
+    await engine.dispose()
+    await read_engine.dispose()
+    db_path = get_db_path()
+    for p in (db_path, db_path.with_name(db_path.name + "-wal"), db_path.with_name(db_path.name + "-shm")):
+        p.unlink(missing_ok=True)
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        yield session
+        await session.rollback()
+    await engine.dispose()
+    await read_engine.dispose()
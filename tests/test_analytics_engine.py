@@ -0,0 +1,110 @@
+"""Снимок колоночного движка привязан к версии данных: коммиты процесса, запись в обход приложения, прямой SQL."""
+import sqlite3
+from datetime import date
+
+import pytest
+
+from backend.analytics_engine import analytics_engine, np
+from backend.config import get_settings
+from backend.database import get_db_path
+from backend.finance_service import get_finance_summary
+from backend.ledger_rollup import REBUILD_SQL
+from backend.models import Expense, Income
+from backend.result_cache import mark_finance_change
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(np is None, reason="колоночный движок требует numpy"),
+]
+
+FROM, TO = date(2025, 1, 1), date(2025, 12, 31)
+
+
+@pytest.fixture
+async def engine_db(db, monkeypatch):
+    monkeypatch.setattr(get_settings(), "analytics_engine", True)
+    analytics_engine.reset()
+    yield db
+    analytics_engine.reset()
+
+
+async def _engine_totals(db) -> dict:
+    return (await analytics_engine.summary(db, FROM, TO, "month", "both"))["totals"]
+
+
+async def _sql_totals(db, monkeypatch) -> dict:
+    monkeypatch.setattr(get_settings(), "analytics_engine", False)
+    try:
+        return (await get_finance_summary(db, FROM, TO, "month", "both"))["totals"]
+    finally:
+        monkeypatch.setattr(get_settings(), "analytics_engine", True)
+
+
+async def test_commits_after_load_are_counted_once(engine_db, monkeypatch):
+    db = engine_db
+    db.add(Income(issued_date=date(2025, 2, 1), invoice_number="2025-0001", amount_rsd=1000))
+    await db.commit()
+    assert (await _engine_totals(db))["revenue_accrual"] == 1000
+
+    db.add_all([
+        Income(issued_date=date(2025, 3, 1), invoice_number="2025-0002", amount_rsd=500),
+        Expense(date=date(2025, 3, 2), description="Rent", amount=200, paid_date=date(2025, 3, 2)),
+    ])
+    await db.commit()
+    totals = await _engine_totals(db)
+    assert totals["revenue_accrual"] == 1500 and totals["expense_cash"] == 200
+    assert totals == await _sql_totals(db, monkeypatch)
+
+
+async def test_out_of_band_write_reloads_snapshot(engine_db):
+    db = engine_db
+    db.add(Income(issued_date=date(2025, 4, 1), invoice_number="2025-0001", amount_rsd=700))
+    await db.commit()
+    assert (await _engine_totals(db))["revenue_accrual"] == 700
+
+    # Другой процесс (rebuild_aggregates.py после ручной правки) пишет в файл БД мимо ORM и кэша отчётов
+    conn = sqlite3.connect(get_db_path())
+    conn.execute("UPDATE income SET amount_rsd = 900")
+    for sql in REBUILD_SQL:
+        conn.execute(sql)
+    conn.commit()
+    conn.close()
+    assert (await _engine_totals(db))["revenue_accrual"] == 900
+
+
+async def test_snapshot_reloads_once_per_commit(engine_db, monkeypatch):
+    db = engine_db
+    db.add(Income(issued_date=date(2025, 1, 15), invoice_number="2025-0001", amount_rsd=100))
+    await db.commit()
+    await _engine_totals(db)
+    loads = analytics_engine.loads
+
+    for n in range(2, 6):
+        db.add(Expense(date=date(2025, n, 3), description=f"E{n}", amount=10 * n, paid_date=date(2025, n, 4)))
+        await db.commit()
+        for _ in range(3):  # перетаскивание диапазона: один коммит — одна загрузка
+            await _engine_totals(db)
+        assert analytics_engine.loads == loads + n - 1
+    assert await _engine_totals(db) == await _sql_totals(db, monkeypatch)
+    assert analytics_engine.loads == loads + 4
+
+
+async def test_columns_are_daily_sums(engine_db):
+    db = engine_db
+    db.add_all([
+        Income(issued_date=date(2025, 5, 1), invoice_number="2025-0001", amount_rsd=300),
+        Income(issued_date=date(2025, 5, 1), invoice_number="2025-0002", amount_rsd=200),
+        Income(issued_date=date(1969, 12, 31), invoice_number="1969-0001", amount_rsd=7),
+    ])
+    await db.commit()
+    columns = await analytics_engine.ensure_loaded(db)
+    assert columns.days.tolist() == [-1, (date(2025, 5, 1) - date(1970, 1, 1)).days]
+    assert columns.values[:, 0].tolist() == [7, 500]
+
+
+async def test_mark_finance_change_drops_columns(engine_db):
+    db = engine_db
+    await _engine_totals(db)
+    assert analytics_engine.columns is not None
+    mark_finance_change(db.sync_session)
+    assert analytics_engine.columns is None
@@ -0,0 +1,40 @@
+"""Лимиты дохода: статус дашборда, ряд по дням и прогноз считают доход одинаково (без аннулированных счетов)."""
+from datetime import date, timedelta
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from backend.models import Income
+from backend.services import get_income_limit_series, get_income_limit_status, get_income_total
+
+pytestmark = pytest.mark.anyio
+
+
+async def _add_incomes(db, today: date) -> None:
+    db.add_all([
+        Income(issued_date=today, invoice_number="T-1", amount_rsd=1000),
+        Income(issued_date=today - timedelta(days=40), invoice_number="T-2", amount_rsd=2500),
+        Income(issued_date=today - relativedelta(months=12), invoice_number="T-3", amount_rsd=400),
+        Income(issued_date=today - timedelta(days=500), invoice_number="T-4", amount_rsd=9000),
+        Income(issued_date=today - timedelta(days=3), invoice_number="T-5", amount_rsd=7777, status="cancelled"),
+        Income(issued_date=today - timedelta(days=200), invoice_number="T-6", amount_rsd=3333, status="cancelled"),
+    ])
+    await db.commit()
+
+
+async def test_last_series_point_matches_limit_status(db):
+    today = date.today()
+    await _add_incomes(db, today)
+
+    status = await get_income_limit_status(db, today.year)
+    series = await get_income_limit_series(db, date(today.year, 1, 1), today)
+    last = series["points"][-1]
+    assert last["date"] == today
+    for key in ("income_12m", "year_income", "percent_8m", "percent_6m"):
+        assert last[key] == pytest.approx(status[key]), key
+    assert status["income_12m"] == pytest.approx(3900)
+
+
+async def test_income_total_excludes_cancelled(db):
+    await _add_incomes(db, date(2025, 6, 30))
+    assert await get_income_total(db, start_date=date(2025, 6, 1), end_date=date(2025, 6, 30)) == 1000
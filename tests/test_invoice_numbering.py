@@ -0,0 +1,80 @@
+"""Нумерация счетов: блоки номеров при импорте выписки, ручные номера и отчёт о пропусках."""
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+
+from backend.models import Income, User
+from backend.routers.bank_import_router import ApplyItem, ApplyRequest, apply_import
+from backend.services import invoice_number_gaps, peek_next_sequence_number, reserve_invoice_numbers
+
+pytestmark = pytest.mark.anyio
+
+
+def _income(ref: str, day: str, invoice_number: str | None = None) -> ApplyItem:
+    tx = {"reference": ref, "date": day, "amount": 1000, "description": "Uplata", "payer_beneficiary": "Klijent"}
+    return ApplyItem(type="income", tx=tx, invoice_number=invoice_number)
+
+
+async def _import(db, user: User, items: list[ApplyItem]) -> dict:
+    result = await apply_import(ApplyRequest(transactions=items), db=db, current_user=user)
+    await db.commit()
+    assert result["errors"] == []
+    return result
+
+
+async def _numbers(db, year: int) -> list[str]:
+    r = await db.execute(select(Income.invoice_number).where(Income.invoice_year == year).order_by(Income.id))
+    return list(r.scalars())
+
+
+@pytest.fixture
+async def user(db):
+    u = User(username="importer", password_hash="x")
+    db.add(u)
+    await db.commit()
+    return u
+
+
+async def test_manual_number_above_counter_moves_auto_numbers_past_it(db, user):
+    await _import(db, user, [
+        _income("R1", "2025-03-01"),
+        _income("R2", "2025-03-02", invoice_number="2025-0010"),
+        _income("R3", "2025-03-03"),
+        _income("R4", "2024-12-30"),
+    ])
+    assert await _numbers(db, 2025) == ["2025-0011", "2025-0010", "2025-0012"]
+    assert await _numbers(db, 2024) == ["2024-0001"]
+    assert await peek_next_sequence_number(db, "invoice_sequence", 2025) == "2025-0013"
+
+    gaps = await invoice_number_gaps(db, 2025)
+    assert gaps["last_number"] == 12 and gaps["issued"] == 3
+    assert gaps["gaps"] == [{"from": "2025-0001", "to": "2025-0009", "count": 9}]
+
+
+async def test_consecutive_imports_are_contiguous_without_duplicates(db, user):
+    await _import(db, user, [_income(f"A{i}", f"2025-05-0{i}") for i in range(1, 4)])
+    await _import(db, user, [_income(f"B{i}", f"2025-05-1{i}") for i in range(1, 3)])
+
+    numbers = await _numbers(db, 2025)
+    assert numbers == [f"2025-{n:04d}" for n in range(1, 6)]
+    gaps = await invoice_number_gaps(db, 2025)
+    assert gaps["missing"] == 0 and gaps["gaps"] == []
+
+
+async def test_abandoned_reservation_is_reported_as_gap(db, user):
+    await _import(db, user, [_income("C1", "2025-07-01")])
+    block = await reserve_invoice_numbers(db, 2025, 3)  # выпуск прерван: номера выданы, счетов нет
+    await db.commit()
+    assert list(block) == [2, 3, 4]
+
+    await _import(db, user, [_income("C2", "2025-07-02")])
+    assert await _numbers(db, 2025) == ["2025-0001", "2025-0005"]
+    gaps = await invoice_number_gaps(db, 2025)
+    assert gaps == {
+        "year": 2025,
+        "last_number": 5,
+        "issued": 2,
+        "missing": 3,
+        "gaps": [{"from": "2025-0002", "to": "2025-0004", "count": 3}],
+    }
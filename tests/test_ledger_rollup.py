@@ -0,0 +1,120 @@
+"""Инкрементальный свод (before_flush) совпадает с полным пересчётом REBUILD_SQL после любых правок."""
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from backend.database import engine
+from backend.ledger_rollup import MEASURES, REBUILD_SQL
+from backend.models import CashTransaction, Client, Expense, Income, Project
+from backend.services import create_expense_reversal
+
+pytestmark = pytest.mark.anyio
+
+ROLLUP_SQL = text(f"""
+    SELECT day, client_id, project_id, contract_id, category, is_tax_related, {", ".join(MEASURES)}
+    FROM daily_ledger_rollup
+""")
+
+
+async def _rollup(conn) -> dict:
+    """Строки свода с ненулевыми мерами: ключ -> меры с точностью до копейки."""
+    rows = {}
+    for row in (await conn.execute(ROLLUP_SQL)).all():
+        measures = tuple(round(float(v or 0), 2) for v in row[6:])
+        if any(measures):
+            key = (str(row[0])[:10], row[1], row[2], row[3], row[4] or "", bool(row[5]))
+            rows[key] = measures
+    return rows
+
+
+async def assert_rollup_matches_rebuild(db) -> None:
+    """
+    Закоммитить сессию и сравнить свод с результатом REBUILD_SQL. Пересчёт — в отдельном
+    подключении с откатом: объекты сессии не истекают, тест правит их как обработчик запроса.
+    """
+    await db.commit()
+    async with engine.connect() as conn:
+        incremental = await _rollup(conn)
+        for sql in REBUILD_SQL:
+            await conn.execute(text(sql))
+        rebuilt = await _rollup(conn)
+        await conn.rollback()
+    assert incremental == rebuilt
+
+
+async def test_income_and_cash_changes_match_rebuild(db):
+    c1, c2 = Client(name="A"), Client(name="B")
+    project = Project(name="P")
+    db.add_all([c1, c2, project])
+    await db.flush()
+
+    inc = Income(issued_date=date(2025, 3, 10), invoice_number="2025-0001", client_id=c1.id,
+                 amount_rsd=1000, project_id=project.id)
+    other = Income(issued_date=date(2025, 3, 12), invoice_number="2025-0002", client_id=c2.id, amount_rsd=250)
+    db.add_all([inc, other])
+    await db.flush()
+    ct = CashTransaction(type="income", source="invoice", reference_id=inc.id, amount=600, date=date(2025, 4, 2))
+    db.add(ct)
+    await assert_rollup_matches_rebuild(db)
+
+    # Сумма, дата и клиент счёта: поступление переезжает вместе с измерениями счёта
+    inc.amount_rsd = 1200
+    inc.issued_date = date(2025, 3, 11)
+    inc.client_id = c2.id
+    ct.amount = 1200
+    await assert_rollup_matches_rebuild(db)
+
+    ct.date = date(2025, 5, 1)
+    other.status = "cancelled"
+    await assert_rollup_matches_rebuild(db)
+
+    other.status = "issued"
+    await db.delete(ct)
+    await assert_rollup_matches_rebuild(db)
+
+    await db.delete(inc)
+    await assert_rollup_matches_rebuild(db)
+
+
+async def test_expense_changes_and_reversals_match_rebuild(db):
+    paid = Expense(date=date(2025, 2, 3), description="Hosting", amount=300, category="services",
+                   paid_date=date(2025, 2, 5))
+    tax = Expense(date=date(2025, 2, 10), description="Porez", amount=5000, category="tax",
+                  is_tax_related=True, paid_date=date(2025, 2, 15))
+    unpaid = Expense(date=date(2025, 3, 1), description="Planned", amount=80, status="planned")
+    db.add_all([paid, tax, unpaid])
+    await assert_rollup_matches_rebuild(db)
+
+    paid.amount = 350
+    paid.paid_date = date(2025, 3, 1)
+    paid.category = "other"
+    unpaid.paid_date = date(2025, 3, 4)
+    unpaid.status = "paid"
+    await assert_rollup_matches_rebuild(db)
+
+    await create_expense_reversal(db, tax, reverse_date=date(2025, 4, 1), comment="ошибка")
+    await assert_rollup_matches_rebuild(db)
+
+    # Аннулированная запись без сторно выпадает из свода
+    unpaid.status = "reversed"
+    await assert_rollup_matches_rebuild(db)
+
+    tax.is_tax_related = False
+    await db.delete(paid)
+    await assert_rollup_matches_rebuild(db)
+
+
+async def test_changes_to_expired_objects_match_rebuild(db):
+    """Старые значения не загружены (объект истёк после expire/rollback) — вклад берётся из БД."""
+    inc = Income(issued_date=date(2025, 6, 2), invoice_number="2025-0003", amount_rsd=700)
+    exp = Expense(date=date(2025, 6, 3), description="Rent", amount=300, paid_date=date(2025, 6, 4))
+    gone = Expense(date=date(2025, 6, 5), description="Phone", amount=40, paid_date=date(2025, 6, 5))
+    db.add_all([inc, exp, gone])
+    await assert_rollup_matches_rebuild(db)
+
+    db.expire_all()
+    inc.amount_rsd = 900
+    exp.amount = 320
+    await db.delete(gone)
+    await assert_rollup_matches_rebuild(db)
@@ -0,0 +1,98 @@
+"""Прогноз превышения лимитов (Монте-Карло): воспроизводимость, очевидные случаи, текущий доход и кэш по версии."""
+from datetime import date, timedelta
+
+import pytest
+
+from backend.config import get_settings
+from backend.limit_forecast import get_income_limit_forecast, np
+from backend.models import Client, Income
+from backend.result_cache import finance_cache
+from backend.routers.dashboard_router import get_income_limits_forecast
+from backend.services import get_income_limit_status
+
+pytestmark = [
+    pytest.mark.anyio,
+    pytest.mark.skipif(np is None, reason="прогноз лимитов требует numpy"),
+]
+
+AS_OF = date(2025, 3, 31)
+
+
+async def _daily_income(db, end: date, days: int, amount: float, clients: int = 1) -> None:
+    """Доход каждый день за days дней по end включительно, поровну между clients клиентами."""
+    cs = [Client(name=f"C{i}") for i in range(clients)]
+    db.add_all(cs)
+    await db.flush()
+    db.add_all([
+        Income(issued_date=end - timedelta(days=n), invoice_number=f"F-{n}-{i}",
+               client_id=c.id, amount_rsd=amount / clients)
+        for n in range(days) for i, c in enumerate(cs)
+    ])
+    await db.commit()
+
+
+async def test_constant_history_gives_certain_outcomes(db, monkeypatch):
+    await _daily_income(db, AS_OF, 365, 10_000)
+    settings = get_settings()
+    # С 1 января 90 дней × 10 000 = 900 000; до конца года ещё 275 дней по 10 000
+    monkeypatch.setattr(settings, "income_limit_pausal", 2_000_000)
+    monkeypatch.setattr(settings, "income_limit_vat", 8_000_000)
+    r = await get_income_limit_forecast(db, paths=200, method="client", today=AS_OF)
+
+    assert r["limit_6m"]["current"] == 900_000 and not r["limit_6m"]["already_exceeded"]
+    assert r["limit_6m"]["probability"] == 1.0
+    # 900 000 + 10 000 × 111 > 2 000 000 — на 111-й день после AS_OF
+    assert r["limit_6m"]["date_p50"] == (AS_OF + timedelta(days=111)).isoformat()
+    assert r["limit_6m"]["total_p50"] == pytest.approx(3_650_000)
+    assert r["limit_8m"]["probability"] == 0.0 and r["limit_8m"]["expected_date"] is None
+
+
+async def test_seeded_forecast_is_reproducible(db, monkeypatch):
+    rng = np.random.default_rng(7)
+    cs = [Client(name=f"C{i}") for i in range(3)]
+    db.add_all(cs)
+    await db.flush()
+    db.add_all([
+        Income(issued_date=AS_OF - timedelta(days=int(n)), invoice_number=f"R-{k}",
+               client_id=cs[k % 3].id, amount_rsd=float(rng.integers(5_000, 60_000)))
+        for k, n in enumerate(rng.integers(0, 365, size=150))
+    ])
+    await db.commit()
+    # Лимит — медиана дохода года на 31 декабря: превышение примерно в половине путей
+    median = (await get_income_limit_forecast(db, paths=500, today=AS_OF))["limit_6m"]["total_p50"]
+    monkeypatch.setattr(get_settings(), "income_limit_pausal", median)
+
+    first = await get_income_limit_forecast(db, paths=500, method="client", today=AS_OF, seed=11)
+    again = await get_income_limit_forecast(db, paths=500, method="client", today=AS_OF, seed=11)
+    other = await get_income_limit_forecast(db, paths=500, method="client", today=AS_OF, seed=12)
+    assert first == again
+    assert other != first
+    assert 0.3 < first["limit_6m"]["probability"] < 0.7
+
+
+async def test_current_matches_limit_status(db):
+    today = date.today()
+    await _daily_income(db, today, 30, 50_000, clients=2)
+    db.add(Income(issued_date=today - timedelta(days=5), invoice_number="X-1", amount_rsd=999_999, status="cancelled"))
+    await db.commit()
+
+    status = await get_income_limit_status(db, today.year)
+    r = await get_income_limit_forecast(db, paths=100, today=today)
+    assert r["limit_6m"]["current"] == pytest.approx(status["year_income"])
+    assert r["limit_8m"]["current"] == pytest.approx(status["income_12m"])
+    assert r["limit_6m"]["already_exceeded"] == status["exceeded_6m"]
+    assert r["limit_8m"]["already_exceeded"] == status["exceeded_8m"]
+
+
+async def test_endpoint_caches_per_data_version(db):
+    await _daily_income(db, date.today(), 10, 1_000)
+    finance_cache.bump_version()
+
+    first = await get_income_limits_forecast(paths=100, method="total", db=db, current_user=None)
+    assert await get_income_limits_forecast(paths=100, method="total", db=db, current_user=None) is first
+
+    db.add(Income(issued_date=date.today(), invoice_number="N-1", amount_rsd=5_000))
+    await db.commit()
+    fresh = await get_income_limits_forecast(paths=100, method="total", db=db, current_user=None)
+    assert fresh is not first
+    assert fresh["history"]["total"] == first["history"]["total"] + 5_000
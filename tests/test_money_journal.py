@@ -0,0 +1,117 @@
+"""Журнал движения денег, который ведёт ORM (after_flush), и точки остатка против пересчёта с нуля."""
+from collections import Counter
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from backend.cash_checkpoints import get_cumulative_cash_flow, rebuild_cash_checkpoints_sync
+from backend.database import engine
+from backend.models import CashTransaction, Client, Expense, Income
+from backend.money_journal import backfill_money_journal, sync_money_journal
+from backend.services import create_expense_reversal
+
+pytestmark = pytest.mark.anyio
+
+NET_SQL = text("""
+    SELECT reference_type, reference_id, entry_date, direction, source,
+           client_id, project_id, contract_id, category, is_tax_related, ROUND(SUM(amount), 2)
+    FROM money_journal
+    GROUP BY reference_type, reference_id, entry_date, direction, source,
+             client_id, project_id, contract_id, category, is_tax_related
+    HAVING ABS(SUM(amount)) > 0.005
+""")
+
+# Денежные меры свода (инкрементально — из Income/Expense/CashTransaction) и журнала по дням
+CASH_BY_DAY_SQL = text("""
+    SELECT day, ROUND(SUM(rc), 2), ROUND(SUM(ec), 2), ROUND(SUM(tc), 2) FROM (
+        SELECT day, revenue_cash AS rc, expense_cash AS ec, taxes_cash AS tc FROM daily_ledger_rollup
+        UNION ALL
+        SELECT entry_date,
+               -CASE WHEN direction = 'in' THEN amount ELSE 0 END,
+               CASE WHEN direction = 'out' THEN amount ELSE 0 END,
+               CASE WHEN direction = 'out' AND is_tax_related THEN amount ELSE 0 END
+        FROM money_journal
+    )
+    GROUP BY day
+    HAVING ABS(SUM(rc)) > 0.005 OR ABS(SUM(ec)) > 0.005 OR ABS(SUM(tc)) > 0.005
+""")
+
+CHECKPOINTS_SQL = text("SELECT month_start, inflow, outflow, cumulative_net FROM cash_balance_checkpoints ORDER BY month_start")
+
+
+async def _net(conn) -> Counter:
+    """Сальдо журнала по записи-источнику и измерениям (сторно гасят исходные строки)."""
+    return Counter({tuple(str(v) for v in row[:-1]): float(row[-1]) for row in (await conn.execute(NET_SQL)).all()})
+
+
+async def _make_history(db) -> None:
+    """Поступления и расходы в прошлых месяцах, затем правки задним числом, сторно и удаления."""
+    a, b = Client(name="A"), Client(name="B")
+    db.add_all([a, b])
+    await db.flush()
+    inc = Income(issued_date=date(2025, 1, 10), invoice_number="2025-0001", client_id=a.id, amount_rsd=1000)
+    db.add(inc)
+    await db.flush()
+    ct1 = CashTransaction(type="income", source="invoice", reference_id=inc.id, amount=400, date=date(2025, 1, 20))
+    ct2 = CashTransaction(type="income", source="invoice", reference_id=inc.id, amount=600, date=date(2025, 3, 5))
+    rent = Expense(date=date(2025, 1, 5), description="Rent", amount=300, paid_date=date(2025, 1, 6))
+    tax = Expense(date=date(2025, 2, 10), description="Porez", amount=5000, category="tax",
+                  is_tax_related=True, paid_date=date(2025, 2, 15))
+    phone = Expense(date=date(2025, 4, 1), description="Phone", amount=40, paid_date=date(2025, 4, 2))
+    db.add_all([ct1, ct2, rent, tax, phone])
+    await db.commit()
+
+    # Правки прошлых месяцев: сумма и дата поступления, клиент счёта, дата оплаты расхода
+    ct1.amount = 450
+    ct2.date = date(2025, 2, 25)
+    inc.client_id = b.id
+    rent.paid_date = date(2025, 3, 1)
+    await db.commit()
+
+    await create_expense_reversal(db, tax, reverse_date=date(2025, 3, 10))
+    await db.delete(phone)
+    await db.commit()
+
+
+async def test_orm_journal_matches_backfill(db):
+    await _make_history(db)
+
+    # Сверка всего журнала ничего не добавляет: ORM уже привёл его к источникам
+    assert await backfill_money_journal(db) == 0
+    await db.rollback()
+
+    # Журнал, построенный backfill'ом с нуля, даёт те же сальдо, что и журнал ORM
+    async with engine.connect() as conn:
+        kept = await _net(conn)
+        await conn.execute(text("DELETE FROM money_journal"))
+        await conn.run_sync(sync_money_journal)
+        rebuilt = await _net(conn)
+        await conn.rollback()
+    assert kept == rebuilt
+    assert kept
+
+
+async def test_rollup_cash_measures_match_journal(db):
+    """Свод берёт денежные меры из записей, пересчёт — из журнала: по дням они должны совпадать."""
+    await _make_history(db)
+    assert (await db.execute(CASH_BY_DAY_SQL)).all() == []
+
+
+async def test_checkpoint_balance_matches_journal_sum(db):
+    await _make_history(db)
+
+    async with engine.connect() as conn:
+        kept = (await conn.execute(CHECKPOINTS_SQL)).all()
+        await conn.run_sync(rebuild_cash_checkpoints_sync)
+        rebuilt = (await conn.execute(CHECKPOINTS_SQL)).all()
+        await conn.rollback()
+    assert kept and [tuple(r) for r in kept] == [tuple(r) for r in rebuilt]
+
+    day = date(2024, 12, 30)
+    while day <= date(2025, 6, 3):
+        r = await db.execute(
+            text("SELECT COALESCE(SUM(amount), 0) FROM money_journal WHERE entry_date < :d"), {"d": day.isoformat()}
+        )
+        assert await get_cumulative_cash_flow(db, day) == pytest.approx(float(r.scalar()), abs=0.005), day
+        day += timedelta(days=1)
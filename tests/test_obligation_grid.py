@@ -0,0 +1,89 @@
+"""Сетка обязательств года следует за действующими решениями: деактивация и удаление решения."""
+from datetime import date
+
+import pytest
+from sqlalchemy import select, text
+
+from backend.models import PaymentType, YearDecision
+from backend.payments_service import ensure_obligation_grid, ensure_payment_types, list_obligations
+
+pytestmark = pytest.mark.anyio
+
+
+async def _decision(db, code: str, amount: float) -> YearDecision:
+    pt = (await db.execute(select(PaymentType).where(PaymentType.code == code))).scalar_one()
+    dec = YearDecision(
+        year=2026, payment_type_id=pt.id, period_start=date(2026, 1, 1), period_end=date(2026, 12, 31),
+        monthly_amount=amount, recipient_account="840-721419843-40", poziv_na_broj="97-1", payment_purpose="X",
+    )
+    db.add(dec)
+    await db.commit()
+    return dec
+
+
+async def _grid(db) -> dict[tuple[str, int], tuple[str, float]]:
+    db.expire_all()
+    return {(pt.code, ob.month): (ob.status, ob.amount) for ob, pt in await list_obligations(db, 2026)}
+
+
+@pytest.fixture
+async def types(db):
+    await ensure_payment_types(db)
+    await db.commit()
+
+
+async def test_deactivated_decision_removes_unpaid_obligations(db, types):
+    tax = await _decision(db, "tax", 100)
+    await _decision(db, "pio", 200)
+    grid = await _grid(db)
+    assert len(grid) == 24
+
+    ob = next(ob for ob, pt in await list_obligations(db, 2026) if pt.code == "tax" and ob.month == 1)
+    ob.status = "paid"
+    await db.commit()
+
+    tax.is_active = False
+    await db.commit()
+    grid = await _grid(db)
+    assert {k for k in grid if k[0] == "tax"} == {("tax", 1)}
+    assert grid[("tax", 1)] == ("paid", 100)
+    assert len([k for k in grid if k[0] == "pio"]) == 12
+
+    # Повторная активация возвращает сетку, оплаченный месяц не меняется
+    tax.is_active = True
+    tax.monthly_amount = 150
+    await db.commit()
+    grid = await _grid(db)
+    assert len([k for k in grid if k[0] == "tax"]) == 12
+    assert grid[("tax", 1)] == ("paid", 100) and grid[("tax", 2)] == ("unpaid", 150)
+
+
+async def test_deleted_decision_removes_obligations(db, types):
+    await _decision(db, "tax", 100)
+    pio = await _decision(db, "pio", 200)
+    assert len(await _grid(db)) == 24
+
+    await db.delete(pio)
+    await db.commit()
+    grid = await _grid(db)
+    assert len(grid) == 12 and all(code == "tax" for code, _ in grid)
+
+    # Удаление мимо ORM (без каскада): сетку приводит в порядок следующая синхронизация по штампу
+    await db.execute(text("DELETE FROM year_decisions WHERE year = 2026"))
+    await db.commit()
+    assert await ensure_obligation_grid(db, 2026) == 12
+    await db.commit()
+    assert await _grid(db) == {}
+
+
+async def test_inactive_decision_falls_back_to_other_active_one(db, types):
+    main = await _decision(db, "tax", 100)
+    provisional = await _decision(db, "tax", 80)
+    provisional.is_provisional = True
+    await db.commit()
+    assert {v for v in (await _grid(db)).values()} == {("unpaid", 100)}
+
+    main.is_active = False
+    await db.commit()
+    grid = await _grid(db)
+    assert len(grid) == 12 and set(grid.values()) == {("unpaid", 80)}
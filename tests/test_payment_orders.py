@@ -0,0 +1,52 @@
+"""Поручение по одному обязательству для IPS QR и пакет поручений за период."""
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from backend.models import MonthlyObligation, PaymentType, YearDecision
+from backend.payment_orders import load_obligation_order, load_payment_orders
+from backend.payments_service import ensure_obligation_grid, ensure_payment_types
+from backend.routers.obligations_router import _obligation_ips_data
+
+pytestmark = pytest.mark.anyio
+
+ACCOUNT = "840-721419843-40"
+
+
+@pytest.fixture
+async def obligations(db) -> list[MonthlyObligation]:
+    await ensure_payment_types(db)
+    pt = (await db.execute(select(PaymentType).where(PaymentType.code == "tax"))).scalar_one()
+    db.add(YearDecision(
+        year=2025, payment_type_id=pt.id, period_start=date(2025, 1, 1), period_end=date(2025, 12, 31),
+        monthly_amount=1000, recipient_account=ACCOUNT, poziv_na_broj="97-123", payment_purpose="Porez YYYY",
+    ))
+    await db.commit()
+    await ensure_obligation_grid(db, 2025)
+    await db.commit()
+    r = await db.execute(select(MonthlyObligation).where(MonthlyObligation.year == 2025).order_by(MonthlyObligation.month))
+    return list(r.scalars())
+
+
+async def test_ips_data_keeps_stored_account_and_adds_formatted(db, obligations):
+    data = await _obligation_ips_data(db, obligations[0].id)
+    assert data.account == ACCOUNT
+    assert data.account_formatted == "840-0000721419843-40"
+    assert data.payload and "R:840000072141984340" in data.payload
+
+
+async def test_single_order_ignores_status_and_missing_is_404(db, obligations):
+    paid = obligations[1]
+    paid.status = "paid"
+    await db.commit()
+
+    order = await load_obligation_order(db, paid.id)
+    assert order is not None and order["id"] == paid.id
+    assert paid.id not in {o["id"] for o in await load_payment_orders(db, date(2025, 1, 1), date(2025, 12, 1))}
+
+    assert await load_obligation_order(db, 10**6) is None
+    with pytest.raises(HTTPException) as exc:
+        await _obligation_ips_data(db, 10**6)
+    assert exc.value.status_code == 404